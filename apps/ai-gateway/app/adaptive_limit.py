@@ -0,0 +1,216 @@
+import re
+import threading
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from typing import Literal
+
+from app.config import settings
+from app.metrics import metrics
+
+OVERLOAD_STATUS_CODES = {429, 503, 529}
+
+# Generate latency covers the whole completion; stream latency is time to the response
+# headers. They are not comparable, so each kind keeps its own latency baseline.
+CallKind = Literal["generate", "stream"]
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+@dataclass(frozen=True)
+class RateLimitSnapshot:
+    remaining_requests: int | None = None
+    limit_requests: int | None = None
+    remaining_tokens: int | None = None
+    limit_tokens: int | None = None
+    reset_seconds: float | None = None
+    retry_after: float | None = None
+
+
+def _header(headers: Mapping[str, str], *names: str) -> str | None:
+    for name in names:
+        value = headers.get(name)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return None
+
+
+def _int_header(headers: Mapping[str, str], *names: str) -> int | None:
+    value = _header(headers, *names)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _reset_seconds(value: str | None, now: float) -> float | None:
+    """Parse seconds, OpenAI durations (``6m0s``, ``20ms``), Anthropic RFC 3339 reset
+    times and HTTP-date ``retry-after`` values."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(amount + unit for amount, unit in parts) == value:
+        return sum(float(amount) * _DURATION_SECONDS[unit] for amount, unit in parts)
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            reset_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if reset_at.tzinfo is None:
+        reset_at = reset_at.replace(tzinfo=UTC)
+    return max(0.0, reset_at.timestamp() - now)
+
+
+def parse_rate_limit_headers(headers: Mapping[str, str]) -> RateLimitSnapshot:
+    """Read ``retry-after`` plus OpenAI ``x-ratelimit-*`` / Anthropic ratelimit headers."""
+    now = time.time()
+    resets = [
+        _reset_seconds(_header(headers, name), now)
+        for name in (
+            "x-ratelimit-reset-requests",
+            "x-ratelimit-reset-tokens",
+            "anthropic-ratelimit-requests-reset",
+            "anthropic-ratelimit-tokens-reset",
+        )
+    ]
+    known_resets = [reset for reset in resets if reset is not None]
+    return RateLimitSnapshot(
+        remaining_requests=_int_header(
+            headers, "x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining"
+        ),
+        limit_requests=_int_header(
+            headers, "x-ratelimit-limit-requests", "anthropic-ratelimit-requests-limit"
+        ),
+        remaining_tokens=_int_header(
+            headers, "x-ratelimit-remaining-tokens", "anthropic-ratelimit-tokens-remaining"
+        ),
+        limit_tokens=_int_header(
+            headers, "x-ratelimit-limit-tokens", "anthropic-ratelimit-tokens-limit"
+        ),
+        reset_seconds=max(known_resets) if known_resets else None,
+        retry_after=_reset_seconds(_header(headers, "retry-after"), now),
+    )
+
+
+@dataclass
+class _LimitState:
+    limit: float
+    baseline_latency: dict[str, float] = field(default_factory=dict)
+    paused_until: float = 0.0
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit per (provider, model).
+
+    Successful calls with stable latency grow the limit by roughly one per window of
+    in-flight requests; 429/529s, timeouts and latency growth cut it multiplicatively.
+    Upstream rate-limit headers pause admission before the provider starts rejecting.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._states: dict[tuple[str, str], _LimitState] = {}
+
+    def current_limit(self, provider: str, model: str) -> int:
+        with self._lock:
+            return int(self._state(provider, model).limit)
+
+    def pause_remaining(self, provider: str, model: str) -> float:
+        with self._lock:
+            return max(0.0, self._state(provider, model).paused_until - time.monotonic())
+
+    def record_response(
+        self,
+        provider: str,
+        model: str,
+        *,
+        status_code: int,
+        latency_seconds: float,
+        snapshot: RateLimitSnapshot,
+        kind: CallKind = "generate",
+    ) -> None:
+        with self._lock:
+            state = self._state(provider, model)
+            if status_code in OVERLOAD_STATUS_CODES:
+                self._decrease(state, settings.adaptive_limit_backoff_ratio)
+                self._pause(state, snapshot.retry_after or snapshot.reset_seconds)
+            elif status_code < 400:
+                self._on_success(state, kind, latency_seconds)
+                self._apply_headroom(state, snapshot)
+            self._publish(provider, model, state)
+
+    def record_timeout(self, provider: str, model: str) -> None:
+        with self._lock:
+            state = self._state(provider, model)
+            self._decrease(state, settings.adaptive_limit_backoff_ratio)
+            self._publish(provider, model, state)
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                f"{provider}:{model}": int(state.limit)
+                for (provider, model), state in self._states.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._states.clear()
+
+    def _state(self, provider: str, model: str) -> _LimitState:
+        key = (provider, model)
+        state = self._states.get(key)
+        if state is None:
+            state = _LimitState(limit=float(settings.adaptive_limit_initial))
+            self._states[key] = state
+        return state
+
+    def _on_success(self, state: _LimitState, kind: CallKind, latency_seconds: float) -> None:
+        baseline = state.baseline_latency.get(kind)
+        if baseline is None:
+            state.baseline_latency[kind] = latency_seconds
+            return
+        if latency_seconds > baseline * settings.adaptive_limit_latency_tolerance:
+            # Latency growth is an early sign of upstream queueing: back off gently.
+            self._decrease(state, 0.9)
+        else:
+            state.limit = min(
+                float(settings.adaptive_limit_max), state.limit + 1.0 / max(state.limit, 1.0)
+            )
+        state.baseline_latency[kind] = 0.95 * baseline + 0.05 * latency_seconds
+
+    def _apply_headroom(self, state: _LimitState, snapshot: RateLimitSnapshot) -> None:
+        ratio = settings.adaptive_limit_throttle_remaining_ratio
+        for remaining, limit in (
+            (snapshot.remaining_requests, snapshot.limit_requests),
+            (snapshot.remaining_tokens, snapshot.limit_tokens),
+        ):
+            if remaining is None or not limit:
+                continue
+            if remaining <= 0:
+                self._pause(state, snapshot.reset_seconds)
+            if remaining / limit < ratio:
+                self._decrease(state, 0.9)
+
+    def _decrease(self, state: _LimitState, ratio: float) -> None:
+        state.limit = max(float(settings.adaptive_limit_min), state.limit * ratio)
+
+    def _pause(self, state: _LimitState, seconds: float | None) -> None:
+        if seconds:
+            state.paused_until = max(state.paused_until, time.monotonic() + seconds)
+
+    def _publish(self, provider: str, model: str, state: _LimitState) -> None:
+        metrics.set_gauge(
+            "adaptive_concurrency_limit", int(state.limit), provider=provider, model=model
+        )
+
+
+adaptive_limits = AdaptiveLimiter()
@@ -0,0 +1,274 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import defaultdict
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+from app.adaptive_limit import adaptive_limits
+from app.config import settings
+from app.metrics import metrics
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    STANDARD = 1
+    BATCH = 2
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, message: str, reason: str, retry_after: int = 1):
+        self.message = message
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    model: str = field(compare=False)
+    future: "asyncio.Future[None]" = field(compare=False)
+
+
+@dataclass
+class _ProviderGate:
+    in_use: int = 0
+    model_in_use: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    waiters: list[_Waiter] = field(default_factory=list)
+    avg_hold_seconds: float = 1.0
+
+
+class AdmissionTicket:
+    """A held upstream slot; ``release`` is idempotent."""
+
+    def __init__(
+        self,
+        controller: "AdmissionController",
+        provider: str,
+        model: str,
+        priority: Priority,
+        queue_time_ms: int,
+    ) -> None:
+        self.provider = provider
+        self.model = model
+        self.priority = priority
+        self.queue_time_ms = queue_time_ms
+        self._controller = controller
+        self._acquired_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._controller.release(self, time.monotonic() - self._acquired_at)
+
+
+def resolve_priority(
+    context: Mapping[str, object] | None, task_type: str | None, default: Priority
+) -> Priority:
+    """Pick the priority class from an explicit context flag, then task_type, then route."""
+    requested = (context or {}).get("priority")
+    if isinstance(requested, str) and requested.upper() in Priority.__members__:
+        return Priority[requested.upper()]
+    configured = settings.admission_task_type_priorities.get(task_type or "")
+    if configured and configured.upper() in Priority.__members__:
+        return Priority[configured.upper()]
+    return default
+
+
+class AdmissionController:
+    """Per-provider and per-model concurrency limits with a bounded priority wait queue.
+
+    Waiters are served in priority order (then arrival order); a waiter whose model is at
+    its limit does not block lower-priority waiters for other models of the same provider.
+    """
+
+    def __init__(self) -> None:
+        self._gates: dict[str, _ProviderGate] = {}
+        self._seq = itertools.count()
+
+    def provider_limit(self, provider: str) -> int:
+        return max(
+            1,
+            settings.admission_provider_limits.get(
+                provider, settings.admission_provider_concurrency
+            ),
+        )
+
+    def model_limit(self, provider: str, model: str) -> int:
+        limit = settings.admission_model_limits.get(
+            f"{provider}:{model}", settings.admission_model_concurrency
+        )
+        if settings.adaptive_limits_enabled:
+            limit = min(limit, adaptive_limits.current_limit(provider, model))
+        return max(1, limit)
+
+    async def acquire(
+        self,
+        provider: str,
+        model: str,
+        *,
+        priority: Priority,
+        deadline: float | None = None,
+    ) -> AdmissionTicket:
+        """Wait for an upstream slot; ``deadline`` is a ``time.monotonic()`` timestamp."""
+        gate = self._gates.setdefault(provider, _ProviderGate())
+        started = time.monotonic()
+
+        paused = (
+            adaptive_limits.pause_remaining(provider, model)
+            if settings.adaptive_limits_enabled
+            else 0.0
+        )
+        if paused > 0:
+            # Upstream told us to back off; hold off rather than spend a call on a 429.
+            if deadline is not None and started + paused > deadline:
+                raise self._reject(
+                    provider,
+                    "Upstream rate limit resets after request deadline",
+                    reason="rate_limited",
+                    retry_after=max(1, round(paused)),
+                )
+            await asyncio.sleep(paused)
+
+        if not gate.waiters and self._has_capacity(gate, provider, model):
+            self._take(gate, provider, model)
+            return self._ticket(provider, model, priority, started)
+
+        if len(gate.waiters) >= settings.admission_max_queue_depth:
+            self._preempt_or_reject(gate, provider, priority)
+
+        waiter = _Waiter(
+            int(priority), next(self._seq), model, asyncio.get_running_loop().create_future()
+        )
+        heapq.heappush(gate.waiters, waiter)
+        self._dispatch(gate, provider)
+        if not waiter.future.done() and deadline is not None:
+            ahead = sum(1 for queued in gate.waiters if queued < waiter)
+            estimated_wait = (ahead + 1) * gate.avg_hold_seconds / self.provider_limit(provider)
+            if started + estimated_wait > deadline:
+                self._discard(gate, waiter)
+                raise self._reject(
+                    provider,
+                    "Upstream capacity unavailable before request deadline",
+                    reason="deadline",
+                    retry_after=max(1, int(estimated_wait)),
+                )
+        self._record_queue(provider, gate)
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(waiter.future, timeout=timeout)
+        except BaseException as exc:
+            if waiter.future.done() and not waiter.future.cancelled():
+                if waiter.future.exception() is None:
+                    # The slot was granted as the wait ended; hand it straight back.
+                    self._give_back(gate, provider, model)
+            else:
+                self._discard(gate, waiter)
+            self._record_queue(provider, gate)
+            if isinstance(exc, TimeoutError):
+                raise self._reject(
+                    provider, "Timed out waiting for upstream capacity", reason="timeout"
+                ) from None
+            raise
+        return self._ticket(provider, model, priority, started)
+
+    def release(self, ticket: AdmissionTicket, held_seconds: float) -> None:
+        gate = self._gates.get(ticket.provider)
+        if gate is None:
+            return
+        gate.avg_hold_seconds = 0.8 * gate.avg_hold_seconds + 0.2 * held_seconds
+        self._give_back(gate, ticket.provider, ticket.model)
+
+    def snapshot(self) -> dict[str, dict[str, object]]:
+        return {
+            provider: {
+                "in_use": gate.in_use,
+                "queued": len(gate.waiters),
+                "models": dict(gate.model_in_use),
+            }
+            for provider, gate in self._gates.items()
+        }
+
+    def reset(self) -> None:
+        for gate in self._gates.values():
+            for waiter in gate.waiters:
+                if not waiter.future.done():
+                    waiter.future.cancel()
+        self._gates.clear()
+
+    def _has_capacity(self, gate: _ProviderGate, provider: str, model: str) -> bool:
+        if gate.in_use >= self.provider_limit(provider):
+            return False
+        return gate.model_in_use[model] < self.model_limit(provider, model)
+
+    def _take(self, gate: _ProviderGate, provider: str, model: str) -> None:
+        gate.in_use += 1
+        gate.model_in_use[model] += 1
+        metrics.set_gauge("admission_in_use", gate.in_use, provider=provider)
+
+    def _give_back(self, gate: _ProviderGate, provider: str, model: str) -> None:
+        gate.in_use = max(0, gate.in_use - 1)
+        gate.model_in_use[model] = max(0, gate.model_in_use[model] - 1)
+        metrics.set_gauge("admission_in_use", gate.in_use, provider=provider)
+        self._dispatch(gate, provider)
+
+    def _dispatch(self, gate: _ProviderGate, provider: str) -> None:
+        granted = False
+        for waiter in sorted(gate.waiters):
+            if gate.in_use >= self.provider_limit(provider):
+                break
+            if waiter.future.done():
+                self._discard(gate, waiter)
+                continue
+            if gate.model_in_use[waiter.model] >= self.model_limit(provider, waiter.model):
+                continue
+            self._discard(gate, waiter)
+            self._take(gate, provider, waiter.model)
+            waiter.future.set_result(None)
+            granted = True
+        if granted:
+            self._record_queue(provider, gate)
+
+    def _preempt_or_reject(self, gate: _ProviderGate, provider: str, priority: Priority) -> None:
+        lowest = max(gate.waiters)
+        if lowest.priority <= priority:
+            raise self._reject(provider, "Upstream admission queue is full", reason="queue_full")
+        # A full queue yields to more urgent work by shedding its least urgent waiter.
+        self._discard(gate, lowest)
+        lowest.future.set_exception(
+            self._reject(provider, "Preempted by higher-priority work", reason="preempted")
+        )
+
+    def _discard(self, gate: _ProviderGate, waiter: _Waiter) -> None:
+        try:
+            gate.waiters.remove(waiter)
+        except ValueError:
+            return
+        heapq.heapify(gate.waiters)
+
+    def _ticket(
+        self, provider: str, model: str, priority: Priority, started: float
+    ) -> AdmissionTicket:
+        queue_time_ms = round((time.monotonic() - started) * 1000)
+        metrics.observe(
+            "admission_queue_time_ms", queue_time_ms, provider=provider, priority=priority.name
+        )
+        return AdmissionTicket(self, provider, model, priority, queue_time_ms)
+
+    def _reject(
+        self, provider: str, message: str, *, reason: str, retry_after: int = 1
+    ) -> AdmissionRejected:
+        metrics.increment("admission_rejected_total", provider=provider, reason=reason)
+        return AdmissionRejected(message, reason=reason, retry_after=retry_after)
+
+    def _record_queue(self, provider: str, gate: _ProviderGate) -> None:
+        metrics.set_gauge("admission_queue_depth", len(gate.waiters), provider=provider)
+
+
+admission = AdmissionController()
@@ -1,16 +1,23 @@
+import functools
 import hashlib
 import hmac
 import logging
-import threading
 import time
 from dataclasses import dataclass
 
-from fastapi import HTTPException, Request
+from fastapi import HTTPException, Request, WebSocket
+from starlette.requests import HTTPConnection
 
 from app.config import settings
+from app.metrics import metrics
+from app.nonce_store import NonceCapacityError, NonceStoreUnavailable, replay_guard
+from app.request_body import BODY_DIGEST_STATE_KEY
 
 logger = logging.getLogger("ai-gateway.auth")
 
+# A WebSocket handshake is a GET without a body; its signature covers the empty body.
+_EMPTY_BODY_DIGEST = hashlib.sha256(b"").hexdigest()
+
 
 @dataclass(frozen=True)
 class ServicePrincipal:
@@ -19,52 +26,74 @@ class ServicePrincipal:
     auth_mode: str
 
 
-_NONCE_LOCK = threading.Lock()
-_RECENT_NONCES: dict[str, float] = {}
-
-
-def _token_fingerprint(secret: str) -> str:
-    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:16]
-
+@dataclass(frozen=True)
+class _SecretState:
+    key: bytes
+    fingerprint: str
+    mac: hmac.HMAC
+
+
+@functools.lru_cache(maxsize=8)
+def _secret_state(secret: str) -> _SecretState:
+    """Derive the per-secret state once; requests copy the keyed HMAC instead of rekeying."""
+    key = secret.encode("utf-8")
+    return _SecretState(
+        key=key,
+        fingerprint=hashlib.sha256(key).hexdigest()[:16],
+        mac=hmac.new(key, digestmod=hashlib.sha256),
+    )
 
-def _cleanup_expired_nonces(now: float) -> None:
-    expired = [nonce_key for nonce_key, expiry in _RECENT_NONCES.items() if expiry <= now]
-    for nonce_key in expired:
-        _RECENT_NONCES.pop(nonce_key, None)
 
+async def _body_digest(request: Request) -> str:
+    body = await request.body()
+    digest = getattr(request.state, BODY_DIGEST_STATE_KEY, None)
+    if isinstance(digest, str):
+        return digest
+    return hashlib.sha256(body).hexdigest()
 
-def _register_nonce_once(nonce_key: str) -> bool:
-    now = time.time()
-    with _NONCE_LOCK:
-        _cleanup_expired_nonces(now)
-        if nonce_key in _RECENT_NONCES:
-            return False
 
-        _RECENT_NONCES[nonce_key] = now + float(settings.service_auth_max_age_seconds)
-        return True
+async def _register_nonce_once(nonce_key: str) -> bool:
+    try:
+        return await replay_guard.claim(nonce_key, float(settings.service_auth_max_age_seconds))
+    except NonceCapacityError:
+        # Evicting a live nonce would reopen a replay window, so fail closed instead.
+        metrics.increment("auth_nonce_rejected_total", reason="capacity")
+        raise HTTPException(
+            status_code=503,
+            detail="Service authentication replay cache is full",
+            headers={"Retry-After": "1"},
+        ) from None
+    except NonceStoreUnavailable:
+        metrics.increment("auth_nonce_rejected_total", reason="unavailable")
+        raise HTTPException(
+            status_code=503,
+            detail="Service authentication replay cache is unavailable",
+            headers={"Retry-After": "1"},
+        ) from None
 
 
-def _verify_legacy_bearer(request: Request, secret: str) -> ServicePrincipal:
-    auth_header = request.headers.get("Authorization", "")
+def _verify_legacy_bearer(connection: HTTPConnection, secret: str) -> ServicePrincipal:
+    auth_header = connection.headers.get("Authorization", "")
     if not auth_header.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid authorization header")
 
+    state = _secret_state(secret)
     provided = auth_header[len("Bearer ") :]
-    if not hmac.compare_digest(provided.encode("utf-8"), secret.encode("utf-8")):
+    if not hmac.compare_digest(provided.encode("utf-8"), state.key):
         raise HTTPException(status_code=401, detail="Invalid service token")
 
     return ServicePrincipal(
-        token_fingerprint=_token_fingerprint(secret),
-        tenant_id=request.headers.get("X-Tenant-ID"),
+        token_fingerprint=state.fingerprint,
+        tenant_id=connection.headers.get("X-Tenant-ID"),
         auth_mode="bearer",
     )
 
 
-async def _verify_hmac_request(request: Request, secret: str) -> ServicePrincipal:
-    version = request.headers.get("X-Service-Auth-Version", "")
-    signature = request.headers.get("X-Service-Signature", "")
-    timestamp_header = request.headers.get("X-Service-Timestamp", "")
-    nonce = request.headers.get("X-Service-Nonce", "")
+async def _verify_hmac_request(connection: HTTPConnection, secret: str) -> ServicePrincipal:
+    version = connection.headers.get("X-Service-Auth-Version", "")
+    signature = connection.headers.get("X-Service-Signature", "")
+    timestamp_header = connection.headers.get("X-Service-Timestamp", "")
+    nonce = connection.headers.get("X-Service-Nonce", "")
 
     if version != "v1":
         raise HTTPException(status_code=401, detail="Invalid service auth version")
@@ -84,40 +113,51 @@ async def _verify_hmac_request(request: Request, secret: str) -> ServicePrincipa
     if abs(now - timestamp) > max_age:
         raise HTTPException(status_code=401, detail="Service authentication timestamp expired")
 
-    nonce_key = f"{timestamp}:{nonce}"
-    if not _register_nonce_once(nonce_key):
-        raise HTTPException(status_code=401, detail="Service authentication nonce replay detected")
-
-    body = await request.body()
-    body_digest = hashlib.sha256(body).hexdigest()
+    if isinstance(connection, Request):
+        method, body_digest = connection.method.upper(), await _body_digest(connection)
+    else:
+        method, body_digest = "GET", _EMPTY_BODY_DIGEST
     canonical = "\n".join(
         [
-            request.method.upper(),
-            request.url.path,
+            method,
+            connection.url.path,
             str(timestamp),
             nonce,
             body_digest,
         ]
     )
 
-    expected_signature = hmac.new(
-        secret.encode("utf-8"),
-        canonical.encode("utf-8"),
-        hashlib.sha256,
-    ).hexdigest()
+    state = _secret_state(secret)
+    mac = state.mac.copy()
+    mac.update(canonical.encode("utf-8"))
+    expected_signature = mac.hexdigest()
 
     if not hmac.compare_digest(signature.lower(), expected_signature):
         raise HTTPException(status_code=401, detail="Invalid service authentication signature")
 
+    # Only signed requests may claim a nonce, so unauthenticated traffic cannot fill the cache.
+    nonce_key = f"{timestamp}:{nonce}"
+    if not await _register_nonce_once(nonce_key):
+        raise HTTPException(status_code=401, detail="Service authentication nonce replay detected")
+
     return ServicePrincipal(
-        token_fingerprint=_token_fingerprint(secret),
-        tenant_id=request.headers.get("X-Tenant-ID"),
+        token_fingerprint=state.fingerprint,
+        tenant_id=connection.headers.get("X-Tenant-ID"),
         auth_mode="hmac",
     )
 
 
 async def verify_service_token(request: Request) -> ServicePrincipal:
     """Verify service-to-service authentication headers."""
+    return await _authenticate(request)
+
+
+async def verify_websocket_token(websocket: WebSocket) -> ServicePrincipal:
+    """Verify the authentication headers of a WebSocket handshake, once per connection."""
+    return await _authenticate(websocket)
+
+
+async def _authenticate(connection: HTTPConnection) -> ServicePrincipal:
     secret = settings.service_token.strip()
     if not secret:
         if settings.is_production:
@@ -126,14 +166,14 @@ async def verify_service_token(request: Request) -> ServicePrincipal:
 
         return ServicePrincipal(
             token_fingerprint="development",
-            tenant_id=request.headers.get("X-Tenant-ID"),
+            tenant_id=connection.headers.get("X-Tenant-ID"),
             auth_mode="none",
         )
 
-    if request.headers.get("X-Service-Signature"):
-        return await _verify_hmac_request(request, secret)
+    if connection.headers.get("X-Service-Signature"):
+        return await _verify_hmac_request(connection, secret)
 
     if settings.allow_legacy_bearer_auth and not settings.is_production:
-        return _verify_legacy_bearer(request, secret)
+        return _verify_legacy_bearer(connection, secret)
 
     raise HTTPException(status_code=401, detail="Missing service authentication headers")
@@ -0,0 +1,50 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+
+class _Slots:
+    __slots__ = ("limit", "semaphore", "users")
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        # Holders plus waiters; the entry is dropped when this returns to zero.
+        self.users = 0
+
+
+class KeyedSemaphore:
+    """Asyncio semaphores, one per key, sized by the caller's limit.
+
+    Keys are caller-supplied (tenant ids), so an entry only lives while a caller holds
+    or waits for one of its slots; idle keys take no memory.
+    """
+
+    def __init__(self) -> None:
+        self._slots: dict[str, _Slots] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: str, limit: int) -> AsyncIterator[None]:
+        # A changed limit only takes effect once the key is idle: swapping a busy
+        # semaphore would let new callers bypass in-flight holders.
+        slots = self._slots.get(key)
+        if slots is None:
+            slots = self._slots[key] = _Slots(max(1, limit))
+        slots.users += 1
+        try:
+            async with slots.semaphore:
+                yield
+        finally:
+            slots.users -= 1
+            if slots.users == 0 and self._slots.get(key) is slots:
+                del self._slots[key]
+
+    def in_use(self, key: str) -> int:
+        slots = self._slots.get(key)
+        return slots.users if slots is not None else 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def reset(self) -> None:
+        self._slots.clear()
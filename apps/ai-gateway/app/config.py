@@ -8,13 +8,82 @@ class Settings(BaseSettings):
     cors_origins: str = "http://localhost:3000"
     openai_api_key: str = ""
     anthropic_api_key: str = ""
+    openai_base_url: str = "https://api.openai.com/v1"
+    anthropic_base_url: str = "https://api.anthropic.com/v1"
     service_token: str = ""
     sentry_dsn: str = ""
     expose_docs: bool = False
     allow_legacy_bearer_auth: bool = True
     service_auth_max_age_seconds: int = 120
+    request_body_max_bytes: int = 256 * 1024
+    request_body_route_max_bytes: dict[str, int] = {"/v1/generate_batch": 8 * 1024 * 1024}
+    request_body_timeout_seconds: float = 30.0
     rate_limit_generate_per_minute: int = 30
     rate_limit_stream_per_minute: int = 15
+    rate_limit_batch_per_minute: int = 5
+    batch_max_items: int = 50
+    batch_concurrency_per_tenant: int = 4
+    batch_concurrency_per_provider: int = 8
+    rate_limit_jobs_per_minute: int = 30
+    rate_limit_max_keys: int = 200_000
+    rate_limit_backend: str = "memory"
+    rate_limit_shared_memory_path: str = "/dev/shm/ai-gateway-rate-limit"
+    rate_limit_redis_url: str = "redis://localhost:6379/0"
+    rate_limit_backend_timeout_seconds: float = 0.05
+    rate_limit_backend_retry_seconds: float = 5.0
+    rate_limit_fallback_workers: int = 1
+    token_budget_enabled: bool = True
+    token_budget_per_minute: int = 200_000
+    token_budget_per_day: int = 0
+    token_budget_tenant_per_minute: dict[str, int] = {}
+    token_budget_tenant_per_day: dict[str, int] = {}
+    token_estimate_chars_per_token: float = 4.0
+    state_sweep_interval_seconds: float = 30.0
+    service_auth_max_nonces: int = 100_000
+    nonce_store_backend: str = "memory"
+    nonce_store_redis_url: str = "redis://localhost:6379/0"
+    nonce_store_timeout_seconds: float = 0.05
+    nonce_store_fail_open: bool = False
+    job_store_path: str = "ai_gateway_jobs.sqlite3"
+    job_workers: int = 4
+    job_queue_max_depth: int = 100
+    job_result_ttl_seconds: int = 3600
+    job_lease_seconds: float = 30.0
+    job_long_poll_max_seconds: int = 30
+    admission_provider_concurrency: int = 64
+    admission_model_concurrency: int = 32
+    admission_provider_limits: dict[str, int] = {}
+    admission_model_limits: dict[str, int] = {}
+    admission_max_queue_depth: int = 256
+    admission_max_wait_seconds: float = 30.0
+    admission_task_type_priorities: dict[str, str] = {}
+    adaptive_limits_enabled: bool = True
+    adaptive_limit_initial: int = 16
+    adaptive_limit_min: int = 1
+    adaptive_limit_max: int = 128
+    adaptive_limit_backoff_ratio: float = 0.5
+    adaptive_limit_latency_tolerance: float = 2.0
+    adaptive_limit_throttle_remaining_ratio: float = 0.1
+    stream_resume_grace_seconds: int = 30
+    stream_detach_cancel_seconds: float = 5.0
+    stream_connect_timeout_seconds: float = 5.0
+    stream_first_token_timeout_seconds: float = 30.0
+    stream_idle_timeout_seconds: float = 20.0
+    stream_total_timeout_seconds: float = 180.0
+    stream_retry_attempts: int = 1
+    # What to do when a client falls stream_max_lag_bytes behind: coalesce, block or abort.
+    stream_backpressure_policy: str = "coalesce"
+    stream_max_lag_bytes: int = 64 * 1024
+    stream_backpressure_block_seconds: float = 10.0
+    stream_heartbeat_seconds: float = 15.0
+    websocket_max_streams_per_connection: int = 32
+    websocket_initial_credits: int = 64
+    stream_replay_max_bytes_per_stream: int = 256 * 1024
+    stream_replay_max_total_bytes: int = 64 * 1024 * 1024
+    conversation_ttl_seconds: int = 1800
+    conversation_max_count: int = 10_000
+    conversation_max_bytes_per_conversation: int = 256 * 1024
+    conversation_max_total_bytes: int = 64 * 1024 * 1024
 
     model_config = {"env_file": ".env"}
 
@@ -0,0 +1,180 @@
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+from app.config import settings
+from app.metrics import metrics
+from app.providers.base import ChatMessage
+from app.token_budget import estimate_tokens
+
+
+class ConversationBusyError(Exception):
+    """A turn was started while the conversation's previous turn is still running."""
+
+
+@dataclass(slots=True)
+class Turn:
+    message: ChatMessage
+    size: int
+    tokens: int
+    # Safety levels the message has passed at; later turns at these levels skip it.
+    verified_levels: set[str]
+
+
+class Conversation:
+    """Messages of one multi-turn exchange, kept so callers only send each new prompt.
+
+    Only completed turns are stored, as a user message followed by the assistant reply
+    that was actually returned (after PII redaction). One turn runs at a time.
+    """
+
+    def __init__(self, conversation_id: str, owner: str) -> None:
+        self.conversation_id = conversation_id
+        self.owner = owner
+        self.created_at = datetime.now(UTC).isoformat()
+        self.turns: list[Turn] = []
+        self.size = 0
+        self.history_tokens = 0
+        self.busy = False
+        self.discarded = False
+        self.expires_at = 0.0
+
+    def history(self) -> list[ChatMessage]:
+        return [turn.message for turn in self.turns]
+
+    def unverified(self, safety_level: str) -> list[Turn]:
+        return [turn for turn in self.turns if safety_level not in turn.verified_levels]
+
+
+class ConversationStore:
+    """Conversations by ID, expiring after ``CONVERSATION_TTL_SECONDS`` without use.
+
+    The number of conversations and the bytes of stored messages are capped; past
+    either cap the least recently used conversations without a running turn are evicted.
+    """
+
+    def __init__(self) -> None:
+        self._conversations: OrderedDict[str, Conversation] = OrderedDict()
+        self.total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def create(self, owner: str) -> Conversation:
+        self.sweep()
+        conversation = Conversation(uuid.uuid4().hex, owner)
+        self._conversations[conversation.conversation_id] = conversation
+        self._touch(conversation)
+        self._enforce_limits()
+        metrics.increment("conversations_created_total")
+        return conversation
+
+    def get(self, conversation_id: str, owner: str) -> Conversation | None:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None or conversation.owner != owner:
+            return None
+        if not conversation.busy and conversation.expires_at <= time.monotonic():
+            self._remove(conversation, reason="expired")
+            return None
+        self._touch(conversation)
+        return conversation
+
+    def checkout(self, conversation_id: str, owner: str) -> Conversation | None:
+        """Claim the conversation for one turn; hand it back with :meth:`release`."""
+        conversation = self.get(conversation_id, owner)
+        if conversation is None:
+            return None
+        if conversation.busy:
+            raise ConversationBusyError(conversation_id)
+        conversation.busy = True
+        return conversation
+
+    def release(self, conversation: Conversation) -> None:
+        conversation.busy = False
+        self._touch(conversation)
+
+    def append(
+        self, conversation: Conversation, prompt: str, reply: str, safety_level: str
+    ) -> None:
+        """Store a completed turn whose prompt and reply passed at ``safety_level``."""
+        if conversation.discarded:
+            return
+        for role, content in (("user", prompt), ("assistant", reply)):
+            turn = Turn(
+                message=ChatMessage(role, content),
+                size=len(content.encode()),
+                tokens=estimate_tokens(content),
+                verified_levels={safety_level},
+            )
+            conversation.turns.append(turn)
+            self._account(conversation, turn, 1)
+
+        limit = settings.conversation_max_bytes_per_conversation
+        while conversation.size > limit and len(conversation.turns) > 2:
+            # Drop whole exchanges so the history still alternates user and assistant.
+            for turn in conversation.turns[:2]:
+                self._account(conversation, turn, -1)
+            del conversation.turns[:2]
+            metrics.increment("conversation_turns_trimmed_total")
+        self._enforce_limits()
+
+    def delete(self, conversation_id: str, owner: str) -> bool:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None or conversation.owner != owner:
+            return False
+        self._remove(conversation, reason="deleted")
+        return True
+
+    def sweep(self) -> None:
+        now = time.monotonic()
+        expired = [
+            conversation
+            for conversation in self._conversations.values()
+            if not conversation.busy and conversation.expires_at <= now
+        ]
+        for conversation in expired:
+            self._remove(conversation, reason="expired")
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            "conversations": len(self._conversations),
+            "busy": sum(conversation.busy for conversation in self._conversations.values()),
+            "total_bytes": self.total_bytes,
+        }
+
+    def reset(self) -> None:
+        for conversation in self._conversations.values():
+            conversation.discarded = True
+        self._conversations.clear()
+        self.total_bytes = 0
+
+    def _account(self, conversation: Conversation, turn: Turn, sign: int) -> None:
+        conversation.size += sign * turn.size
+        conversation.history_tokens += sign * turn.tokens
+        self.total_bytes += sign * turn.size
+
+    def _touch(self, conversation: Conversation) -> None:
+        conversation.expires_at = time.monotonic() + float(settings.conversation_ttl_seconds)
+        if not conversation.discarded:
+            self._conversations.move_to_end(conversation.conversation_id)
+
+    def _enforce_limits(self) -> None:
+        for conversation in list(self._conversations.values()):
+            if (
+                len(self._conversations) <= settings.conversation_max_count
+                and self.total_bytes <= settings.conversation_max_total_bytes
+            ):
+                return
+            if not conversation.busy:
+                self._remove(conversation, reason="evicted")
+
+    def _remove(self, conversation: Conversation, *, reason: str) -> None:
+        del self._conversations[conversation.conversation_id]
+        self.total_bytes -= conversation.size
+        conversation.discarded = True
+        metrics.increment("conversations_removed_total", reason=reason)
+
+
+conversations = ConversationStore()
@@ -0,0 +1,171 @@
+import contextvars
+import math
+import time
+from collections.abc import Sequence
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.metrics import metrics
+
+DEADLINE_HEADER = "x-request-deadline"
+TIMEOUT_HEADER = "x-request-timeout-ms"
+
+# Upstream timeouts never drop below this, so an almost-spent budget fails fast upstream
+# instead of disabling the timeout.
+_MIN_BUDGET_SECONDS = 0.001
+
+
+class RequestDeadline:
+    """The caller's deadline for the request being served, as a ``time.monotonic()`` time."""
+
+    __slots__ = ("expires_at", "route", "missed")
+
+    def __init__(self, expires_at: float, route: str) -> None:
+        self.expires_at = expires_at
+        self.route = route
+        self.missed = False
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def wall_clock(self) -> float:
+        """The deadline as a Unix timestamp, for work that outlives this process."""
+        return time.time() + self.remaining()
+
+    def miss(self, stage: str) -> None:
+        """Record the first missed deadline for this request, labelled by route and stage."""
+        if self.missed:
+            return
+        self.missed = True
+        record_miss(self.route, stage)
+
+    def exceeded(self, stage: str) -> HTTPException:
+        self.miss(stage)
+        return HTTPException(status_code=504, detail="Request deadline exceeded")
+
+
+_current: contextvars.ContextVar[RequestDeadline | None] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+
+
+def current_deadline() -> RequestDeadline | None:
+    return _current.get()
+
+
+def bind_deadline(deadline: RequestDeadline | None) -> contextvars.Token[RequestDeadline | None]:
+    return _current.set(deadline)
+
+
+def unbind_deadline(token: contextvars.Token[RequestDeadline | None]) -> None:
+    _current.reset(token)
+
+
+def record_miss(route: str, stage: str) -> None:
+    metrics.increment("request_deadline_missed_total", route=route, stage=stage)
+
+
+def remaining_budget(default: float | None) -> float | None:
+    """Cap an upstream timeout at the caller's remaining budget, if there is a deadline."""
+    deadline = _current.get()
+    if deadline is None:
+        return default
+    budget = max(deadline.remaining(), _MIN_BUDGET_SECONDS)
+    return budget if default is None else min(default, budget)
+
+
+def budget_exhausted() -> bool:
+    """Whether a timeout right now was caused by the caller's budget, not the upstream."""
+    deadline = _current.get()
+    return deadline is not None and deadline.expired
+
+
+def parse_deadline(scope: Scope) -> float | None:
+    """Read ``X-Request-Deadline`` and ``X-Request-Timeout-Ms`` into a monotonic deadline.
+
+    ``X-Request-Deadline`` is an absolute Unix timestamp in seconds and
+    ``X-Request-Timeout-Ms`` a budget relative to arrival; when both are sent the
+    earlier one wins. Raises ``ValueError`` for malformed values.
+    """
+    headers = Headers(scope=scope)
+    absolute = headers.get(DEADLINE_HEADER)
+    relative = headers.get(TIMEOUT_HEADER)
+    if absolute is None and relative is None:
+        return None
+
+    now = time.monotonic()
+    candidates: list[float] = []
+    if absolute is not None:
+        candidates.append(now + _number(absolute, "X-Request-Deadline") - time.time())
+    if relative is not None:
+        candidates.append(now + _number(relative, "X-Request-Timeout-Ms") / 1000)
+    return min(candidates)
+
+
+def _number(value: str, name: str) -> float:
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} header") from None
+    if not math.isfinite(number) or number < 0:
+        raise ValueError(f"Invalid {name} header")
+    return number
+
+
+def route_label(scope: Scope, routes: Sequence[BaseRoute]) -> str:
+    """The path template of the route serving ``scope``, or ``"other"``."""
+    for route in routes:
+        match, _child_scope = route.matches(scope)
+        if match != Match.NONE:
+            return str(getattr(route, "path", "other"))
+    return "other"
+
+
+class DeadlineMiddleware:
+    """Bind the caller's deadline to the request context and shed requests that arrive late.
+
+    Requests whose deadline has already passed are answered with 504 before their body is
+    read. Otherwise the deadline is available through :func:`current_deadline` to
+    admission, upstream timeouts and any tasks the request spawns.
+    """
+
+    def __init__(self, app: ASGIApp, routes: Sequence[BaseRoute] = ()) -> None:
+        self.app = app
+        # Misses are labelled by route template, not by raw path, so ids in paths such as
+        # ``/v1/jobs/{job_id}`` do not each add a metric series.
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            expires_at = parse_deadline(scope)
+        except ValueError as exc:
+            await JSONResponse({"detail": str(exc)}, status_code=400)(scope, receive, send)
+            return
+        if expires_at is None:
+            await self.app(scope, receive, send)
+            return
+
+        deadline = RequestDeadline(expires_at, route_label(scope, self.routes))
+        if deadline.expired:
+            rejection = deadline.exceeded("arrival")
+            response = JSONResponse({"detail": rejection.detail}, status_code=rejection.status_code)
+            await response(scope, receive, send)
+            return
+
+        token = bind_deadline(deadline)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            unbind_deadline(token)
@@ -0,0 +1,46 @@
+import importlib
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+orjson: Any
+try:
+    orjson = importlib.import_module("orjson")
+except ImportError:  # pragma: no cover - the "fast-json" extra is not installed
+    orjson = None
+
+HAS_ORJSON = orjson is not None
+
+_fallback_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+
+def dumps(value: Any) -> bytes:
+    """Encode ``value`` as compact UTF-8 JSON bytes.
+
+    Uses orjson when the ``fast-json`` extra is installed; the stdlib fallback is
+    configured to produce the same compact, non-ASCII-preserving output.
+    """
+    if orjson is not None:
+        encoded: bytes = orjson.dumps(value)
+        return encoded
+    return _fallback_encoder.encode(value).encode("utf-8")
+
+
+def loads(data: bytes | bytearray | memoryview | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with :func:`dumps`.
+
+    Endpoints return this directly with plain ``dict`` content, which skips FastAPI's
+    response-model validation and serialization pass on the hot path.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
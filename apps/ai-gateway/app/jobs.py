@@ -0,0 +1,518 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Callable, Coroutine
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.deadlines import RequestDeadline, bind_deadline, record_miss
+from app.models.generate import GenerateRequest, GenerateResponseModel
+
+logger = logging.getLogger("ai-gateway.jobs")
+
+JOBS_ROUTE = "/v1/jobs"
+
+# Runners receive the request and the submitting owner, for per-tenant accounting.
+JobRunner = Callable[[GenerateRequest, str], Coroutine[Any, Any, GenerateResponseModel]]
+
+
+class JobStatus(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+TERMINAL_STATUSES = {JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED}
+
+
+@dataclass
+class JobRecord:
+    id: str
+    owner: str
+    status: JobStatus
+    request: str
+    created_at: float
+    updated_at: float
+    result: str | None = None
+    error: str | None = None
+    status_code: int | None = None
+    expires_at: float | None = None
+    # Unix timestamp after which the submitter no longer wants the result.
+    deadline_at: float | None = None
+    # The worker process holding the job in its queue or running it, and until when its
+    # lease holds; an unfinished job whose lease lapsed belongs to a dead worker.
+    worker_id: str | None = None
+    lease_until: float | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+class JobStore:
+    """SQLite-backed job state so queued work and results survive a worker restart.
+
+    Calls block on SQLite; ``JobManager`` runs them in a thread. Status transitions that
+    can race with another worker process are single conditional ``UPDATE`` statements.
+    """
+
+    _COLUMNS = (
+        "id, owner, status, request, created_at, updated_at, result, error, status_code, "
+        "expires_at, deadline_at, worker_id, lease_until"
+    )
+    _PLACEHOLDERS = ", ".join(["?"] * 13)
+    _UNFINISHED = (JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, owner TEXT NOT NULL, status TEXT NOT NULL, "
+                "request TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "result TEXT, error TEXT, status_code INTEGER, expires_at REAL, deadline_at REAL, "
+                "worker_id TEXT, lease_until REAL)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            # Stores created before request deadlines and job leases.
+            for column, kind in (
+                ("deadline_at", "REAL"),
+                ("worker_id", "TEXT"),
+                ("lease_until", "REAL"),
+            ):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs (expires_at)")
+
+    def save(self, record: JobRecord) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({self._COLUMNS}) VALUES ({self._PLACEHOLDERS})",
+                (
+                    record.id,
+                    record.owner,
+                    record.status.value,
+                    record.request,
+                    record.created_at,
+                    record.updated_at,
+                    record.result,
+                    record.error,
+                    record.status_code,
+                    record.expires_at,
+                    record.deadline_at,
+                    record.worker_id,
+                    record.lease_until,
+                ),
+            )
+
+    def get(self, job_id: str) -> JobRecord | None:
+        with self._lock:
+            return self._get(job_id)
+
+    def claim(self, job_id: str, worker_id: str, lease_until: float) -> JobRecord | None:
+        """Move a queued job to running for ``worker_id``; ``None`` if it is not queued."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, lease_until = ?, updated_at = ? "
+                "WHERE id = ? AND status = ?",
+                (
+                    JobStatus.RUNNING.value,
+                    worker_id,
+                    lease_until,
+                    time.time(),
+                    job_id,
+                    JobStatus.QUEUED.value,
+                ),
+            )
+            return self._get(job_id) if cursor.rowcount == 1 else None
+
+    def finish(self, record: JobRecord, worker_id: str) -> bool:
+        """Store the outcome of a job ``worker_id`` runs; ``False`` if it was cancelled."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, status_code = ?, "
+                "updated_at = ?, expires_at = ?, worker_id = NULL, lease_until = NULL "
+                "WHERE id = ? AND status = ? AND worker_id = ?",
+                (
+                    record.status.value,
+                    record.result,
+                    record.error,
+                    record.status_code,
+                    record.updated_at,
+                    record.expires_at,
+                    record.id,
+                    JobStatus.RUNNING.value,
+                    worker_id,
+                ),
+            )
+        return cursor.rowcount == 1
+
+    def cancel(self, job_id: str, expires_at: float) -> JobRecord | None:
+        """Cancel an unfinished job; ``None`` if it had already finished."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, status_code = 499, updated_at = ?, expires_at = ?, "
+                "worker_id = NULL, lease_until = NULL WHERE id = ? AND status IN (?, ?)",
+                (JobStatus.CANCELLED.value, time.time(), expires_at, job_id, *self._UNFINISHED),
+            )
+            return self._get(job_id) if cursor.rowcount == 1 else None
+
+    def release(self, worker_id: str) -> int:
+        """Put the jobs ``worker_id`` holds back in the queue for any worker to reclaim."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = NULL, lease_until = NULL "
+                "WHERE worker_id = ? AND status IN (?, ?)",
+                (JobStatus.QUEUED.value, worker_id, *self._UNFINISHED),
+            )
+        return cursor.rowcount
+
+    def renew(self, worker_id: str, lease_until: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE worker_id = ? AND status IN (?, ?)",
+                (lease_until, worker_id, *self._UNFINISHED),
+            )
+
+    def reclaim(self, worker_id: str, lease_until: float, now: float) -> list[str]:
+        """Requeue, for ``worker_id``, unfinished jobs whose worker's lease has lapsed."""
+        stale = "status IN (?, ?) AND (lease_until IS NULL OR lease_until < ?)"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM jobs WHERE {stale} ORDER BY created_at",
+                (*self._UNFINISHED, now),
+            ).fetchall()
+            reclaimed = []
+            for (job_id,) in rows:
+                # Re-checked per row: another worker may have reclaimed it since the SELECT.
+                cursor = self._conn.execute(
+                    f"UPDATE jobs SET status = ?, worker_id = ?, lease_until = ? "
+                    f"WHERE id = ? AND {stale}",
+                    (
+                        JobStatus.QUEUED.value,
+                        worker_id,
+                        lease_until,
+                        job_id,
+                        *self._UNFINISHED,
+                        now,
+                    ),
+                )
+                if cursor.rowcount == 1:
+                    reclaimed.append(str(job_id))
+        return reclaimed
+
+    def purge_expired(self, now: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (now,))
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _get(self, job_id: str) -> JobRecord | None:
+        row = self._conn.execute(
+            f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._record(row) if row else None
+
+    @staticmethod
+    def _record(row: tuple[object, ...]) -> JobRecord:
+        (
+            job_id,
+            owner,
+            status,
+            request,
+            created_at,
+            updated_at,
+            result,
+            error,
+            status_code,
+            expires_at,
+            deadline_at,
+            worker_id,
+            lease_until,
+        ) = row
+        return JobRecord(
+            id=str(job_id),
+            owner=str(owner),
+            status=JobStatus(str(status)),
+            request=str(request),
+            created_at=float(str(created_at)),
+            updated_at=float(str(updated_at)),
+            result=None if result is None else str(result),
+            error=None if error is None else str(error),
+            status_code=None if status_code is None else int(str(status_code)),
+            expires_at=None if expires_at is None else float(str(expires_at)),
+            deadline_at=None if deadline_at is None else float(str(deadline_at)),
+            worker_id=None if worker_id is None else str(worker_id),
+            lease_until=None if lease_until is None else float(str(lease_until)),
+        )
+
+
+class JobManager:
+    """Bounded worker pool running generation jobs submitted through ``/v1/jobs``.
+
+    Several worker processes can share one store. A process holds a lease on the jobs it
+    queued or runs and renews it every third of ``JOB_LEASE_SECONDS``; jobs whose lease
+    lapsed are reclaimed by whichever process notices first. A job only runs after a
+    conditional update moved it from queued to running, so no two processes run it.
+    """
+
+    def __init__(self) -> None:
+        self._store: JobStore | None = None
+        self._runner: JobRunner | None = None
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._workers: list[asyncio.Task[None]] = []
+        self._running: dict[str, asyncio.Task[GenerateResponseModel]] = {}
+        self._finished: dict[str, asyncio.Event] = {}
+        self._stopping = False
+        self.worker_id = ""
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            raise RuntimeError("Job manager has not been started")
+        return self._store
+
+    async def start(self, runner: JobRunner) -> None:
+        self._store = await asyncio.to_thread(JobStore, settings.job_store_path)
+        self._runner = runner
+        self._queue = asyncio.Queue()
+        self._stopping = False
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        await asyncio.to_thread(self.store.purge_expired, time.time())
+        # Jobs interrupted by a restart are picked up again from their stored request;
+        # jobs another live worker holds are left to it.
+        await self._reclaim()
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"job-worker-{index}")
+            for index in range(max(1, settings.job_workers))
+        ]
+        self._workers.append(asyncio.create_task(self._renew_leases(), name="job-lease"))
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._running.clear()
+        self._finished.clear()
+        if self._store is not None:
+            # Queued and interrupted jobs go back to the store for the next worker.
+            await asyncio.to_thread(self._store.release, self.worker_id)
+            await asyncio.to_thread(self._store.close)
+            self._store = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def submit(
+        self, request: GenerateRequest, owner: str, deadline_at: float | None = None
+    ) -> JobRecord:
+        if self._queue.qsize() >= settings.job_queue_max_depth:
+            raise JobQueueFullError("Job queue is full")
+
+        now = time.time()
+        record = JobRecord(
+            id=uuid.uuid4().hex,
+            owner=owner,
+            status=JobStatus.QUEUED,
+            request=request.model_dump_json(),
+            created_at=now,
+            updated_at=now,
+            deadline_at=deadline_at,
+            worker_id=self.worker_id,
+            lease_until=now + settings.job_lease_seconds,
+        )
+        await asyncio.to_thread(self._save_new, record, now)
+        self._enqueue(record.id)
+        return record
+
+    async def get(self, job_id: str, owner: str) -> JobRecord | None:
+        record = await asyncio.to_thread(self.store.get, job_id)
+        if record is None or record.owner != owner:
+            return None
+        if record.expires_at is not None and record.expires_at <= time.time():
+            return None
+        return record
+
+    async def wait(self, job_id: str, owner: str, timeout: float) -> JobRecord | None:
+        """Long-poll until the job finishes or ``timeout`` elapses."""
+        deadline = time.monotonic() + timeout
+        while True:
+            record = await self.get(job_id, owner)
+            remaining = deadline - time.monotonic()
+            if record is None or record.finished or remaining <= 0:
+                return record
+
+            finished = self._finished.get(job_id)
+            if finished is None:
+                # Another worker process owns the job; fall back to polling the store.
+                await asyncio.sleep(min(remaining, 0.25))
+                continue
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(finished.wait(), timeout=remaining)
+
+    async def cancel(self, job_id: str, owner: str) -> JobRecord | None:
+        record = await self.get(job_id, owner)
+        if record is None or record.finished:
+            return record
+
+        expires_at = time.time() + float(settings.job_result_ttl_seconds)
+        cancelled = await asyncio.to_thread(self.store.cancel, job_id, expires_at)
+        if cancelled is None:
+            # It finished in the meantime.
+            return await self.get(job_id, owner)
+        running = self._running.get(job_id)
+        if running is not None:
+            running.cancel()
+        self._signal(job_id)
+        return cancelled
+
+    def _save_new(self, record: JobRecord, now: float) -> None:
+        self.store.purge_expired(now)
+        self.store.save(record)
+
+    def _enqueue(self, job_id: str) -> None:
+        self._finished[job_id] = asyncio.Event()
+        self._queue.put_nowait(job_id)
+
+    async def _reclaim(self) -> None:
+        now = time.time()
+        reclaimed = await asyncio.to_thread(
+            self.store.reclaim, self.worker_id, now + settings.job_lease_seconds, now
+        )
+        for job_id in reclaimed:
+            logger.info("Reclaimed job %s from a worker whose lease lapsed", job_id)
+            self._enqueue(job_id)
+
+    async def _renew_leases(self) -> None:
+        while True:
+            await asyncio.sleep(settings.job_lease_seconds / 3)
+            try:
+                lease_until = time.time() + settings.job_lease_seconds
+                await asyncio.to_thread(self.store.renew, self.worker_id, lease_until)
+                await self._reclaim()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to renew job leases")
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Unhandled exception running job %s", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        record = None
+        if self._runner is not None:
+            lease_until = time.time() + settings.job_lease_seconds
+            record = await asyncio.to_thread(self.store.claim, job_id, self.worker_id, lease_until)
+        if record is None or self._runner is None:
+            # Finished, cancelled, or claimed by another worker process.
+            self._signal(job_id)
+            return
+
+        deadline = None
+        if record.deadline_at is not None:
+            remaining = record.deadline_at - time.time()
+            if remaining <= 0:
+                # The submitter stopped waiting while the job sat in the queue; skip it.
+                record_miss(JOBS_ROUTE, "queue")
+                await self._finish(
+                    record,
+                    JobStatus.FAILED,
+                    error=json.dumps("Request deadline exceeded"),
+                    status_code=504,
+                )
+                return
+            deadline = RequestDeadline(time.monotonic() + remaining, JOBS_ROUTE)
+
+        request = GenerateRequest.model_validate_json(record.request)
+        context = contextvars.copy_context()
+        context.run(bind_deadline, deadline)
+        task = asyncio.create_task(self._runner(request, record.owner), context=context)
+        self._running[job_id] = task
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if self._stopping:
+                raise
+            return
+        except HTTPException as exc:
+            await self._finish(
+                record, JobStatus.FAILED, error=json.dumps(exc.detail), status_code=exc.status_code
+            )
+        except Exception:
+            logger.exception("Unhandled exception in job %s", job_id)
+            await self._finish(
+                record,
+                JobStatus.FAILED,
+                error=json.dumps("Internal server error"),
+                status_code=500,
+            )
+        else:
+            await self._finish(
+                record, JobStatus.SUCCEEDED, result=result.model_dump_json(), status_code=200
+            )
+        finally:
+            self._running.pop(job_id, None)
+
+    async def _finish(
+        self,
+        record: JobRecord,
+        status: JobStatus,
+        *,
+        status_code: int,
+        result: str | None = None,
+        error: str | None = None,
+    ) -> None:
+        now = time.time()
+        record.status = status
+        record.status_code = status_code
+        record.result = result
+        record.error = error
+        record.updated_at = now
+        record.expires_at = now + float(settings.job_result_ttl_seconds)
+        # A job cancelled while it ran keeps its cancelled state.
+        await asyncio.to_thread(self.store.finish, record, self.worker_id)
+        self._signal(record.id)
+
+    def _signal(self, job_id: str) -> None:
+        finished = self._finished.pop(job_id, None)
+        if finished is not None:
+            finished.set()
+
+
+job_manager = JobManager()
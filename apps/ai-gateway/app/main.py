@@ -1,3 +1,5 @@
+import asyncio
+import contextlib
 import logging
 import time
 from collections.abc import AsyncIterator, Awaitable, Callable
@@ -10,10 +12,19 @@ from fastapi.responses import JSONResponse
 from starlette.responses import Response
 
 from app.config import settings
+from app.conversations import conversations
+from app.deadlines import DeadlineMiddleware
+from app.jobs import job_manager
+from app.nonce_store import create_nonce_store, replay_guard
 from app.providers.anthropic_provider import AnthropicProvider
 from app.providers.openai_provider import OpenAIProvider
 from app.providers.registry import registry
+from app.rate_limit import create_rate_limit_backend, rate_limiter
+from app.request_body import BodyDigestMiddleware, BodyLimitMiddleware
 from app.routers.v1 import router as v1_router
+from app.routers.v1 import run_job
+from app.routers.websocket import router as websocket_router
+from app.token_budget import token_budget
 
 LOG_LEVEL = getattr(logging, settings.log_level.upper(), logging.INFO)
 logging.basicConfig(level=LOG_LEVEL)
@@ -27,6 +38,16 @@ if settings.sentry_dsn:
     )
 
 
+async def sweep_idle_state() -> None:
+    """Periodically drop refilled rate-limit keys and token budgets, and expired state."""
+    while True:
+        await asyncio.sleep(settings.state_sweep_interval_seconds)
+        rate_limiter.sweep()
+        token_budget.sweep()
+        replay_guard.sweep()
+        conversations.sweep()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     settings.validate_security_configuration()
@@ -34,9 +55,22 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     registry.register("openai", OpenAIProvider())
     registry.register("anthropic", AnthropicProvider())
     logger.info("Registered providers: %s", registry.list_providers())
+    rate_limit_backend = create_rate_limit_backend()
+    rate_limiter.configure(rate_limit_backend)
+    token_budget.configure(rate_limit_backend)
+    replay_guard.configure(create_nonce_store())
+    await job_manager.start(run_job)
+    sweeper = asyncio.create_task(sweep_idle_state(), name="idle-state-sweeper")
     try:
         yield
     finally:
+        sweeper.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await sweeper
+        await job_manager.stop()
+        token_budget.configure(None)
+        await rate_limiter.close()
+        await replay_guard.close()
         await registry.close_all()
 
 
@@ -66,8 +100,13 @@ app.add_middleware(
         "X-Service-Nonce",
         "X-Service-Signature",
         "X-Tenant-ID",
+        "X-Request-Deadline",
+        "X-Request-Timeout-Ms",
     ],
 )
+app.add_middleware(BodyDigestMiddleware)
+# Added last so it wraps the digest middleware and rejects bodies before they are hashed.
+app.add_middleware(BodyLimitMiddleware)
 
 
 @app.middleware("http")
@@ -87,6 +126,11 @@ async def request_logging_middleware(
     return response
 
 
+# Registered after the logging middleware so it is outermost: requests whose deadline
+# already passed are shed before any other work.
+app.add_middleware(DeadlineMiddleware, routes=[*v1_router.routes, *websocket_router.routes])
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception) -> JSONResponse:
     logger.error("Unhandled exception: %s", exc, exc_info=True)
@@ -97,3 +141,4 @@ async def global_exception_handler(request: Request, exc: Exception) -> JSONResp
 
 
 app.include_router(v1_router)
+app.include_router(websocket_router)
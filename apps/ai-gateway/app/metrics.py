@@ -0,0 +1,76 @@
+import threading
+from collections import defaultdict
+
+LabelSet = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, object]) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and summaries exposed through ``/v1/metrics``."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, LabelSet], float] = defaultdict(float)
+        self._gauges: dict[tuple[str, LabelSet], float] = {}
+        self._summaries: dict[tuple[str, LabelSet], list[float]] = {}
+
+    def increment(self, name: str, value: float = 1.0, **labels: object) -> None:
+        with self._lock:
+            self._counters[(name, _labels(labels))] += value
+
+    def set_gauge(self, name: str, value: float, **labels: object) -> None:
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, **labels: object) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = [1.0, value, value]
+                return
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    def counter(self, name: str, **labels: object) -> float:
+        with self._lock:
+            return self._counters.get((name, _labels(labels)), 0.0)
+
+    def gauge(self, name: str, **labels: object) -> float | None:
+        with self._lock:
+            return self._gauges.get((name, _labels(labels)))
+
+    def snapshot(self) -> dict[str, list[dict[str, object]]]:
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            gauges = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._gauges.items())
+            ]
+            summaries = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": int(count),
+                    "sum": total,
+                    "max": maximum,
+                }
+                for (name, labels), (count, total, maximum) in sorted(self._summaries.items())
+            ]
+        return {"counters": counters, "gauges": gauges, "summaries": summaries}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+
+
+class ConversationMessageModel(BaseModel):
+    role: str
+    content: str
+
+
+class ConversationResponseModel(BaseModel):
+    id: str
+    created_at: str
+    messages: list[ConversationMessageModel] = []
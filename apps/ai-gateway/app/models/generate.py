@@ -13,6 +13,11 @@ class GenerateRequest(BaseModel):
     max_tokens: int = Field(default=2048, ge=1, le=16384)
     task_type: str | None = None
     context: dict[str, str | int | float | bool | None] | None = None
+    conversation_id: str | None = None
+
+
+class GenerateBatchRequest(BaseModel):
+    items: list[GenerateRequest] = Field(..., min_length=1, max_length=200)
 
 
 class GenerateResponseModel(BaseModel):
@@ -25,4 +30,5 @@ class GenerateResponseModel(BaseModel):
     task_type: str | None = None
     tenant_id: str | None = None
     user_id: str | None = None
+    queue_time_ms: int | None = None
     created_at: str = Field(default_factory=lambda: datetime.now(UTC).isoformat())
@@ -0,0 +1,15 @@
+from typing import Any
+
+from pydantic import BaseModel
+
+from app.models.generate import GenerateResponseModel
+
+
+class JobResponseModel(BaseModel):
+    id: str
+    status: str
+    created_at: float
+    updated_at: float
+    status_code: int | None = None
+    result: GenerateResponseModel | None = None
+    error: Any = None
@@ -0,0 +1,36 @@
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, Field, RootModel
+
+from app.models.generate import GenerateRequest
+
+StreamKey = Annotated[str, Field(min_length=1, max_length=64)]
+
+
+class StreamStartMessage(BaseModel):
+    type: Literal["start"]
+    id: StreamKey
+    request: GenerateRequest
+    credits: int | None = Field(default=None, ge=1)
+
+
+class StreamCreditMessage(BaseModel):
+    type: Literal["credit"]
+    id: StreamKey
+    credits: int = Field(..., ge=1, le=1_000_000)
+
+
+class StreamCancelMessage(BaseModel):
+    type: Literal["cancel"]
+    id: StreamKey
+
+
+class ClientMessage(
+    RootModel[
+        Annotated[
+            StreamStartMessage | StreamCreditMessage | StreamCancelMessage,
+            Field(discriminator="type"),
+        ]
+    ]
+):
+    """One JSON message sent by a ``/v1/ws`` client, dispatched on ``type``."""
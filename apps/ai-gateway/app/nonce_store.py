@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import heapq
+import importlib
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any
+
+from app.config import settings
+from app.metrics import metrics
+
+logger = logging.getLogger("ai-gateway.nonce_store")
+
+
+class NonceCapacityError(Exception):
+    pass
+
+
+class NonceStoreUnavailable(Exception):
+    pass
+
+
+class NonceStore(ABC):
+    """Remembers claimed nonces until they expire so a signed request cannot be replayed."""
+
+    name = "store"
+
+    @abstractmethod
+    async def claim(self, key: str, ttl_seconds: float) -> bool:
+        """Return ``True`` the first time ``key`` is claimed within its TTL."""
+
+    def sweep(self) -> int:
+        return 0
+
+    def snapshot(self) -> dict[str, object]:
+        return {}
+
+    def reset(self) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
+
+
+def _digest(key: str) -> bytes:
+    # Fixed-size entries: memory per nonce does not depend on caller-chosen header length.
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+class TimeWheelNonceStore(NonceStore):
+    """In-process expiring set bucketed by expiry second.
+
+    Each claim touches one set and one bucket list; expiry drops whole buckets from a
+    small heap of bucket times, so cleanup is amortised O(1) per nonce instead of a scan.
+    Entries may outlive their TTL by under a second, which only makes replay checks
+    stricter. Beyond ``settings.service_auth_max_nonces`` live entries claims fail.
+    """
+
+    name = "memory"
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._members: set[bytes] = set()
+        self._buckets: dict[int, list[bytes]] = {}
+        self._bucket_times: list[int] = []
+
+    async def claim(self, key: str, ttl_seconds: float) -> bool:
+        return self.claim_now(key, ttl_seconds)
+
+    def claim_now(self, key: str, ttl_seconds: float, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        digest = _digest(key)
+        with self._lock:
+            self._expire(now)
+            if digest in self._members:
+                return False
+            if len(self._members) >= settings.service_auth_max_nonces:
+                raise NonceCapacityError("Service authentication replay cache is full")
+            self._members.add(digest)
+            expires_at = math.ceil(now + ttl_seconds)
+            bucket = self._buckets.get(expires_at)
+            if bucket is None:
+                bucket = self._buckets[expires_at] = []
+                heapq.heappush(self._bucket_times, expires_at)
+            bucket.append(digest)
+            return True
+
+    def sweep(self) -> int:
+        with self._lock:
+            return self._expire(time.time())
+
+    def snapshot(self) -> dict[str, object]:
+        with self._lock:
+            return {"nonces": len(self._members), "buckets": len(self._buckets)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._members.clear()
+            self._buckets.clear()
+            self._bucket_times.clear()
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def _expire(self, now: float) -> int:
+        removed = 0
+        while self._bucket_times and self._bucket_times[0] <= now:
+            expired = self._buckets.pop(heapq.heappop(self._bucket_times))
+            self._members.difference_update(expired)
+            removed += len(expired)
+        return removed
+
+
+class RedisNonceStore(NonceStore):
+    """Shared replay protection: ``SET NX PX`` claims a nonce atomically across pods."""
+
+    name = "redis"
+
+    def __init__(self, client: Any, *, prefix: str = "ai-gateway:nonce:") -> None:
+        self._client = client
+        self._prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisNonceStore":
+        try:
+            redis_asyncio = importlib.import_module("redis.asyncio")
+        except ImportError as exc:
+            raise RuntimeError(
+                "The redis nonce store requires the 'redis' extra "
+                "(pip install 'k12-lms-ai-gateway[redis]')"
+            ) from exc
+        return cls(redis_asyncio.from_url(url))
+
+    async def claim(self, key: str, ttl_seconds: float) -> bool:
+        try:
+            claimed = await self._client.set(
+                self._prefix + _digest(key).hex(),
+                b"1",
+                nx=True,
+                px=max(1, math.ceil(ttl_seconds * 1000)),
+            )
+        except Exception as exc:
+            raise NonceStoreUnavailable(repr(exc)) from exc
+        return bool(claimed)
+
+    async def close(self) -> None:
+        close = getattr(self._client, "aclose", None) or getattr(self._client, "close", None)
+        if close is not None:
+            await close()
+
+
+class ReplayGuard:
+    """Routes nonce claims to the configured store.
+
+    A shared store that errors or misses ``nonce_store_timeout_seconds`` fails closed by
+    default; with ``nonce_store_fail_open`` the claim falls back to this worker's store,
+    which still rejects replays that land on the same worker.
+    """
+
+    def __init__(self) -> None:
+        self.local = TimeWheelNonceStore()
+        self._store: NonceStore = self.local
+
+    @property
+    def store(self) -> NonceStore:
+        return self._store
+
+    def configure(self, store: NonceStore | None) -> None:
+        self._store = store or self.local
+
+    async def claim(self, key: str, ttl_seconds: float) -> bool:
+        store = self._store
+        if store is self.local:
+            return self.local.claim_now(key, ttl_seconds)
+        try:
+            return await asyncio.wait_for(
+                store.claim(key, ttl_seconds), timeout=settings.nonce_store_timeout_seconds
+            )
+        except (TimeoutError, NonceStoreUnavailable) as exc:
+            metrics.increment("auth_nonce_store_errors_total", store=store.name)
+            if not settings.nonce_store_fail_open:
+                raise NonceStoreUnavailable(f"Nonce store {store.name} unavailable") from exc
+            logger.warning("Nonce store %s unavailable, checking locally: %r", store.name, exc)
+            return self.local.claim_now(key, ttl_seconds)
+
+    def sweep(self) -> int:
+        removed = self.local.sweep()
+        if self._store is not self.local:
+            removed += self._store.sweep()
+        return removed
+
+    def snapshot(self) -> dict[str, object]:
+        snapshot: dict[str, object] = {
+            "backend": self._store.name,
+            "max_nonces": settings.service_auth_max_nonces,
+            **self.local.snapshot(),
+        }
+        if self._store is not self.local:
+            snapshot["shared"] = self._store.snapshot()
+        return snapshot
+
+    def reset(self) -> None:
+        self.local.reset()
+        self._store.reset()
+
+    async def close(self) -> None:
+        store, self._store = self._store, self.local
+        if store is not self.local:
+            await store.close()
+
+
+def create_nonce_store() -> NonceStore | None:
+    """Build the store named by ``settings.nonce_store_backend``; ``None`` means in-process."""
+    backend = settings.nonce_store_backend
+    if backend == "memory":
+        return None
+    if backend == "redis":
+        return RedisNonceStore.from_url(settings.nonce_store_redis_url)
+    raise ValueError(f"Unknown nonce store backend '{backend}'")
+
+
+replay_guard = ReplayGuard()
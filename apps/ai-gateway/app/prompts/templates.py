@@ -0,0 +1,242 @@
+import string
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+from app.prompts.system_prompts import SYSTEM_PROMPTS
+
+GRADE_LEVELS = ("K", *(str(grade) for grade in range(1, 13)))
+
+
+class TemplateVariableError(ValueError):
+    """A ``context`` value does not fit the template variable it fills."""
+
+
+@dataclass(frozen=True, slots=True)
+class TemplateVariable:
+    """Type and bounds of one value a template reads from ``GenerateRequest.context``."""
+
+    kind: type[str] | type[int]
+    choices: tuple[str, ...] = ()
+    max_length: int = 200
+    minimum: int = 1
+    maximum: int = 100
+
+    def coerce(self, name: str, value: object) -> str | None:
+        """Return ``value`` as the text to render, or ``None`` if it is unset."""
+        if value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, str | int):
+            raise TemplateVariableError(f"context.{name} must be a {self.kind.__name__}")
+
+        if self.kind is int:
+            if isinstance(value, str) and not value.strip().isdigit():
+                raise TemplateVariableError(f"context.{name} must be an int")
+            number = int(value)
+            if not self.minimum <= number <= self.maximum:
+                raise TemplateVariableError(
+                    f"context.{name} must be between {self.minimum} and {self.maximum}"
+                )
+            return str(number)
+
+        # Collapsing whitespace keeps a value on its own line of the rendered context.
+        text = " ".join(str(value).split())
+        if not text:
+            return None
+        if self.choices:
+            for choice in self.choices:
+                if text.casefold() == choice.casefold():
+                    return choice
+            raise TemplateVariableError(f"context.{name} must be one of {', '.join(self.choices)}")
+        if len(text) > self.max_length:
+            raise TemplateVariableError(
+                f"context.{name} must be at most {self.max_length} characters"
+            )
+        return text
+
+
+TEMPLATE_VARIABLES = {
+    "grade_level": TemplateVariable(str, choices=GRADE_LEVELS),
+    "subject": TemplateVariable(str, max_length=80),
+    "standards": TemplateVariable(str, max_length=500),
+    "duration_minutes": TemplateVariable(int, minimum=5, maximum=240),
+    "lesson_count": TemplateVariable(int, maximum=30),
+    "question_count": TemplateVariable(int, maximum=50),
+    "learner_profile": TemplateVariable(str, max_length=300),
+    "reading_level": TemplateVariable(str, max_length=80),
+}
+
+# One line per section; a section is rendered only when all of its variables are set.
+TEMPLATE_SECTIONS = {
+    "lesson_generation": (
+        "Grade level: {grade_level}.",
+        "Subject: {subject}.",
+        "Align to these standards: {standards}.",
+        "Target duration: {duration_minutes} minutes.",
+    ),
+    "unit_generation": (
+        "Grade level: {grade_level}.",
+        "Subject: {subject}.",
+        "Align to these standards: {standards}.",
+        "Number of lessons: {lesson_count}.",
+    ),
+    "differentiation": (
+        "Grade level: {grade_level}.",
+        "Subject: {subject}.",
+        "Learner profile: {learner_profile}.",
+    ),
+    "assessment_generation": (
+        "Grade level: {grade_level}.",
+        "Subject: {subject}.",
+        "Align to these standards: {standards}.",
+        "Number of questions: {question_count}.",
+    ),
+    "rewrite": (
+        "Grade level: {grade_level}.",
+        "Target reading level: {reading_level}.",
+    ),
+}
+
+# Literal text and the variable after it (``None`` for a trailing literal).
+_Part = tuple[str, str | None]
+
+
+def compile_section(section: str, variables: Mapping[str, TemplateVariable]) -> tuple[_Part, ...]:
+    parts: list[_Part] = []
+    for literal, name, format_spec, conversion in string.Formatter().parse(section):
+        if name is not None:
+            if name not in variables:
+                raise ValueError(f"Unknown template variable {name!r} in {section!r}")
+            if format_spec or conversion:
+                raise ValueError(f"Template variable {name!r} cannot take a format spec")
+        parts.append((literal, name))
+    return tuple(parts)
+
+
+class PromptTemplate:
+    """The static system prompt of a ``task_type`` and its compiled context sections."""
+
+    __slots__ = ("task_type", "system_prompt", "variables", "_sections")
+
+    def __init__(
+        self,
+        task_type: str,
+        system_prompt: str,
+        sections: tuple[str, ...],
+        variables: Mapping[str, TemplateVariable],
+    ) -> None:
+        self.task_type = task_type
+        self.system_prompt = system_prompt
+        self._sections = tuple(compile_section(section, variables) for section in sections)
+        names = {name for parts in self._sections for _literal, name in parts if name}
+        self.variables = {name: variables[name] for name in sorted(names)}
+
+    def render(self, context: Mapping[str, object]) -> str | None:
+        values: dict[str | None, str] = {}
+        for name, variable in self.variables.items():
+            text = variable.coerce(name, context.get(name))
+            if text is not None:
+                values[name] = text
+
+        lines = []
+        for parts in self._sections:
+            if all(name is None or name in values for _literal, name in parts):
+                lines.append("".join(literal + values.get(name, "") for literal, name in parts))
+        return "\n".join(lines) or None
+
+
+class _TemplateStats:
+    __slots__ = (
+        "renders",
+        "render_seconds",
+        "render_seconds_max",
+        "prompt_tokens",
+        "cached_tokens",
+    )
+
+    def __init__(self) -> None:
+        self.renders = 0
+        self.render_seconds = 0.0
+        self.render_seconds_max = 0.0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+
+class PromptTemplateRegistry:
+    """Templates compiled once at import, with render cost and upstream cache hits.
+
+    A template's system prompt is sent unchanged, as a cacheable prefix. Its variables
+    are rendered into a short system context that providers send after that prefix, so
+    requests for different grades or subjects still share the cached prefix.
+    """
+
+    def __init__(self, templates: Mapping[str, PromptTemplate]) -> None:
+        self._templates = dict(templates)
+        self._stats = {task_type: _TemplateStats() for task_type in self._templates}
+
+    @classmethod
+    def compile(
+        cls,
+        system_prompts: Mapping[str, str],
+        sections: Mapping[str, tuple[str, ...]],
+        variables: Mapping[str, TemplateVariable],
+    ) -> "PromptTemplateRegistry":
+        return cls(
+            {
+                task_type: PromptTemplate(
+                    task_type, system_prompt, sections.get(task_type, ()), variables
+                )
+                for task_type, system_prompt in system_prompts.items()
+            }
+        )
+
+    def system_prompt(self, task_type: str) -> str | None:
+        template = self._templates.get(task_type)
+        return template.system_prompt if template is not None else None
+
+    def render(self, task_type: str, context: Mapping[str, object]) -> str | None:
+        """Render ``task_type``'s system context; raises ``TemplateVariableError``."""
+        template = self._templates.get(task_type)
+        if template is None:
+            return None
+        started = time.perf_counter()
+        rendered = template.render(context)
+        elapsed = time.perf_counter() - started
+        stats = self._stats[task_type]
+        stats.renders += 1
+        stats.render_seconds += elapsed
+        stats.render_seconds_max = max(stats.render_seconds_max, elapsed)
+        return rendered
+
+    def record_usage(self, task_type: str, prompt_tokens: int, cached_tokens: int) -> None:
+        """Count prompt tokens upstream served from its cache for ``task_type``'s prefix."""
+        stats = self._stats.get(task_type)
+        if stats is None:
+            return
+        stats.prompt_tokens += prompt_tokens
+        stats.cached_tokens += cached_tokens
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        return {
+            task_type: {
+                "renders": stats.renders,
+                "render_us_avg": round(stats.render_seconds / stats.renders * 1e6, 2)
+                if stats.renders
+                else 0.0,
+                "render_us_max": round(stats.render_seconds_max * 1e6, 2),
+                "prompt_tokens": stats.prompt_tokens,
+                "cached_tokens": stats.cached_tokens,
+                "cache_hit_ratio": round(stats.cached_tokens / stats.prompt_tokens, 4)
+                if stats.prompt_tokens
+                else 0.0,
+            }
+            for task_type, stats in self._stats.items()
+        }
+
+    def reset(self) -> None:
+        self._stats = {task_type: _TemplateStats() for task_type in self._templates}
+
+
+prompt_templates = PromptTemplateRegistry.compile(
+    SYSTEM_PROMPTS, TEMPLATE_SECTIONS, TEMPLATE_VARIABLES
+)
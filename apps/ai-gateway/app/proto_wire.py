@@ -0,0 +1,238 @@
+import struct
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import aclosing
+from typing import Any
+
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+from google.protobuf.message import DecodeError, Message
+from starlette.responses import Response
+
+from app import fast_json
+from app.models.generate import GenerateRequest, GenerateResponseModel
+from app.stream_sessions import HEARTBEAT_FRAME, frame_payload
+
+PROTOBUF_MEDIA_TYPE = "application/x-protobuf"
+PACKAGE = "k12.ai_gateway.v1"
+
+_Field = descriptor_pb2.FieldDescriptorProto
+_STRING = _Field.TYPE_STRING
+_INT64 = _Field.TYPE_INT64
+_MESSAGE = _Field.TYPE_MESSAGE
+
+_LENGTH = struct.Struct(">I")
+# A zero-length frame decodes to nothing; clients skip it. It keeps idle proxies from
+# closing a stream that is waiting on the model, like the SSE keep-alive comment.
+KEEPALIVE_FRAME = _LENGTH.pack(0)
+
+# Optional scalar fields, copied only when the sender set them so model defaults apply.
+_REQUEST_OPTIONAL_FIELDS = (
+    "system_prompt",
+    "temperature",
+    "max_tokens",
+    "task_type",
+    "conversation_id",
+)
+
+
+def _add_field(
+    message: descriptor_pb2.DescriptorProto,
+    name: str,
+    number: int,
+    kind: int,
+    *,
+    type_name: str = "",
+    optional: bool = False,
+    repeated: bool = False,
+    oneof_index: int | None = None,
+) -> None:
+    field = message.field.add(
+        name=name,
+        number=number,
+        type=kind,
+        label=_Field.LABEL_REPEATED if repeated else _Field.LABEL_OPTIONAL,
+    )
+    if type_name:
+        field.type_name = type_name
+    if oneof_index is not None:
+        field.oneof_index = oneof_index
+    if optional:
+        # proto3 ``optional`` is a synthetic oneof holding just this field.
+        field.proto3_optional = True
+        field.oneof_index = len(message.oneof_decl)
+        message.oneof_decl.add(name=f"_{name}")
+
+
+def _add_map(
+    message: descriptor_pb2.DescriptorProto,
+    name: str,
+    number: int,
+    value_kind: int,
+    value_type_name: str = "",
+) -> None:
+    entry_name = "".join(part.capitalize() for part in name.split("_")) + "Entry"
+    entry = message.nested_type.add(name=entry_name)
+    entry.options.map_entry = True
+    _add_field(entry, "key", 1, _STRING)
+    _add_field(entry, "value", 2, value_kind, type_name=value_type_name)
+    _add_field(
+        message,
+        name,
+        number,
+        _MESSAGE,
+        type_name=f".{PACKAGE}.{message.name}.{entry_name}",
+        repeated=True,
+    )
+
+
+def file_descriptor() -> descriptor_pb2.FileDescriptorProto:
+    """The schema in ``proto/ai_gateway.proto``, built without a protoc step."""
+    schema = descriptor_pb2.FileDescriptorProto(
+        name="ai_gateway.proto", package=PACKAGE, syntax="proto3"
+    )
+
+    context_value = schema.message_type.add(name="ContextValue")
+    context_value.oneof_decl.add(name="value")
+    _add_field(context_value, "string_value", 1, _STRING, oneof_index=0)
+    _add_field(context_value, "int_value", 2, _INT64, oneof_index=0)
+    _add_field(context_value, "double_value", 3, _Field.TYPE_DOUBLE, oneof_index=0)
+    _add_field(context_value, "bool_value", 4, _Field.TYPE_BOOL, oneof_index=0)
+
+    request = schema.message_type.add(name="GenerateRequest")
+    _add_field(request, "provider", 1, _STRING)
+    _add_field(request, "model", 2, _STRING)
+    _add_field(request, "prompt", 3, _STRING)
+    _add_field(request, "system_prompt", 4, _STRING, optional=True)
+    _add_field(request, "temperature", 5, _Field.TYPE_DOUBLE, optional=True)
+    _add_field(request, "max_tokens", 6, _Field.TYPE_INT32, optional=True)
+    _add_field(request, "task_type", 7, _STRING, optional=True)
+    _add_map(request, "context", 8, _MESSAGE, f".{PACKAGE}.ContextValue")
+    _add_field(request, "conversation_id", 9, _STRING, optional=True)
+
+    response = schema.message_type.add(name="GenerateResponse")
+    _add_field(response, "id", 1, _STRING)
+    _add_field(response, "content", 2, _STRING)
+    _add_field(response, "model", 3, _STRING)
+    _add_field(response, "provider", 4, _STRING)
+    _add_map(response, "usage", 5, _INT64)
+    _add_field(response, "finish_reason", 6, _STRING, optional=True)
+    _add_field(response, "task_type", 7, _STRING, optional=True)
+    _add_field(response, "tenant_id", 8, _STRING, optional=True)
+    _add_field(response, "user_id", 9, _STRING, optional=True)
+    _add_field(response, "queue_time_ms", 10, _INT64, optional=True)
+    _add_field(response, "created_at", 11, _STRING)
+
+    event = schema.message_type.add(name="StreamEvent")
+    _add_field(event, "content", 1, _STRING)
+    _add_field(event, "done", 2, _Field.TYPE_BOOL)
+    _add_map(event, "usage", 3, _INT64)
+    _add_field(event, "finish_reason", 4, _STRING, optional=True)
+    _add_field(event, "queue_time_ms", 5, _INT64, optional=True)
+    _add_field(event, "error", 6, _STRING, optional=True)
+    _add_field(event, "code", 7, _STRING, optional=True)
+    _add_field(event, "event_id", 8, _STRING)
+    return schema
+
+
+_pool = descriptor_pool.DescriptorPool()
+_pool.Add(file_descriptor())
+
+
+def _message_class(name: str) -> type[Message]:
+    message_class: type[Message] = message_factory.GetMessageClass(
+        _pool.FindMessageTypeByName(f"{PACKAGE}.{name}")
+    )
+    return message_class
+
+
+GenerateRequestMessage = _message_class("GenerateRequest")
+GenerateResponseMessage = _message_class("GenerateResponse")
+StreamEventMessage = _message_class("StreamEvent")
+
+
+def is_protobuf(content_type: str | None) -> bool:
+    if not content_type:
+        return False
+    return content_type.partition(";")[0].strip().lower() == PROTOBUF_MEDIA_TYPE
+
+
+def accepts_protobuf(accept: str | None) -> bool:
+    """Whether an ``Accept`` header lists protobuf, ignoring ranges with ``q=0``."""
+    if not accept or PROTOBUF_MEDIA_TYPE not in accept:
+        return False
+    for media_range in accept.split(","):
+        media_type, _, params = media_range.partition(";")
+        if media_type.strip().lower() != PROTOBUF_MEDIA_TYPE:
+            continue
+        quality = params.replace(" ", "").lower().partition("q=")[2].partition(";")[0]
+        try:
+            return not quality or float(quality) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def decode_generate_request(body: bytes) -> GenerateRequest:
+    """Parse a protobuf ``GenerateRequest`` and validate it like a JSON body.
+
+    Raises ``ValueError`` for bytes that are not a valid message and pydantic's
+    ``ValidationError`` for values the JSON API would reject too.
+    """
+    message: Any = GenerateRequestMessage()
+    try:
+        message.ParseFromString(body)
+    except DecodeError:
+        raise ValueError("Invalid protobuf GenerateRequest body") from None
+
+    data: dict[str, Any] = {
+        "provider": message.provider,
+        "model": message.model,
+        "prompt": message.prompt,
+    }
+    for name in _REQUEST_OPTIONAL_FIELDS:
+        if message.HasField(name):
+            data[name] = getattr(message, name)
+    if message.context:
+        context = {}
+        for key, value in message.context.items():
+            kind = value.WhichOneof("value")
+            context[key] = getattr(value, kind) if kind is not None else None
+        data["context"] = context
+    return GenerateRequest.model_validate(data)
+
+
+def encode_generate_response(response: GenerateResponseModel) -> bytes:
+    message: Any = GenerateResponseMessage(
+        id=response.id,
+        content=response.content,
+        model=response.model,
+        provider=response.provider,
+        usage=response.usage,
+        finish_reason=response.finish_reason,
+        task_type=response.task_type,
+        tenant_id=response.tenant_id,
+        user_id=response.user_id,
+        queue_time_ms=response.queue_time_ms,
+        created_at=response.created_at,
+    )
+    data: bytes = message.SerializeToString()
+    return data
+
+
+def encode_stream_event(frame: bytes) -> bytes:
+    """Turn one SSE frame from a ``StreamSession`` into a length-prefixed ``StreamEvent``."""
+    event_id = frame[4 : frame.index(b"\n")].decode() if frame.startswith(b"id: ") else ""
+    message: Any = StreamEventMessage(event_id=event_id, **fast_json.loads(frame_payload(frame)))
+    data: bytes = message.SerializeToString()
+    return _LENGTH.pack(len(data)) + data
+
+
+async def protobuf_stream(frames: AsyncGenerator[bytes, None]) -> AsyncIterator[bytes]:
+    """Re-frame a ``StreamSession.subscribe`` iterator for a protobuf client."""
+    # aclosing() hands an early close straight to the subscription, which drops its reader.
+    async with aclosing(frames):
+        async for frame in frames:
+            yield KEEPALIVE_FRAME if frame is HEARTBEAT_FRAME else encode_stream_event(frame)
+
+
+class ProtobufResponse(Response):
+    media_type = PROTOBUF_MEDIA_TYPE
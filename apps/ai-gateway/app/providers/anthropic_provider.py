@@ -1,28 +1,37 @@
 import json
 import logging
-from collections.abc import AsyncGenerator
+import time
+from collections.abc import AsyncGenerator, Sequence
 
 import httpx
 
+from app import fast_json
 from app.config import settings
+from app.deadlines import remaining_budget
 from app.providers.base import (
     BaseProvider,
+    ChatMessage,
     GenerateResponse,
     ProviderError,
     StreamChunk,
     Usage,
 )
+from app.providers.deadlines import ConnectDeadlineError, StreamDeadlines
+from app.providers.sse import iter_sse_events
 
 logger = logging.getLogger("ai-gateway.anthropic")
 
+# Named events the stream parser never needs; their payloads are not JSON-decoded.
+_IGNORED_EVENTS = frozenset({"ping", "content_block_start", "content_block_stop"})
+
 
 class AnthropicProvider(BaseProvider):
     name = "anthropic"
     supported_models = ["claude-sonnet-4-5-20250929", "claude-haiku-4-5-20251001"]
 
-    def __init__(self, api_key: str | None = None):
+    def __init__(self, api_key: str | None = None, base_url: str | None = None):
         self.api_key = api_key or settings.anthropic_api_key
-        self.base_url = "https://api.anthropic.com/v1/messages"
+        self.base_url = (base_url or settings.anthropic_base_url).rstrip("/") + "/messages"
         self._client = httpx.AsyncClient(timeout=120.0)
 
     def _headers(self) -> dict[str, str]:
@@ -32,6 +41,51 @@ class AnthropicProvider(BaseProvider):
             "content-type": "application/json",
         }
 
+    def _system_blocks(
+        self, system_prompt: str, cache_system_prompt: bool, system_context: str | None = None
+    ) -> str | list[dict[str, object]]:
+        if not cache_system_prompt and not system_context:
+            return system_prompt
+        blocks: list[dict[str, object]] = [{"type": "text", "text": system_prompt}]
+        if cache_system_prompt:
+            # Mark the static system prompt as a cacheable prefix so upstream reuses it
+            # across requests instead of reprocessing it every time.
+            blocks[0]["cache_control"] = {"type": "ephemeral"}
+        if system_context:
+            blocks.append({"type": "text", "text": system_context})
+        return blocks
+
+    def _build_messages(
+        self, prompt: str, history: Sequence[ChatMessage]
+    ) -> list[dict[str, object]]:
+        messages: list[dict[str, object]] = [
+            {"role": message.role, "content": message.content} for message in history
+        ]
+        if messages:
+            # The stored conversation is the same prefix on every turn; a cache breakpoint
+            # at its end lets upstream reuse it instead of reprocessing the whole history.
+            messages[-1]["content"] = [
+                {
+                    "type": "text",
+                    "text": history[-1].content,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ]
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _usage(self, usage: dict[str, int], output_tokens: int) -> Usage:
+        cached_tokens = usage.get("cache_read_input_tokens", 0) or 0
+        cache_creation_tokens = usage.get("cache_creation_input_tokens", 0) or 0
+        prompt_tokens = usage.get("input_tokens", 0) + cached_tokens + cache_creation_tokens
+        return Usage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=output_tokens,
+            total_tokens=prompt_tokens + output_tokens,
+            cached_tokens=cached_tokens,
+            cache_creation_tokens=cache_creation_tokens,
+        )
+
     def _ensure_api_key(self) -> None:
         if not self.api_key:
             raise ProviderError(
@@ -47,31 +101,39 @@ class AnthropicProvider(BaseProvider):
         temperature: float = 0.7,
         max_tokens: int = 2048,
         system_prompt: str | None = None,
+        cache_system_prompt: bool = False,
+        system_context: str | None = None,
+        history: Sequence[ChatMessage] = (),
     ) -> GenerateResponse:
         self._ensure_api_key()
-        body = {
+        body: dict[str, object] = {
             "model": model,
             "max_tokens": max_tokens,
             "temperature": temperature,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": self._build_messages(prompt, history),
         }
         if system_prompt:
-            body["system"] = system_prompt
+            body["system"] = self._system_blocks(system_prompt, cache_system_prompt, system_context)
 
+        started = time.monotonic()
         try:
             response = await self._client.post(
                 self.base_url,
                 headers=self._headers(),
                 json=body,
-                timeout=120.0,
+                timeout=remaining_budget(120.0),
             )
 
+            retry_after = self._record_upstream(
+                model, response.status_code, response.headers, started
+            )
             if response.status_code != 200:
                 detail = response.text[:500]
                 raise ProviderError(
                     message=f"Anthropic API error: {response.status_code} {detail}",
                     provider=self.name,
                     status_code=response.status_code,
+                    retry_after=retry_after,
                 )
 
             data = response.json()
@@ -80,14 +142,11 @@ class AnthropicProvider(BaseProvider):
                 content=data["content"][0]["text"],
                 model=model,
                 provider=self.name,
-                usage=Usage(
-                    prompt_tokens=usage.get("input_tokens", 0),
-                    completion_tokens=usage.get("output_tokens", 0),
-                    total_tokens=usage.get("input_tokens", 0) + usage.get("output_tokens", 0),
-                ),
+                usage=self._usage(usage, usage.get("output_tokens", 0)),
                 finish_reason=data.get("stop_reason", "end_turn"),
             )
         except httpx.TimeoutException as exc:
+            self._record_timeout(model)
             raise ProviderError(
                 message="Anthropic request timed out",
                 provider=self.name,
@@ -105,55 +164,57 @@ class AnthropicProvider(BaseProvider):
         temperature: float = 0.7,
         max_tokens: int = 2048,
         system_prompt: str | None = None,
+        cache_system_prompt: bool = False,
+        system_context: str | None = None,
+        history: Sequence[ChatMessage] = (),
     ) -> AsyncGenerator[StreamChunk, None]:
         self._ensure_api_key()
-        body = {
+        body: dict[str, object] = {
             "model": model,
             "max_tokens": max_tokens,
             "temperature": temperature,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": self._build_messages(prompt, history),
             "stream": True,
         }
         if system_prompt:
-            body["system"] = system_prompt
+            body["system"] = self._system_blocks(system_prompt, cache_system_prompt, system_context)
 
+        deadlines = StreamDeadlines.from_settings()
+        started = time.monotonic()
         try:
             async with self._client.stream(
                 "POST",
                 self.base_url,
                 headers=self._headers(),
                 json=body,
-                timeout=180.0,
+                timeout=deadlines.httpx_timeout(),
             ) as response:
+                retry_after = self._record_upstream(
+                    model, response.status_code, response.headers, started, kind="stream"
+                )
                 if response.status_code != 200:
                     detail = (await response.aread()).decode("utf-8", errors="ignore")[:500]
                     raise ProviderError(
                         message=f"Anthropic API error: {response.status_code} {detail}",
                         provider=self.name,
                         status_code=response.status_code,
+                        retry_after=retry_after,
                     )
 
-                input_tokens = 0
+                input_usage: dict[str, int] = {}
                 output_tokens = 0
-                async for line in response.aiter_lines():
-                    line = line.strip()
-                    if not line or not line.startswith("data: "):
-                        if line.startswith("event: "):
-                            continue
+                async for event in iter_sse_events(response.aiter_bytes()):
+                    if event.event in _IGNORED_EVENTS:
                         continue
-
-                    line = line[len("data: ") :]
-
                     try:
-                        data = json.loads(line)
+                        data = fast_json.loads(event.data)
                     except json.JSONDecodeError:
                         continue
 
                     event_type = data.get("type")
 
                     if event_type == "message_start":
-                        usage = data.get("message", {}).get("usage", {})
-                        input_tokens = usage.get("input_tokens", 0)
+                        input_usage = data.get("message", {}).get("usage", {})
 
                     elif event_type == "content_block_delta":
                         delta = data.get("delta", {})
@@ -167,14 +228,16 @@ class AnthropicProvider(BaseProvider):
                         yield StreamChunk(
                             content="",
                             done=True,
-                            usage=Usage(
-                                prompt_tokens=input_tokens,
-                                completion_tokens=output_tokens,
-                                total_tokens=input_tokens + output_tokens,
-                            ),
+                            usage=self._usage(input_usage, output_tokens),
                         )
                         return
+        except httpx.ConnectTimeout as exc:
+            self._record_timeout(model)
+            raise ConnectDeadlineError(
+                message="Anthropic connection timed out", provider=self.name
+            ) from exc
         except httpx.TimeoutException as exc:
+            self._record_timeout(model)
             raise ProviderError(
                 message="Anthropic stream timed out",
                 provider=self.name,
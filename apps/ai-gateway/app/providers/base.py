@@ -1,13 +1,20 @@
+import time
 from abc import ABC, abstractmethod
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Mapping, Sequence
+from dataclasses import dataclass
 
 from pydantic import BaseModel
 
+from app.adaptive_limit import CallKind, adaptive_limits, parse_rate_limit_headers
+from app.deadlines import budget_exhausted
+
 
 class Usage(BaseModel):
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
+    cached_tokens: int = 0
+    cache_creation_tokens: int = 0
 
 
 class GenerateResponse(BaseModel):
@@ -18,17 +25,52 @@ class GenerateResponse(BaseModel):
     finish_reason: str
 
 
-class StreamChunk(BaseModel):
+class StreamChunk:
+    """One streamed piece of a completion, passed from a provider to the router.
+
+    A plain ``__slots__`` class rather than a pydantic model: providers create one per
+    token, so it skips validation and the per-instance ``__dict__``. Only the final chunk
+    carries ``usage``.
+    """
+
+    __slots__ = ("content", "done", "usage")
+
+    def __init__(self, content: str, done: bool, usage: Usage | None = None) -> None:
+        self.content = content
+        self.done = done
+        self.usage = usage
+
+    def __repr__(self) -> str:
+        return f"StreamChunk(content={self.content!r}, done={self.done!r}, usage={self.usage!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, StreamChunk):
+            return NotImplemented
+        return (self.content, self.done, self.usage) == (other.content, other.done, other.usage)
+
+    __hash__ = None  # type: ignore[assignment]
+
+
+@dataclass(frozen=True, slots=True)
+class ChatMessage:
+    """One earlier message of a conversation, sent to the provider ahead of the prompt."""
+
+    role: str
     content: str
-    done: bool
-    usage: Usage | None = None
 
 
 class ProviderError(Exception):
-    def __init__(self, message: str, provider: str, status_code: int = 502):
+    def __init__(
+        self,
+        message: str,
+        provider: str,
+        status_code: int = 502,
+        retry_after: float | None = None,
+    ):
         self.message = message
         self.provider = provider
         self.status_code = status_code
+        self.retry_after = retry_after
         super().__init__(message)
 
 
@@ -44,6 +86,9 @@ class BaseProvider(ABC):
         temperature: float = 0.7,
         max_tokens: int = 2048,
         system_prompt: str | None = None,
+        cache_system_prompt: bool = False,
+        system_context: str | None = None,
+        history: Sequence[ChatMessage] = (),
     ) -> GenerateResponse: ...
 
     @abstractmethod
@@ -54,8 +99,43 @@ class BaseProvider(ABC):
         temperature: float = 0.7,
         max_tokens: int = 2048,
         system_prompt: str | None = None,
+        cache_system_prompt: bool = False,
+        system_context: str | None = None,
+        history: Sequence[ChatMessage] = (),
     ) -> AsyncGenerator[StreamChunk, None]: ...
 
     async def close(self) -> None:
         """Close the underlying HTTP client."""
         return None
+
+    def _record_upstream(
+        self,
+        model: str,
+        status_code: int,
+        headers: Mapping[str, str],
+        started: float,
+        kind: CallKind = "generate",
+    ) -> float | None:
+        """Feed status, latency and rate-limit headers to the adaptive limiter.
+
+        ``kind`` is ``"stream"`` when ``started`` was measured up to the response headers
+        of a stream rather than to a complete response.
+
+        Returns the upstream ``retry-after`` in seconds, if any.
+        """
+        snapshot = parse_rate_limit_headers(headers)
+        adaptive_limits.record_response(
+            self.name,
+            model,
+            status_code=status_code,
+            latency_seconds=time.monotonic() - started,
+            snapshot=snapshot,
+            kind=kind,
+        )
+        return snapshot.retry_after
+
+    def _record_timeout(self, model: str) -> None:
+        if budget_exhausted():
+            # The caller's deadline cut the call short; that says nothing about the upstream.
+            return
+        adaptive_limits.record_timeout(self.name, model)
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+from collections.abc import AsyncGenerator, Callable
+from contextlib import aclosing
+from dataclasses import dataclass
+
+import httpx
+
+from app.adaptive_limit import adaptive_limits
+from app.config import settings
+from app.deadlines import budget_exhausted, remaining_budget
+from app.metrics import metrics
+from app.providers.base import ProviderError, StreamChunk
+
+logger = logging.getLogger("ai-gateway.deadlines")
+
+
+class StreamDeadlineError(ProviderError):
+    """A provider stream missed one of its deadlines.
+
+    ``code`` is sent to clients in the SSE error frame. ``retryable`` errors happen
+    before the upstream produced anything, so the stream can be reopened without the
+    client seeing a difference.
+    """
+
+    code = "stream_timeout"
+    retryable = False
+
+    def __init__(self, message: str, provider: str) -> None:
+        super().__init__(message=message, provider=provider, status_code=504)
+
+
+class ConnectDeadlineError(StreamDeadlineError):
+    code = "connect_timeout"
+    retryable = True
+
+
+class FirstTokenDeadlineError(StreamDeadlineError):
+    code = "first_token_timeout"
+    retryable = True
+
+
+class IdleDeadlineError(StreamDeadlineError):
+    code = "idle_timeout"
+
+
+class TotalDeadlineError(StreamDeadlineError):
+    code = "total_timeout"
+
+
+def _limit(seconds: float) -> float | None:
+    return seconds if seconds > 0 else None
+
+
+@dataclass(frozen=True)
+class StreamDeadlines:
+    """Deadlines for one provider stream, in seconds; ``None`` disables one.
+
+    ``connect`` bounds opening the upstream connection, ``first_token`` the wait from
+    sending the request to the first chunk, ``idle`` the gap between chunks, and
+    ``total`` the whole stream including retries.
+    """
+
+    connect: float | None
+    first_token: float | None
+    idle: float | None
+    total: float | None
+
+    @classmethod
+    def from_settings(cls) -> "StreamDeadlines":
+        """Configured deadlines, capped by the caller's remaining budget when it sent one."""
+        return cls(
+            connect=remaining_budget(_limit(settings.stream_connect_timeout_seconds)),
+            first_token=remaining_budget(_limit(settings.stream_first_token_timeout_seconds)),
+            idle=_limit(settings.stream_idle_timeout_seconds),
+            total=remaining_budget(_limit(settings.stream_total_timeout_seconds)),
+        )
+
+    def httpx_timeout(self) -> httpx.Timeout:
+        # Reads are left unbounded: first-token and idle deadlines are enforced per chunk
+        # by guard_stream, where keep-alive pings and partial frames do not reset them.
+        return httpx.Timeout(None, connect=self.connect, write=self.connect, pool=self.connect)
+
+
+def _earliest(first: float | None, second: float | None) -> float | None:
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return min(first, second)
+
+
+class _Watchdog:
+    """Cancels the current task if an upstream wait outlives its deadline.
+
+    Re-arming per chunk only stores the new deadline; the single timer notices a moved
+    deadline when it fires and reschedules itself. This keeps the per-token cost to a
+    couple of attribute writes instead of a timer heap push and cancel.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.fired = False
+        self._loop = loop
+        self._task = asyncio.current_task()
+        self._due: float | None = None
+        self._waiting = False
+        self._handle: asyncio.TimerHandle | None = None
+
+    def arm(self, due: float | None) -> None:
+        self._due = due
+        self._waiting = True
+        if due is None:
+            return
+        if self._handle is None:
+            self._handle = self._loop.call_at(due, self._check)
+        elif due < self._handle.when():
+            # Only a deadline moving earlier, such as idle after first token, needs a new timer.
+            self._handle.cancel()
+            self._handle = self._loop.call_at(due, self._check)
+
+    def pause(self) -> None:
+        self._waiting = False
+
+    def stop(self) -> None:
+        self._waiting = False
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _check(self) -> None:
+        self._handle = None
+        if not self._waiting or self._due is None:
+            return
+        if self._loop.time() < self._due:
+            self._handle = self._loop.call_at(self._due, self._check)
+            return
+        self.fired = True
+        if self._task is not None:
+            self._task.cancel()
+
+
+async def guard_stream(
+    open_stream: Callable[[], AsyncGenerator[StreamChunk, None]],
+    *,
+    provider: str,
+    model: str,
+    deadlines: StreamDeadlines | None = None,
+) -> AsyncGenerator[StreamChunk, None]:
+    """Yield chunks from ``open_stream()`` while enforcing ``deadlines``.
+
+    A missed deadline closes the provider generator, and with it the upstream HTTP
+    stream, and raises the matching :class:`StreamDeadlineError`. Connect and
+    first-token failures are retried up to ``settings.stream_retry_attempts`` times with
+    a fresh stream, as long as nothing has been yielded yet.
+    """
+    if deadlines is None:
+        deadlines = StreamDeadlines.from_settings()
+    loop = asyncio.get_running_loop()
+    total_at = loop.time() + deadlines.total if deadlines.total is not None else None
+    idle = deadlines.idle
+    retries = 0
+
+    while True:
+        received = False
+        watchdog = _Watchdog(loop)
+        try:
+            chunks = open_stream()
+            async with aclosing(chunks):
+                first_at = loop.time() + deadlines.first_token if deadlines.first_token else None
+                watchdog.arm(_earliest(first_at, total_at))
+                try:
+                    async for chunk in chunks:
+                        # Only upstream waits count; the consumer may hold the chunk.
+                        watchdog.pause()
+                        received = True
+                        yield chunk
+                        watchdog.arm(_earliest(loop.time() + idle if idle else None, total_at))
+                except asyncio.CancelledError:
+                    task = asyncio.current_task()
+                    if not watchdog.fired or (task is not None and task.uncancel() > 0):
+                        raise
+                    expired_total = total_at is not None and loop.time() >= total_at
+                    raise _deadline_error(
+                        provider, expired_total=expired_total, received=received
+                    ) from None
+                finally:
+                    watchdog.stop()
+                return
+        except StreamDeadlineError as exc:
+            metrics.increment("stream_deadline_exceeded_total", provider=provider, code=exc.code)
+            if not isinstance(exc, ConnectDeadlineError) and not budget_exhausted():
+                # Providers record their own connect timeouts.
+                adaptive_limits.record_timeout(provider, model)
+            if (
+                received
+                or not exc.retryable
+                or retries >= settings.stream_retry_attempts
+                or budget_exhausted()
+            ):
+                raise
+            retries += 1
+            metrics.increment("stream_retries_total", provider=provider, reason=exc.code)
+            logger.warning("Retrying %s stream after %s", provider, exc.code)
+
+
+def _deadline_error(provider: str, *, expired_total: bool, received: bool) -> StreamDeadlineError:
+    if expired_total:
+        return TotalDeadlineError("Upstream stream exceeded its total deadline", provider)
+    if received:
+        return IdleDeadlineError("Upstream stream stalled between tokens", provider)
+    return FirstTokenDeadlineError("Upstream sent no tokens before the deadline", provider)
@@ -1,17 +1,25 @@
+import hashlib
 import json
 import logging
-from collections.abc import AsyncGenerator
+import time
+from collections.abc import AsyncGenerator, Sequence
+from typing import Any
 
 import httpx
 
+from app import fast_json
 from app.config import settings
+from app.deadlines import remaining_budget
 from app.providers.base import (
     BaseProvider,
+    ChatMessage,
     GenerateResponse,
     ProviderError,
     StreamChunk,
     Usage,
 )
+from app.providers.deadlines import ConnectDeadlineError, StreamDeadlines
+from app.providers.sse import iter_sse_events
 
 logger = logging.getLogger("ai-gateway.openai")
 
@@ -20,9 +28,9 @@ class OpenAIProvider(BaseProvider):
     name = "openai"
     supported_models = ["gpt-4o", "gpt-4o-mini", "gpt-4-turbo", "gpt-3.5-turbo"]
 
-    def __init__(self, api_key: str | None = None):
+    def __init__(self, api_key: str | None = None, base_url: str | None = None):
         self.api_key = api_key or settings.openai_api_key
-        self.base_url = "https://api.openai.com/v1/chat/completions"
+        self.base_url = (base_url or settings.openai_base_url).rstrip("/") + "/chat/completions"
         self._client = httpx.AsyncClient(timeout=120.0)
 
     def _headers(self) -> dict[str, str]:
@@ -40,14 +48,54 @@ class OpenAIProvider(BaseProvider):
             )
 
     def _build_messages(
-        self, prompt: str, system_prompt: str | None = None
+        self,
+        prompt: str,
+        system_prompt: str | None = None,
+        history: Sequence[ChatMessage] = (),
+        system_context: str | None = None,
     ) -> list[dict[str, str]]:
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
+        if system_context:
+            # After the static system message, so the cached prefix stays the same.
+            messages.append({"role": "system", "content": system_context})
+        messages.extend({"role": message.role, "content": message.content} for message in history)
         messages.append({"role": "user", "content": prompt})
         return messages
 
+    def _build_body(
+        self,
+        *,
+        model: str,
+        messages: list[dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        system_prompt: str | None,
+        cache_system_prompt: bool,
+    ) -> dict[str, object]:
+        # OpenAI caches prompt prefixes automatically; the static system message is always
+        # first, and a stable cache key routes requests sharing it to the same cache.
+        body: dict[str, object] = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if cache_system_prompt and system_prompt:
+            digest = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:32]
+            body["prompt_cache_key"] = f"system-{digest}"
+        return body
+
+    def _usage(self, usage: dict[str, Any]) -> Usage:
+        details = usage.get("prompt_tokens_details") or {}
+        return Usage(
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            total_tokens=usage.get("total_tokens", 0),
+            cached_tokens=details.get("cached_tokens", 0) or 0,
+        )
+
     async def generate(
         self,
         prompt: str,
@@ -55,28 +103,38 @@ class OpenAIProvider(BaseProvider):
         temperature: float = 0.7,
         max_tokens: int = 2048,
         system_prompt: str | None = None,
+        cache_system_prompt: bool = False,
+        system_context: str | None = None,
+        history: Sequence[ChatMessage] = (),
     ) -> GenerateResponse:
         self._ensure_api_key()
-        messages = self._build_messages(prompt, system_prompt)
+        body = self._build_body(
+            model=model,
+            messages=self._build_messages(prompt, system_prompt, history, system_context),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            system_prompt=system_prompt,
+            cache_system_prompt=cache_system_prompt,
+        )
+        started = time.monotonic()
         try:
             response = await self._client.post(
                 self.base_url,
                 headers=self._headers(),
-                json={
-                    "model": model,
-                    "messages": messages,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                },
-                timeout=120.0,
+                json=body,
+                timeout=remaining_budget(120.0),
             )
 
+            retry_after = self._record_upstream(
+                model, response.status_code, response.headers, started
+            )
             if response.status_code != 200:
                 detail = response.text[:500]
                 raise ProviderError(
                     message=f"OpenAI API error: {response.status_code} {detail}",
                     provider=self.name,
                     status_code=response.status_code,
+                    retry_after=retry_after,
                 )
 
             data = response.json()
@@ -85,14 +143,11 @@ class OpenAIProvider(BaseProvider):
                 content=data["choices"][0]["message"]["content"],
                 model=model,
                 provider=self.name,
-                usage=Usage(
-                    prompt_tokens=usage.get("prompt_tokens", 0),
-                    completion_tokens=usage.get("completion_tokens", 0),
-                    total_tokens=usage.get("total_tokens", 0),
-                ),
+                usage=self._usage(usage),
                 finish_reason=data["choices"][0].get("finish_reason", "stop"),
             )
         except httpx.TimeoutException as exc:
+            self._record_timeout(model)
             raise ProviderError(
                 message="OpenAI request timed out",
                 provider=self.name,
@@ -110,68 +165,81 @@ class OpenAIProvider(BaseProvider):
         temperature: float = 0.7,
         max_tokens: int = 2048,
         system_prompt: str | None = None,
+        cache_system_prompt: bool = False,
+        system_context: str | None = None,
+        history: Sequence[ChatMessage] = (),
     ) -> AsyncGenerator[StreamChunk, None]:
         self._ensure_api_key()
-        messages = self._build_messages(prompt, system_prompt)
+        body = self._build_body(
+            model=model,
+            messages=self._build_messages(prompt, system_prompt, history, system_context),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            system_prompt=system_prompt,
+            cache_system_prompt=cache_system_prompt,
+        )
+        body["stream"] = True
+        # Without this OpenAI never reports usage for streamed completions.
+        body["stream_options"] = {"include_usage": True}
+        deadlines = StreamDeadlines.from_settings()
+        started = time.monotonic()
         try:
             async with self._client.stream(
                 "POST",
                 self.base_url,
                 headers=self._headers(),
-                json={
-                    "model": model,
-                    "messages": messages,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "stream": True,
-                },
-                timeout=180.0,
+                json=body,
+                timeout=deadlines.httpx_timeout(),
             ) as response:
+                retry_after = self._record_upstream(
+                    model, response.status_code, response.headers, started, kind="stream"
+                )
                 if response.status_code != 200:
                     detail = (await response.aread()).decode("utf-8", errors="ignore")[:500]
                     raise ProviderError(
                         message=f"OpenAI API error: {response.status_code} {detail}",
                         provider=self.name,
                         status_code=response.status_code,
+                        retry_after=retry_after,
                     )
 
-                async for line in response.aiter_lines():
-                    line = line.strip()
-                    if not line.startswith("data: "):
-                        continue
-                    line = line[len("data: ") :]
-                    if line == "[DONE]":
-                        yield StreamChunk(content="", done=True)
+                # With include_usage, the finish_reason chunk is followed by a final chunk
+                # with no choices that carries usage, then the [DONE] sentinel.
+                finished = False
+                usage: Usage | None = None
+                async for event in iter_sse_events(response.aiter_bytes()):
+                    if event.data == b"[DONE]":
+                        yield StreamChunk(content="", done=True, usage=usage)
                         return
 
                     try:
-                        data = json.loads(line)
+                        data = fast_json.loads(event.data)
                     except json.JSONDecodeError:
                         continue
 
+                    usage_data = data.get("usage")
+                    if usage_data:
+                        usage = self._usage(usage_data)
+
                     choices = data.get("choices", [])
                     if not choices:
                         continue
 
-                    delta = choices[0].get("delta", {})
-                    content = delta.get("content", "")
-                    finish_reason = choices[0].get("finish_reason")
-
-                    usage_data = data.get("usage")
-                    usage = None
-                    if usage_data:
-                        usage = Usage(
-                            prompt_tokens=usage_data.get("prompt_tokens", 0),
-                            completion_tokens=usage_data.get("completion_tokens", 0),
-                            total_tokens=usage_data.get("total_tokens", 0),
-                        )
-
-                    if finish_reason:
-                        yield StreamChunk(content=content, done=True, usage=usage)
-                        return
-
-                    yield StreamChunk(content=content, done=False)
+                    content = choices[0].get("delta", {}).get("content") or ""
+                    if choices[0].get("finish_reason"):
+                        finished = True
+                    if content:
+                        yield StreamChunk(content=content, done=False)
+
+                if finished or usage is not None:
+                    yield StreamChunk(content="", done=True, usage=usage)
+        except httpx.ConnectTimeout as exc:
+            self._record_timeout(model)
+            raise ConnectDeadlineError(
+                message="OpenAI connection timed out", provider=self.name
+            ) from exc
         except httpx.TimeoutException as exc:
+            self._record_timeout(model)
             raise ProviderError(
                 message="OpenAI stream timed out",
                 provider=self.name,
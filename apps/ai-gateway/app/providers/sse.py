@@ -0,0 +1,90 @@
+from collections.abc import AsyncIterable, AsyncIterator
+
+_DEFAULT_EVENT = "message"
+
+
+class ServerSentEvent:
+    """One dispatched SSE event; ``data`` stays as bytes so JSON parsing can be skipped."""
+
+    __slots__ = ("event", "data", "id")
+
+    def __init__(self, event: str, data: bytes, id: str | None = None) -> None:
+        self.event = event
+        self.data = data
+        self.id = id
+
+    def __repr__(self) -> str:
+        return f"ServerSentEvent(event={self.event!r}, data={self.data!r}, id={self.id!r})"
+
+
+class SSEDecoder:
+    """Incremental ``text/event-stream`` decoder over raw response bytes.
+
+    Follows the WHATWG event-stream rules: ``\\r\\n``, ``\\n`` and ``\\r`` all end a line,
+    repeated ``data:`` fields join with newlines, ``event:`` names the event, comment
+    lines start with ``:``, and a blank line dispatches. Field values stay ``bytes``;
+    only the short ``event`` and ``id`` values are decoded to ``str``.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = b""
+        self._pending_cr = False
+        self._event = ""
+        self._data: list[bytes] = []
+        self._last_id: str | None = None
+
+    def feed(self, chunk: bytes) -> list[ServerSentEvent]:
+        if self._pending_cr and chunk.startswith(b"\n"):
+            chunk = chunk[1:]
+        self._pending_cr = chunk.endswith(b"\r")
+        if b"\r" in chunk:
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        buffer = self._buffer + chunk if self._buffer else chunk
+        end = buffer.rfind(b"\n")
+        if end < 0:
+            self._buffer = buffer
+            return []
+        self._buffer = buffer[end + 1 :]
+
+        events: list[ServerSentEvent] = []
+        data, event, last_id = self._data, self._event, self._last_id
+        # Splitting in C once per chunk is far cheaper than a Python-level scan per line.
+        for line in buffer[:end].split(b"\n"):
+            if not line:
+                if data:
+                    payload = data[0] if len(data) == 1 else b"\n".join(data)
+                    events.append(ServerSentEvent(event or _DEFAULT_EVENT, payload, last_id))
+                    data = []
+                event = ""
+            elif line[:6] == b"data: ":
+                data.append(line[6:])
+            elif line[:7] == b"event: ":
+                event = line[7:].decode("utf-8", errors="replace")
+            elif line[:5] == b"data:":
+                data.append(line[5:])
+            elif line[0] != 0x3A:  # lines starting with ":" are comments
+                name, _, value = line.partition(b":")
+                if value[:1] == b" ":
+                    value = value[1:]
+                if name == b"event":
+                    event = value.decode("utf-8", errors="replace")
+                elif name == b"id" and b"\0" not in value:
+                    last_id = value.decode("utf-8", errors="replace")
+        self._data, self._event, self._last_id = data, event, last_id
+        return events
+
+    def flush(self) -> None:
+        """Discard an event left unterminated when the stream closed, as WHATWG requires."""
+        self._buffer = b""
+        self._pending_cr = False
+        self._event = ""
+        self._data = []
+
+
+async def iter_sse_events(chunks: AsyncIterable[bytes]) -> AsyncIterator[ServerSentEvent]:
+    """Decode an async byte stream such as ``httpx.Response.aiter_bytes()``."""
+    decoder = SSEDecoder()
+    async for chunk in chunks:
+        for event in decoder.feed(chunk):
+            yield event
+    decoder.flush()
@@ -1,9 +1,70 @@
+import asyncio
+import logging
+import math
 import threading
 import time
-from collections import defaultdict, deque
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict, deque
+
+from app.config import settings
+from app.metrics import metrics
+
+logger = logging.getLogger("ai-gateway.rate_limit")
+
+
+class RateLimitBackendError(Exception):
+    pass
+
+
+class RateLimitBackend(ABC):
+    """Where rate-limit state lives: this process, this host, or a shared store."""
+
+    name = "backend"
+
+    @abstractmethod
+    async def check(self, key: str, limit: int, period_seconds: int) -> tuple[bool, int]: ...
+
+    async def charge(
+        self, key: str, cost: float, limit: int, period_seconds: int, *, force: bool = False
+    ) -> tuple[bool, int, float]:
+        """GCRA where one call spends ``cost`` of ``limit`` units per ``period_seconds``.
+
+        A key with a full bucket may go into debt for a single oversized charge. ``force``
+        applies the charge, or a negative refund, whatever the state. Returns whether it
+        was applied, the retry-after in seconds and the key's backlog in seconds.
+        """
+        raise RateLimitBackendError(f"The {self.name} backend cannot charge costs")
+
+    async def count(
+        self, key: str, amount: int, limit: int, expires_at: float, *, force: bool = False
+    ) -> tuple[bool, int]:
+        """Add ``amount`` to a counter that is dropped at ``expires_at``, within ``limit``.
+
+        Counters are stored as ``expires_at + total`` in the same slot a GCRA key uses, so
+        sweeps and evictions treat an expired counter like a refilled key. Returns whether
+        the amount was added and the counter's total.
+        """
+        raise RateLimitBackendError(f"The {self.name} backend cannot count")
+
+    def sweep(self) -> int:
+        return 0
+
+    def snapshot(self) -> dict[str, object]:
+        return {}
+
+    def reset(self) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
 
 
 class SlidingWindowRateLimiter:
+    """Exact sliding-window log: one timestamp per admitted request, per key.
+
+    Memory grows with ``limit x keys``; kept as the reference behaviour for benchmarks.
+    """
+
     def __init__(self) -> None:
         self._entries: dict[str, deque[float]] = defaultdict(deque)
         self._lock = threading.Lock()
@@ -29,4 +90,239 @@ class SlidingWindowRateLimiter:
             self._entries.clear()
 
 
-rate_limiter = SlidingWindowRateLimiter()
+class _Shard:
+    __slots__ = ("lock", "arrivals", "evicted_idle", "evicted_capacity")
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.arrivals: OrderedDict[str, float] = OrderedDict()
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+
+
+class GcraRateLimiter(RateLimitBackend):
+    """Generic cell rate algorithm: one float (the theoretical arrival time) per key.
+
+    ``limit`` requests per ``period_seconds`` are admitted as a burst, then refill at
+    ``period_seconds / limit`` intervals. State lives in lock-sharded dicts so unrelated
+    keys do not contend on a single lock.
+
+    Keys are kept in LRU order and capped at ``settings.rate_limit_max_keys``. A key whose
+    arrival time has passed is fully refilled, so ``sweep`` can drop it without changing
+    any decision; only keys evicted by the cap while still throttled lose state.
+    """
+
+    name = "memory"
+
+    def __init__(self, shards: int = 64) -> None:
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._shard_count = len(self._shards)
+
+    def allow(self, key: str, limit: int, period_seconds: int) -> tuple[bool, int]:
+        now = time.time()
+        interval = period_seconds / (limit if limit > 0 else 1)
+        shard = self._shards[hash(key) % self._shard_count]
+        arrivals = shard.arrivals
+
+        with shard.lock:
+            tat = arrivals.get(key)
+            if tat is None:
+                tat = now
+                self._make_room(shard, now)
+            elif tat < now:
+                tat = now
+            wait = tat + interval - period_seconds - now
+            if wait > 0:
+                arrivals.move_to_end(key)
+                return False, max(1, math.ceil(wait))
+            arrivals[key] = tat + interval
+            arrivals.move_to_end(key)
+            return True, 0
+
+    async def check(self, key: str, limit: int, period_seconds: int) -> tuple[bool, int]:
+        return self.allow(key, limit, period_seconds)
+
+    async def charge(
+        self, key: str, cost: float, limit: int, period_seconds: int, *, force: bool = False
+    ) -> tuple[bool, int, float]:
+        now = time.time()
+        interval = period_seconds / (limit if limit > 0 else 1)
+        shard = self._shards[hash(key) % self._shard_count]
+        arrivals = shard.arrivals
+
+        with shard.lock:
+            tat = arrivals.get(key)
+            if tat is None:
+                self._make_room(shard, now)
+            tat = now if tat is None or tat < now else tat
+            if not force:
+                wait = tat + cost * interval - period_seconds - now
+                if wait > 0 and tat > now:
+                    arrivals[key] = tat
+                    arrivals.move_to_end(key)
+                    return False, max(1, math.ceil(wait)), tat - now
+            tat = max(now, tat + cost * interval)
+            arrivals[key] = tat
+            arrivals.move_to_end(key)
+            return True, 0, tat - now
+
+    async def count(
+        self, key: str, amount: int, limit: int, expires_at: float, *, force: bool = False
+    ) -> tuple[bool, int]:
+        shard = self._shards[hash(key) % self._shard_count]
+        arrivals = shard.arrivals
+
+        with shard.lock:
+            stored = arrivals.get(key)
+            if stored is None:
+                self._make_room(shard, time.time())
+            total = decode_counter(stored, expires_at)
+            updated = max(0, total + amount)
+            if not force and 0 < limit < updated and amount > 0:
+                arrivals[key] = expires_at + total
+                arrivals.move_to_end(key)
+                return False, total
+            arrivals[key] = expires_at + updated
+            arrivals.move_to_end(key)
+            return True, updated
+
+    def sweep(self, now: float | None = None) -> int:
+        """Drop keys that are fully refilled; returns how many were removed."""
+        now = time.time() if now is None else now
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                idle = [key for key, tat in shard.arrivals.items() if tat <= now]
+                for key in idle:
+                    del shard.arrivals[key]
+                shard.evicted_idle += len(idle)
+            removed += len(idle)
+        metrics.set_gauge("rate_limit_keys", len(self))
+        return removed
+
+    def snapshot(self) -> dict[str, object]:
+        return {
+            "keys": len(self),
+            "max_keys": settings.rate_limit_max_keys,
+            "evicted_idle": sum(shard.evicted_idle for shard in self._shards),
+            "evicted_capacity": sum(shard.evicted_capacity for shard in self._shards),
+        }
+
+    def __len__(self) -> int:
+        return sum(len(shard.arrivals) for shard in self._shards)
+
+    def reset(self) -> None:
+        for shard in self._shards:
+            with shard.lock:
+                shard.arrivals.clear()
+                shard.evicted_idle = 0
+                shard.evicted_capacity = 0
+
+    def _make_room(self, shard: _Shard, now: float) -> None:
+        capacity = max(1, settings.rate_limit_max_keys // self._shard_count)
+        while len(shard.arrivals) >= capacity:
+            _key, tat = shard.arrivals.popitem(last=False)
+            if tat <= now:
+                shard.evicted_idle += 1
+            else:
+                shard.evicted_capacity += 1
+
+
+def decode_counter(stored: float | None, expires_at: float) -> int:
+    """Decode a counter slot; anything below ``expires_at`` is a fresh counter."""
+    if stored is None or stored < expires_at:
+        return 0
+    return round(stored - expires_at)
+
+
+class RateLimiter:
+    """Routes checks to the configured backend.
+
+    When a shared backend errors or misses ``rate_limit_backend_timeout_seconds``, checks
+    fall back to process-local limits for ``rate_limit_backend_retry_seconds`` so a slow
+    or unreachable store degrades limiting instead of failing requests.
+    """
+
+    def __init__(self) -> None:
+        self.local = GcraRateLimiter()
+        self._backend: RateLimitBackend = self.local
+        self._fallback_until = 0.0
+
+    @property
+    def backend(self) -> RateLimitBackend:
+        return self._backend
+
+    def configure(self, backend: RateLimitBackend | None) -> None:
+        self._backend = backend or self.local
+        self._fallback_until = 0.0
+
+    async def allow(self, key: str, limit: int, period_seconds: int) -> tuple[bool, int]:
+        backend = self._backend
+        if backend is self.local:
+            return self.local.allow(key, limit, period_seconds)
+        if time.monotonic() < self._fallback_until:
+            return self._allow_locally(key, limit, period_seconds)
+        try:
+            return await asyncio.wait_for(
+                backend.check(key, limit, period_seconds),
+                timeout=settings.rate_limit_backend_timeout_seconds,
+            )
+        except (TimeoutError, RateLimitBackendError) as exc:
+            logger.warning(
+                "Rate limit backend %s unavailable, limiting locally: %r", backend.name, exc
+            )
+            metrics.increment("rate_limit_backend_fallback_total", backend=backend.name)
+            self._fallback_until = time.monotonic() + settings.rate_limit_backend_retry_seconds
+            return self._allow_locally(key, limit, period_seconds)
+
+    def sweep(self) -> int:
+        removed = self.local.sweep()
+        if self._backend is not self.local:
+            removed += self._backend.sweep()
+        return removed
+
+    def snapshot(self) -> dict[str, object]:
+        snapshot = self.local.snapshot()
+        if self._backend is not self.local:
+            snapshot = {
+                **snapshot,
+                "shared": self._backend.snapshot(),
+                "fallback_active": time.monotonic() < self._fallback_until,
+            }
+        return {"backend": self._backend.name, **snapshot}
+
+    def reset(self) -> None:
+        self.local.reset()
+        self._backend.reset()
+        self._fallback_until = 0.0
+
+    async def close(self) -> None:
+        backend, self._backend = self._backend, self.local
+        if backend is not self.local:
+            await backend.close()
+
+    def _allow_locally(self, key: str, limit: int, period_seconds: int) -> tuple[bool, int]:
+        # Each worker only sees its own traffic, so split the limit across the fleet.
+        share = max(1, limit // max(1, settings.rate_limit_fallback_workers))
+        return self.local.allow(key, share, period_seconds)
+
+
+def create_rate_limit_backend() -> RateLimitBackend | None:
+    """Build the backend named by ``settings.rate_limit_backend``; ``None`` means in-process."""
+    backend = settings.rate_limit_backend
+    if backend == "memory":
+        return None
+    if backend == "shared_memory":
+        from app.rate_limit_shm import SharedMemoryRateLimitBackend
+
+        return SharedMemoryRateLimitBackend(
+            settings.rate_limit_shared_memory_path, slots=settings.rate_limit_max_keys
+        )
+    if backend == "redis":
+        from app.rate_limit_redis import RedisRateLimitBackend
+
+        return RedisRateLimitBackend.from_url(settings.rate_limit_redis_url)
+    raise ValueError(f"Unknown rate limit backend '{backend}'")
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import importlib
+import math
+from typing import Any
+
+from app.rate_limit import RateLimitBackend, RateLimitBackendError
+
+# GCRA in milliseconds against the Redis clock, so every node agrees on "now". Keys expire
+# once fully refilled, which keeps idle tenants from accumulating in Redis.
+GCRA_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+  tat = now
+end
+local wait = tat + interval - period - now
+if wait > 0 then
+  return {0, math.ceil(wait)}
+end
+local next_tat = tat + interval
+redis.call('SET', KEYS[1], next_tat, 'PX', math.max(1, math.ceil(next_tat - now)))
+return {1, 0}
+"""
+GCRA_SCRIPT_SHA = hashlib.sha1(GCRA_SCRIPT.encode("utf-8")).hexdigest()
+
+# GCRA with a cost per call (already multiplied by the interval), debt on a full bucket
+# and forced charges or refunds. Returns {applied, wait_ms, backlog_ms}.
+CHARGE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local cost = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+  tat = now
+end
+if ARGV[3] ~= '1' then
+  local wait = tat + cost - period - now
+  if wait > 0 and tat > now then
+    return {0, math.ceil(wait), math.ceil(tat - now)}
+  end
+end
+local next_tat = math.max(now, tat + cost)
+if next_tat > now then
+  redis.call('SET', KEYS[1], next_tat, 'PX', math.ceil(next_tat - now))
+else
+  redis.call('DEL', KEYS[1])
+end
+return {1, 0, math.ceil(next_tat - now)}
+"""
+CHARGE_SCRIPT_SHA = hashlib.sha1(CHARGE_SCRIPT.encode("utf-8")).hexdigest()
+
+# A counter that expires at ARGV[3] (Unix seconds). Returns {applied, total}.
+COUNT_SCRIPT = """
+local amount = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local total = tonumber(redis.call('GET', KEYS[1])) or 0
+local updated = math.max(0, total + amount)
+if ARGV[4] ~= '1' and limit > 0 and amount > 0 and updated > limit then
+  return {0, total}
+end
+redis.call('SET', KEYS[1], updated)
+redis.call('EXPIREAT', KEYS[1], ARGV[3])
+return {1, updated}
+"""
+COUNT_SCRIPT_SHA = hashlib.sha1(COUNT_SCRIPT.encode("utf-8")).hexdigest()
+
+SCRIPTS = {
+    GCRA_SCRIPT_SHA: GCRA_SCRIPT,
+    CHARGE_SCRIPT_SHA: CHARGE_SCRIPT,
+    COUNT_SCRIPT_SHA: COUNT_SCRIPT,
+}
+
+# Script SHA, full key, script arguments and the caller waiting for the raw result.
+_Pending = tuple[str, str, tuple[float | int, ...], "asyncio.Future[Any]"]
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """GCRA and counters evaluated atomically in Redis by server-side scripts.
+
+    Checks issued in the same event-loop tick are sent as one pipeline of ``EVALSHA``
+    calls, so a burst of concurrent requests costs a single round trip. ``client`` is a
+    ``redis.asyncio.Redis`` or anything exposing ``pipeline`` and ``script_load``.
+    """
+
+    name = "redis"
+
+    def __init__(self, client: Any, *, prefix: str = "ai-gateway:rate-limit:") -> None:
+        self._client = client
+        self._prefix = prefix
+        self._pending: list[_Pending] = []
+        self._flushes: set[asyncio.Task[None]] = set()
+        self.round_trips = 0
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisRateLimitBackend":
+        try:
+            redis_asyncio = importlib.import_module("redis.asyncio")
+        except ImportError as exc:
+            raise RuntimeError(
+                "The redis rate limit backend requires the 'redis' extra "
+                "(pip install 'k12-lms-ai-gateway[redis]')"
+            ) from exc
+        return cls(redis_asyncio.from_url(url))
+
+    async def check(self, key: str, limit: int, period_seconds: int) -> tuple[bool, int]:
+        interval_ms = period_seconds * 1000 / (limit if limit > 0 else 1)
+        allowed, wait_ms = await self._call(
+            GCRA_SCRIPT_SHA, key, interval_ms, period_seconds * 1000
+        )
+        retry_after = 0 if int(allowed) else max(1, math.ceil(int(wait_ms) / 1000))
+        return bool(int(allowed)), retry_after
+
+    async def charge(
+        self, key: str, cost: float, limit: int, period_seconds: int, *, force: bool = False
+    ) -> tuple[bool, int, float]:
+        cost_ms = cost * period_seconds * 1000 / (limit if limit > 0 else 1)
+        applied, wait_ms, backlog_ms = await self._call(
+            CHARGE_SCRIPT_SHA, key, cost_ms, period_seconds * 1000, int(force)
+        )
+        retry_after = 0 if int(applied) else max(1, math.ceil(int(wait_ms) / 1000))
+        return bool(int(applied)), retry_after, int(backlog_ms) / 1000
+
+    async def count(
+        self, key: str, amount: int, limit: int, expires_at: float, *, force: bool = False
+    ) -> tuple[bool, int]:
+        applied, total = await self._call(
+            COUNT_SCRIPT_SHA, key, amount, limit, math.ceil(expires_at), int(force)
+        )
+        return bool(int(applied)), int(total)
+
+    def snapshot(self) -> dict[str, object]:
+        return {"round_trips": self.round_trips}
+
+    async def close(self) -> None:
+        for task in list(self._flushes):
+            task.cancel()
+        close = getattr(self._client, "aclose", None) or getattr(self._client, "close", None)
+        if close is not None:
+            await close()
+
+    async def _call(self, sha: str, key: str, *args: float | int) -> Any:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[Any] = loop.create_future()
+        self._pending.append((sha, self._prefix + key, args, future))
+        if len(self._pending) == 1:
+            # Callers arriving before this task runs join the same pipeline.
+            task = loop.create_task(self._flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        return await future
+
+    async def _flush(self) -> None:
+        batch, self._pending = self._pending, []
+        try:
+            results = await self._execute(batch)
+            missing = [index for index, result in enumerate(results) if self._is_noscript(result)]
+            if missing:
+                # Only the NOSCRIPT calls are replayed: the others already ran and charged
+                # their key, so sending them again would count those requests twice.
+                for sha in {batch[index][0] for index in missing}:
+                    await self._client.script_load(SCRIPTS[sha])
+                replayed = await self._execute([batch[index] for index in missing])
+                for index, result in zip(missing, replayed, strict=True):
+                    results[index] = result
+        except Exception as exc:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(RateLimitBackendError(repr(exc)))
+            return
+
+        for (*_, future), result in zip(batch, results, strict=True):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(RateLimitBackendError(repr(result)))
+                continue
+            future.set_result(result)
+
+    async def _execute(self, batch: list[_Pending]) -> list[Any]:
+        pipeline = self._client.pipeline(transaction=False)
+        for sha, key, args, _future in batch:
+            pipeline.evalsha(sha, 1, key, *args)
+        self.round_trips += 1
+        return list(await pipeline.execute(raise_on_error=False))
+
+    @staticmethod
+    def _is_noscript(result: object) -> bool:
+        # redis-py raises NoScriptError and strips the "NOSCRIPT" prefix from the message.
+        return isinstance(result, Exception) and (
+            type(result).__name__ == "NoScriptError" or str(result).startswith("NOSCRIPT")
+        )
@@ -0,0 +1,162 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from app.rate_limit import RateLimitBackend, decode_counter
+
+_MAGIC = b"AIGWRL01"
+_HEADER = struct.Struct("<8sQ")
+_SLOT = struct.Struct("<Qd")
+_BUCKET_SLOTS = 8
+
+
+class SharedMemoryRateLimitBackend(RateLimitBackend):
+    """GCRA state in a memory-mapped table shared by every worker on the host.
+
+    The table is a fixed set of 8-slot buckets of ``(key hash, arrival time)``; a new key
+    takes an empty or refilled slot and otherwise evicts its bucket's oldest entry, so the
+    file never grows. Buckets are guarded by ``fcntl`` byte-range locks (between
+    processes) plus thread locks (within one), striped across ``stripes``.
+    """
+
+    name = "shared_memory"
+
+    def __init__(self, path: str, *, slots: int, stripes: int = 256) -> None:
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._buckets = self._initialise(max(1, math.ceil(slots / _BUCKET_SLOTS)))
+        size = _HEADER.size + self._buckets * _BUCKET_SLOTS * _SLOT.size
+        self._map = mmap.mmap(self._fd, size)
+        self._stripes = max(1, stripes)
+        self._thread_locks = [threading.Lock() for _ in range(self._stripes)]
+        self._evicted_capacity = 0
+
+    async def check(self, key: str, limit: int, period_seconds: int) -> tuple[bool, int]:
+        return self.allow(key, limit, period_seconds)
+
+    def allow(self, key: str, limit: int, period_seconds: int) -> tuple[bool, int]:
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+        key_hash = digest or 1
+        bucket = key_hash % self._buckets
+        stripe = bucket % self._stripes
+        interval = period_seconds / (limit if limit > 0 else 1)
+
+        with self._thread_locks[stripe]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                now = time.time()
+                offset, tat = self._find_slot(bucket, key_hash, now)
+                if tat < now:
+                    tat = now
+                wait = tat + interval - period_seconds - now
+                if wait > 0:
+                    return False, max(1, math.ceil(wait))
+                _SLOT.pack_into(self._map, offset, key_hash, tat + interval)
+                return True, 0
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+
+    async def charge(
+        self, key: str, cost: float, limit: int, period_seconds: int, *, force: bool = False
+    ) -> tuple[bool, int, float]:
+        interval = period_seconds / (limit if limit > 0 else 1)
+        with self._locked_slot(key) as (offset, key_hash, tat, now):
+            if tat < now:
+                tat = now
+            if not force:
+                wait = tat + cost * interval - period_seconds - now
+                if wait > 0 and tat > now:
+                    return False, max(1, math.ceil(wait)), tat - now
+            tat = max(now, tat + cost * interval)
+            _SLOT.pack_into(self._map, offset, key_hash, tat)
+            return True, 0, tat - now
+
+    async def count(
+        self, key: str, amount: int, limit: int, expires_at: float, *, force: bool = False
+    ) -> tuple[bool, int]:
+        with self._locked_slot(key) as (offset, key_hash, stored, _now):
+            total = decode_counter(stored, expires_at)
+            updated = max(0, total + amount)
+            if not force and 0 < limit < updated and amount > 0:
+                return False, total
+            _SLOT.pack_into(self._map, offset, key_hash, expires_at + updated)
+            return True, updated
+
+    def snapshot(self) -> dict[str, object]:
+        return {
+            "slots": self._buckets * _BUCKET_SLOTS,
+            "evicted_capacity": self._evicted_capacity,
+        }
+
+    def reset(self) -> None:
+        for stripe in range(self._stripes):
+            self._thread_locks[stripe].acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            self._map[_HEADER.size :] = bytes(len(self._map) - _HEADER.size)
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+            self._evicted_capacity = 0
+        finally:
+            for lock in self._thread_locks:
+                lock.release()
+
+    async def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+    def _initialise(self, buckets: int) -> int:
+        """Size a new table, or adopt the bucket count another worker already chose."""
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, _HEADER.size, 0)
+            if len(header) == _HEADER.size:
+                magic, existing = _HEADER.unpack(header)
+                if magic == _MAGIC and existing > 0:
+                    return int(existing)
+            size = _HEADER.size + buckets * _BUCKET_SLOTS * _SLOT.size
+            os.ftruncate(self._fd, size)
+            os.pwrite(self._fd, _HEADER.pack(_MAGIC, buckets), 0)
+            return buckets
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _locked_slot(self, key: str) -> Iterator[tuple[int, int, float, float]]:
+        """Lock ``key``'s bucket; yields its slot offset, key hash, stored value and now."""
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+        key_hash = digest or 1
+        bucket = key_hash % self._buckets
+        stripe = bucket % self._stripes
+        with self._thread_locks[stripe]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                now = time.time()
+                offset, stored = self._find_slot(bucket, key_hash, now)
+                yield offset, key_hash, stored, now
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+
+    def _find_slot(self, bucket: int, key_hash: int, now: float) -> tuple[int, float]:
+        """Return the slot offset for ``key_hash`` and its stored arrival time."""
+        start = _HEADER.size + bucket * _BUCKET_SLOTS * _SLOT.size
+        reusable: int | None = None
+        oldest_offset, oldest_tat = start, math.inf
+        for index in range(_BUCKET_SLOTS):
+            offset = start + index * _SLOT.size
+            slot_hash, tat = _SLOT.unpack_from(self._map, offset)
+            if slot_hash == key_hash:
+                return offset, tat
+            if reusable is None and (slot_hash == 0 or tat <= now):
+                reusable = offset
+            if tat < oldest_tat:
+                oldest_offset, oldest_tat = offset, tat
+        if reusable is not None:
+            return reusable, now
+        self._evicted_capacity += 1
+        return oldest_offset, now
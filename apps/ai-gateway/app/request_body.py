@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.metrics import metrics
+
+BODY_DIGEST_STATE_KEY = "body_sha256"
+
+
+def _header(scope: Scope, name: bytes) -> bytes | None:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return bytes(value)
+    return None
+
+
+def body_limit_for(path: str) -> int:
+    """Maximum request body size for ``path``; 0 or less means unlimited."""
+    return settings.request_body_route_max_bytes.get(path, settings.request_body_max_bytes)
+
+
+def _rejection(reason: str, status_code: int, detail: str) -> HTTPException:
+    metrics.increment("request_body_rejected_total", reason=reason)
+    # The rest of the body is left unread, so the connection cannot be reused.
+    return HTTPException(status_code=status_code, detail=detail, headers={"Connection": "close"})
+
+
+class BodyLimitMiddleware:
+    """Reject oversized or slow request bodies before anything buffers or parses them.
+
+    A declared ``Content-Length`` over the route's limit is answered with 413 without
+    reading the body. Otherwise ``receive`` counts bytes as they arrive and gives the
+    whole body ``settings.request_body_timeout_seconds`` to finish; crossing either
+    limit raises a 413 or 408 ``HTTPException`` from inside the app's first body read,
+    which is before authentication hashes it or pydantic parses it.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = body_limit_for(scope["path"])
+        declared = _header(scope, b"content-length")
+        if limit > 0 and declared is not None and declared.isdigit() and int(declared) > limit:
+            exc = _rejection("too_large", 413, "Request body too large")
+            response = JSONResponse(
+                {"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers
+            )
+            await response(scope, receive, send)
+            return
+
+        timeout = settings.request_body_timeout_seconds
+        deadline = asyncio.get_running_loop().time() + timeout if timeout > 0 else None
+        received = 0
+        complete = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, complete
+            if complete or deadline is None:
+                message = await receive()
+            else:
+                try:
+                    async with asyncio.timeout_at(deadline):
+                        message = await receive()
+                except TimeoutError:
+                    raise _rejection("timeout", 408, "Request body read timed out") from None
+            if message["type"] == "http.request" and not complete:
+                received += len(message.get("body", b""))
+                if limit > 0 and received > limit:
+                    raise _rejection("too_large", 413, "Request body too large")
+                complete = not message.get("more_body", False)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class BodyDigestMiddleware:
+    """Hash signed request bodies chunk by chunk as the app receives them.
+
+    The SHA-256 digest lands in ``request.state`` once the final chunk has been read, so
+    HMAC verification reuses the body FastAPI already buffered for parsing instead of
+    hashing it again. Only requests carrying ``X-Service-Signature`` are hashed.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or _header(scope, b"x-service-signature") is None:
+            await self.app(scope, receive, send)
+            return
+
+        hasher = hashlib.sha256()
+        state = scope.setdefault("state", {})
+
+        async def hashing_receive() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                hasher.update(message.get("body", b""))
+                if not message.get("more_body", False):
+                    state[BODY_DIGEST_STATE_KEY] = hasher.hexdigest()
+            return message
+
+        await self.app(scope, hashing_receive, send)
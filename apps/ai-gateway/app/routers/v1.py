@@ -1,16 +1,49 @@
+import asyncio
 import json
 import logging
-from collections.abc import AsyncGenerator
+import time
+from collections.abc import AsyncGenerator, Iterator
+from contextlib import aclosing, contextmanager
 from datetime import UTC, datetime
 
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import StreamingResponse
-
+from pydantic import ValidationError
+
+from app import fast_json
+from app.adaptive_limit import adaptive_limits
+from app.admission import (
+    AdmissionRejected,
+    AdmissionTicket,
+    Priority,
+    admission,
+    resolve_priority,
+)
 from app.auth import ServicePrincipal, verify_service_token
+from app.concurrency import KeyedSemaphore
 from app.config import settings
-from app.models.generate import GenerateRequest, GenerateResponseModel
-from app.prompts.system_prompts import SYSTEM_PROMPTS
-from app.providers.base import BaseProvider, ProviderError
+from app.conversations import Conversation, ConversationBusyError, conversations
+from app.deadlines import current_deadline
+from app.fast_json import FastJSONResponse
+from app.jobs import JobQueueFullError, JobRecord, job_manager
+from app.metrics import metrics
+from app.models.conversations import ConversationMessageModel, ConversationResponseModel
+from app.models.generate import GenerateBatchRequest, GenerateRequest, GenerateResponseModel
+from app.models.jobs import JobResponseModel
+from app.nonce_store import replay_guard
+from app.prompts.templates import TemplateVariableError, prompt_templates
+from app.proto_wire import (
+    PROTOBUF_MEDIA_TYPE,
+    ProtobufResponse,
+    accepts_protobuf,
+    decode_generate_request,
+    encode_generate_response,
+    is_protobuf,
+    protobuf_stream,
+)
+from app.providers.base import BaseProvider, ProviderError, Usage
+from app.providers.deadlines import StreamDeadlineError, guard_stream
 from app.providers.registry import registry
 from app.rate_limit import rate_limiter
 from app.safety import (
@@ -21,12 +54,59 @@ from app.safety import (
     SafetyPipeline,
     SafetyResult,
 )
+from app.stream_sessions import (
+    DisconnectAwareStreamingResponse,
+    StreamSession,
+    stream_sessions,
+    token_payload,
+)
+from app.token_budget import (
+    TokenBudgetExceeded,
+    TokenReservation,
+    estimate_tokens,
+    token_budget,
+)
 
 logger = logging.getLogger("ai-gateway.v1")
 safety_logger = logging.getLogger("ai-gateway.safety")
 
 router = APIRouter(prefix="/v1")
 
+batch_tenant_slots = KeyedSemaphore()
+batch_provider_slots = KeyedSemaphore()
+
+SAFETY_REJECTED_PAYLOAD = fast_json.dumps({"error": "Generated content did not pass safety review"})
+INTERNAL_ERROR_PAYLOAD = fast_json.dumps({"error": "Internal server error"})
+STREAM_CANCELLED_PAYLOAD = fast_json.dumps({"error": "Stream cancelled: client disconnected"})
+
+STREAM_ROUTE = "/v1/generate_stream"
+
+GENERATE_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": GenerateRequest.model_json_schema()},
+            PROTOBUF_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+        },
+    }
+}
+
+
+async def generate_request_body(request: Request) -> GenerateRequest:
+    """Parse a ``GenerateRequest`` body sent as JSON or, by ``Content-Type``, protobuf."""
+    body = await request.body()
+    try:
+        if is_protobuf(request.headers.get("content-type")):
+            return decode_generate_request(body)
+        return GenerateRequest.model_validate_json(body)
+    except ValueError as exc:
+        if not isinstance(exc, ValidationError):
+            raise HTTPException(status_code=400, detail=str(exc)) from None
+        errors = exc.errors(include_url=False)
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in errors]
+        ) from None
+
 
 def create_safety_pipeline(safety_level: str = "strict") -> SafetyPipeline:
     pipeline = SafetyPipeline()
@@ -39,6 +119,11 @@ def create_safety_pipeline(safety_level: str = "strict") -> SafetyPipeline:
 default_pipeline = create_safety_pipeline("strict")
 
 
+def resolve_safety_level(request: GenerateRequest) -> str:
+    context = request.context or {}
+    return str(context.get("safety_level", "strict"))
+
+
 def log_safety_event(request: GenerateRequest, result: SafetyResult, direction: str) -> None:
     context = request.context or {}
     event = {
@@ -62,15 +147,166 @@ def resolve_provider(provider_name: str) -> BaseProvider:
         raise HTTPException(status_code=400, detail=str(exc)) from None
 
 
-def apply_rate_limit(
+def resolve_system_prompt(request: GenerateRequest) -> tuple[str | None, bool]:
+    """Return the system prompt and whether it is a static, cacheable prefix."""
+    if request.system_prompt:
+        return request.system_prompt, False
+    if request.task_type:
+        static_prompt = prompt_templates.system_prompt(request.task_type)
+        return static_prompt, static_prompt is not None
+    return None, False
+
+
+def render_system_context(request: GenerateRequest) -> str | None:
+    """Render the ``task_type`` template's variables from ``context``.
+
+    The result is sent after the static system prompt, which stays a cacheable prefix.
+    Requests that bring their own ``system_prompt`` are not templated.
+    """
+    if request.system_prompt or not request.task_type:
+        return None
+    try:
+        return prompt_templates.render(request.task_type, request.context or {})
+    except TemplateVariableError as exc:
+        raise HTTPException(
+            status_code=422, detail={"error": "invalid_template_variable", "detail": str(exc)}
+        ) from None
+
+
+def record_prompt_cache_usage(request: GenerateRequest, usage: Usage) -> None:
+    if request.task_type and not request.system_prompt:
+        prompt_templates.record_usage(request.task_type, usage.prompt_tokens, usage.cached_tokens)
+
+
+def principal_key(principal: ServicePrincipal) -> str:
+    return f"{principal.token_fingerprint}:{principal.tenant_id or 'unknown'}"
+
+
+async def reserve_token_budget(
+    request: GenerateRequest, owner: str, conversation: Conversation | None = None
+) -> TokenReservation:
+    """Hold the request's estimated prompt plus ``max_tokens`` against the tenant budget."""
+    system_prompt, _cacheable = resolve_system_prompt(request)
+    tokens = estimate_tokens(request.prompt) + estimate_tokens(system_prompt) + request.max_tokens
+    if conversation is not None:
+        tokens += conversation.history_tokens
+    try:
+        return await token_budget.reserve(owner, owner.partition(":")[2], tokens)
+    except TokenBudgetExceeded as exc:
+        raise HTTPException(status_code=429, detail=exc.message, headers=exc.headers) from None
+
+
+def checkout_conversation(request: GenerateRequest, owner: str) -> Conversation | None:
+    """Claim the request's conversation for this turn, if it names one."""
+    if request.conversation_id is None:
+        return None
+    try:
+        conversation = conversations.checkout(request.conversation_id, owner)
+    except ConversationBusyError:
+        raise HTTPException(
+            status_code=409, detail="Conversation already has a turn in progress"
+        ) from None
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conversation
+
+
+@contextmanager
+def conversation_turn(request: GenerateRequest, owner: str) -> Iterator[Conversation | None]:
+    conversation = checkout_conversation(request, owner)
+    try:
+        yield conversation
+    finally:
+        if conversation is not None:
+            conversations.release(conversation)
+
+
+def check_input_safety(
+    request: GenerateRequest,
+    pipeline: SafetyPipeline,
+    safety_level: str,
+    conversation: Conversation | None,
+    system_context: str | None = None,
+) -> None:
+    """Raise 422 unless the prompt, template context and stored history pass ``pipeline``.
+
+    Stored messages remember the safety levels they passed, so a turn only scans its
+    new prompt, plus the history once whenever the conversation moves to a new level.
+    """
+    if conversation is not None:
+        pending = conversation.unverified(safety_level)
+        metrics.increment(
+            "conversation_safety_cached_messages_total", len(conversation.turns) - len(pending)
+        )
+        for turn in pending:
+            direction = "input" if turn.message.role == "user" else "output"
+            if direction == "input":
+                history_result = pipeline.check_input(turn.message.content)
+            else:
+                history_result = pipeline.check_output(turn.message.content)
+            if not history_result.passed:
+                log_safety_event(request, history_result, direction=direction)
+                raise HTTPException(
+                    status_code=422,
+                    detail={
+                        "error": "content_safety",
+                        "category": history_result.category.value
+                        if history_result.category
+                        else None,
+                        "detail": "Conversation history did not pass safety review",
+                    },
+                )
+            turn.verified_levels.add(safety_level)
+
+    if system_context is not None:
+        context_result = pipeline.check_input(system_context)
+        if not context_result.passed:
+            log_safety_event(request, context_result, direction="input")
+            raise HTTPException(
+                status_code=422,
+                detail={
+                    "error": "content_safety",
+                    "category": context_result.category.value if context_result.category else None,
+                    "detail": context_result.detail,
+                },
+            )
+
+    input_result = pipeline.check_input(request.prompt)
+    if not input_result.passed:
+        log_safety_event(request, input_result, direction="input")
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "error": "content_safety",
+                "category": input_result.category.value if input_result.category else None,
+                "detail": input_result.detail,
+            },
+        )
+
+
+async def apply_rate_limit(
     *,
     request: Request,
     principal: ServicePrincipal,
     per_minute_limit: int,
 ) -> None:
+    await check_rate_limit(
+        principal=principal, path=request.url.path, per_minute_limit=per_minute_limit
+    )
+
+
+async def check_rate_limit(
+    *,
+    principal: ServicePrincipal,
+    path: str,
+    per_minute_limit: int,
+) -> None:
+    """Charge one request against ``path``'s per-minute limit for the caller."""
     tenant_id = principal.tenant_id or "unknown"
-    key = f"{principal.token_fingerprint}:{tenant_id}:{request.url.path}"
-    allowed, retry_after = rate_limiter.allow(key=key, limit=per_minute_limit, period_seconds=60)
+    key = f"{principal.token_fingerprint}:{tenant_id}:{path}"
+    allowed, retry_after = await rate_limiter.allow(
+        key=key, limit=per_minute_limit, period_seconds=60
+    )
     if allowed:
         return
 
@@ -85,7 +321,7 @@ async def require_generate_access(
     request: Request,
     principal: ServicePrincipal = Depends(verify_service_token),  # noqa: B008
 ) -> ServicePrincipal:
-    apply_rate_limit(
+    await apply_rate_limit(
         request=request,
         principal=principal,
         per_minute_limit=settings.rate_limit_generate_per_minute,
@@ -97,7 +333,7 @@ async def require_stream_access(
     request: Request,
     principal: ServicePrincipal = Depends(verify_service_token),  # noqa: B008
 ) -> ServicePrincipal:
-    apply_rate_limit(
+    await apply_rate_limit(
         request=request,
         principal=principal,
         per_minute_limit=settings.rate_limit_stream_per_minute,
@@ -105,8 +341,10 @@ async def require_stream_access(
     return principal
 
 
-@router.get("/health", dependencies=[Depends(verify_service_token)])
-async def health() -> dict[str, object]:
+@router.get(
+    "/health", dependencies=[Depends(verify_service_token)], response_class=FastJSONResponse
+)
+async def health() -> FastJSONResponse:
     configured_providers: list[str] = []
     if settings.openai_api_key.strip():
         configured_providers.append("openai")
@@ -114,49 +352,114 @@ async def health() -> dict[str, object]:
         configured_providers.append("anthropic")
 
     status = "ok" if configured_providers else "degraded"
+    return FastJSONResponse(
+        {
+            "status": status,
+            "version": "1.0.0",
+            "timestamp": datetime.now(UTC).isoformat(),
+            "checks": {
+                "providers": "ok" if configured_providers else "degraded",
+            },
+            "providers_configured": configured_providers,
+        }
+    )
+
+
+@router.get("/metrics", dependencies=[Depends(verify_service_token)])
+async def get_metrics() -> dict[str, object]:
     return {
-        "status": status,
-        "version": "1.0.0",
-        "timestamp": datetime.now(UTC).isoformat(),
-        "checks": {
-            "providers": "ok" if configured_providers else "degraded",
-        },
-        "providers_configured": configured_providers,
+        "admission": admission.snapshot(),
+        "adaptive_limits": adaptive_limits.snapshot(),
+        "rate_limit": rate_limiter.snapshot(),
+        "auth_nonces": replay_guard.snapshot(),
+        "token_budget": token_budget.snapshot(),
+        "conversations": conversations.snapshot(),
+        "prompt_templates": prompt_templates.snapshot(),
+        **metrics.snapshot(),
     }
 
 
-@router.get("/providers", dependencies=[Depends(verify_service_token)])
-async def list_providers() -> list[dict[str, object]]:
-    return registry.list_providers()
+@router.get(
+    "/providers", dependencies=[Depends(verify_service_token)], response_class=FastJSONResponse
+)
+async def list_providers() -> FastJSONResponse:
+    return FastJSONResponse(registry.list_providers())
 
 
-@router.post("/generate")
-async def generate(
+async def require_jobs_access(
+    request: Request,
+    principal: ServicePrincipal = Depends(verify_service_token),  # noqa: B008
+) -> ServicePrincipal:
+    await apply_rate_limit(
+        request=request,
+        principal=principal,
+        per_minute_limit=settings.rate_limit_jobs_per_minute,
+    )
+    return principal
+
+
+async def require_batch_access(
+    request: Request,
+    principal: ServicePrincipal = Depends(verify_service_token),  # noqa: B008
+) -> ServicePrincipal:
+    await apply_rate_limit(
+        request=request,
+        principal=principal,
+        per_minute_limit=settings.rate_limit_batch_per_minute,
+    )
+    return principal
+
+
+async def acquire_upstream_slot(
+    request: GenerateRequest, default_priority: Priority
+) -> AdmissionTicket:
+    priority = resolve_priority(request.context, request.task_type, default_priority)
+    deadline = time.monotonic() + settings.admission_max_wait_seconds
+    request_deadline = current_deadline()
+    if request_deadline is not None:
+        if request_deadline.expired:
+            # The caller gave up while this request was queued behind batch or tenant slots.
+            raise request_deadline.exceeded("admission")
+        deadline = min(deadline, request_deadline.expires_at)
+    try:
+        return await admission.acquire(
+            request.provider, request.model, priority=priority, deadline=deadline
+        )
+    except AdmissionRejected as exc:
+        if (
+            request_deadline is not None
+            and deadline == request_deadline.expires_at
+            and exc.reason in ("deadline", "timeout")
+        ):
+            raise request_deadline.exceeded("admission") from None
+        raise HTTPException(
+            status_code=503,
+            detail=exc.message,
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from None
+
+
+async def run_generation(
     request: GenerateRequest,
-    _principal: ServicePrincipal = Depends(require_generate_access),  # noqa: B008
+    default_priority: Priority = Priority.STANDARD,
+    reservation: TokenReservation | None = None,
+    conversation: Conversation | None = None,
 ) -> GenerateResponseModel:
-    context = request.context or {}
-    safety_level = str(context.get("safety_level", "strict"))
-    pipeline = create_safety_pipeline(safety_level)
+    """Safety-check, generate and review a single request, raising HTTPException on failure.
 
-    input_result = pipeline.check_input(request.prompt)
-    if not input_result.passed:
-        log_safety_event(request, input_result, direction="input")
-        raise HTTPException(
-            status_code=422,
-            detail={
-                "error": "content_safety",
-                "category": input_result.category.value if input_result.category else None,
-                "detail": input_result.detail,
-            },
-        )
+    With a ``conversation`` checked out for this turn, its history is sent ahead of the
+    prompt and the completed turn is appended to it.
+    """
+    safety_level = resolve_safety_level(request)
+    pipeline = create_safety_pipeline(safety_level)
+    system_context = render_system_context(request)
+    check_input_safety(request, pipeline, safety_level, conversation, system_context)
 
     provider = resolve_provider(request.provider)
 
-    system_prompt = request.system_prompt
-    if not system_prompt and request.task_type:
-        system_prompt = SYSTEM_PROMPTS.get(request.task_type)
+    system_prompt, cache_system_prompt = resolve_system_prompt(request)
 
+    ticket = await acquire_upstream_slot(request, default_priority)
     try:
         result = await provider.generate(
             prompt=request.prompt,
@@ -164,9 +467,23 @@ async def generate(
             temperature=request.temperature,
             max_tokens=request.max_tokens,
             system_prompt=system_prompt,
+            cache_system_prompt=cache_system_prompt,
+            system_context=system_context,
+            history=conversation.history() if conversation is not None else (),
         )
     except ProviderError as exc:
-        raise HTTPException(status_code=exc.status_code, detail=exc.message) from None
+        request_deadline = current_deadline()
+        if request_deadline is not None and request_deadline.expired:
+            raise request_deadline.exceeded("upstream") from None
+        headers = {"Retry-After": str(max(1, round(exc.retry_after)))} if exc.retry_after else None
+        raise HTTPException(
+            status_code=exc.status_code, detail=exc.message, headers=headers
+        ) from None
+    finally:
+        ticket.release()
+    if reservation is not None:
+        await reservation.settle(result.usage.total_tokens)
+    record_prompt_cache_usage(request, result.usage)
 
     response_text = result.content
     output_result = pipeline.check_output(response_text)
@@ -187,6 +504,8 @@ async def generate(
                 },
             )
 
+    if conversation is not None:
+        conversations.append(conversation, request.prompt, response_text, safety_level)
     return GenerateResponseModel(
         content=response_text,
         model=result.model,
@@ -194,48 +513,148 @@ async def generate(
         usage=result.usage.model_dump(),
         finish_reason=result.finish_reason,
         task_type=request.task_type,
+        queue_time_ms=ticket.queue_time_ms,
     )
 
 
-@router.post("/generate_stream")
-async def generate_stream(
-    request: GenerateRequest,
-    _principal: ServicePrincipal = Depends(require_stream_access),  # noqa: B008
-) -> StreamingResponse:
-    context = request.context or {}
-    safety_level = str(context.get("safety_level", "strict"))
-    pipeline = create_safety_pipeline(safety_level)
+async def run_job(request: GenerateRequest, owner: str) -> GenerateResponseModel:
+    with conversation_turn(request, owner) as conversation:
+        reservation = await reserve_token_budget(request, owner, conversation)
+        try:
+            return await run_generation(
+                request,
+                default_priority=Priority.BATCH,
+                reservation=reservation,
+                conversation=conversation,
+            )
+        finally:
+            await reservation.release()
 
-    input_result = pipeline.check_input(request.prompt)
-    if not input_result.passed:
-        log_safety_event(request, input_result, direction="input")
+
+@router.post(
+    "/generate",
+    response_model=GenerateResponseModel,
+    response_class=FastJSONResponse,
+    openapi_extra=GENERATE_REQUEST_BODY,
+)
+async def generate(
+    http_request: Request,
+    # Declared first: FastAPI resolves dependencies in order, so callers are authenticated
+    # and rate limited before their body is parsed.
+    principal: ServicePrincipal = Depends(require_generate_access),  # noqa: B008
+    request: GenerateRequest = Depends(generate_request_body),  # noqa: B008
+) -> FastJSONResponse | ProtobufResponse:
+    owner = principal_key(principal)
+    with conversation_turn(request, owner) as conversation:
+        reservation = await reserve_token_budget(request, owner, conversation)
+        try:
+            result = await run_generation(
+                request, reservation=reservation, conversation=conversation
+            )
+        finally:
+            await reservation.release()
+    if accepts_protobuf(http_request.headers.get("accept")):
+        return ProtobufResponse(encode_generate_response(result), headers=reservation.headers())
+    return FastJSONResponse(result.model_dump(mode="json"), headers=reservation.headers())
+
+
+async def run_batch_item(
+    index: int, item: GenerateRequest, principal: ServicePrincipal
+) -> dict[str, object]:
+    tenant_slots = batch_tenant_slots.hold(
+        principal.tenant_id or "unknown", settings.batch_concurrency_per_tenant
+    )
+    provider_slots = batch_provider_slots.hold(
+        item.provider, settings.batch_concurrency_per_provider
+    )
+    owner = principal_key(principal)
+    try:
+        with conversation_turn(item, owner) as conversation:
+            reservation = await reserve_token_budget(item, owner, conversation)
+            try:
+                async with tenant_slots, provider_slots:
+                    result = await run_generation(
+                        item,
+                        default_priority=Priority.BATCH,
+                        reservation=reservation,
+                        conversation=conversation,
+                    )
+            finally:
+                await reservation.release()
+    except HTTPException as exc:
+        return {"index": index, "status": exc.status_code, "error": exc.detail}
+    except Exception:
+        logger.exception("Unhandled exception in /v1/generate_batch item %s", index)
+        return {"index": index, "status": 500, "error": "Internal server error"}
+
+    return {"index": index, "status": 200, "result": result.model_dump(mode="json")}
+
+
+@router.post("/generate_batch")
+async def generate_batch(
+    batch: GenerateBatchRequest,
+    principal: ServicePrincipal = Depends(require_batch_access),  # noqa: B008
+) -> StreamingResponse:
+    if len(batch.items) > settings.batch_max_items:
         raise HTTPException(
             status_code=422,
-            detail={
-                "error": "content_safety",
-                "category": input_result.category.value if input_result.category else None,
-                "detail": input_result.detail,
-            },
+            detail=f"Batch exceeds maximum of {settings.batch_max_items} items",
         )
 
-    provider = resolve_provider(request.provider)
+    async def ndjson_generator() -> AsyncGenerator[bytes, None]:
+        tasks = [
+            asyncio.create_task(run_batch_item(index, item, principal))
+            for index, item in enumerate(batch.items)
+        ]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                yield fast_json.dumps(await completed) + b"\n"
+        finally:
+            for task in tasks:
+                task.cancel()
 
-    system_prompt = request.system_prompt
-    if not system_prompt and request.task_type:
-        system_prompt = SYSTEM_PROMPTS.get(request.task_type)
+    return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson")
 
-    async def event_generator() -> AsyncGenerator[str, None]:
-        try:
-            pii_filter = PIIFilter()
-            async for chunk in provider.stream(
+
+async def produce_stream(
+    session: StreamSession,
+    *,
+    provider: BaseProvider,
+    request: GenerateRequest,
+    pipeline: SafetyPipeline,
+    system_prompt: str | None,
+    cache_system_prompt: bool,
+    system_context: str | None,
+    ticket: AdmissionTicket,
+    reservation: TokenReservation,
+    conversation: Conversation | None = None,
+) -> None:
+    streamed_tokens = 0
+    try:
+        pii_filter = PIIFilter()
+        history = conversation.history() if conversation is not None else ()
+        reply: list[str] = []
+        upstream = guard_stream(
+            lambda: provider.stream(
                 prompt=request.prompt,
                 model=request.model,
                 temperature=request.temperature,
                 max_tokens=request.max_tokens,
                 system_prompt=system_prompt,
-            ):
+                cache_system_prompt=cache_system_prompt,
+                system_context=system_context,
+                history=history,
+            ),
+            provider=provider.name,
+            model=request.model,
+        )
+        # aclosing() closes the provider's upstream HTTP stream even if cancellation lands
+        # while this coroutine, rather than the provider generator, is suspended.
+        async with aclosing(upstream):
+            async for chunk in upstream:
                 if not chunk.done:
                     token = chunk.content
+                    streamed_tokens += estimate_tokens(token)
                     output_result = pipeline.check_output(token)
                     if not output_result.passed:
                         if output_result.category == SafetyCategory.PII:
@@ -243,27 +662,249 @@ async def generate_stream(
                             log_safety_event(request, output_result, direction="output")
                         else:
                             log_safety_event(request, output_result, direction="output")
-                            yield "data: " + json.dumps(
-                                {"error": "Generated content did not pass safety review"}
-                            ) + "\n\n"
+                            session.publish(SAFETY_REJECTED_PAYLOAD)
                             return
 
-                    data = {"content": token, "done": False}
-                    yield "data: " + json.dumps(data) + "\n\n"
+                    await session.writable()
+                    session.publish(token_payload(token))
+                    if conversation is not None:
+                        reply.append(token)
                     continue
 
-                if chunk.done:
-                    data = {
-                        "content": chunk.content,
-                        "done": True,
-                        "usage": chunk.usage.model_dump() if chunk.usage else None,
-                        "finish_reason": "stop",
-                    }
-                yield "data: " + json.dumps(data) + "\n\n"
-        except ProviderError as exc:
-            yield "data: " + json.dumps({"error": exc.message}) + "\n\n"
-        except Exception:
-            logger.exception("Unhandled streaming exception in /v1/generate_stream")
-            yield "data: " + json.dumps({"error": "Internal server error"}) + "\n\n"
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+                if chunk.usage is not None:
+                    await reservation.settle(chunk.usage.total_tokens)
+                    record_prompt_cache_usage(request, chunk.usage)
+                data = {
+                    "content": chunk.content,
+                    "done": True,
+                    "usage": chunk.usage.model_dump() if chunk.usage else None,
+                    "finish_reason": "stop",
+                    "queue_time_ms": ticket.queue_time_ms,
+                }
+                session.publish(fast_json.dumps(data))
+                if conversation is not None:
+                    reply.append(chunk.content)
+                    conversations.append(
+                        conversation,
+                        request.prompt,
+                        "".join(reply),
+                        resolve_safety_level(request),
+                    )
+    except StreamDeadlineError as exc:
+        request_deadline = current_deadline()
+        if request_deadline is not None and request_deadline.expired:
+            request_deadline.miss("upstream")
+        session.publish(fast_json.dumps({"error": exc.message, "code": exc.code}))
+    except ProviderError as exc:
+        session.publish(fast_json.dumps({"error": exc.message}))
+    except asyncio.CancelledError:
+        if session.cancelled:
+            metrics.increment("stream_cancelled_total", reason=session.cancel_reason)
+            # Upper bound: the generation could have run on to max_tokens.
+            metrics.increment(
+                "stream_cancelled_tokens_saved_total",
+                max(request.max_tokens - streamed_tokens, 0),
+            )
+            session.publish(STREAM_CANCELLED_PAYLOAD)
+        raise
+    except Exception:
+        logger.exception("Unhandled streaming exception in /v1/generate_stream")
+        session.publish(INTERNAL_ERROR_PAYLOAD)
+    finally:
+        ticket.release()
+        try:
+            if streamed_tokens:
+                # No usage reported (or the stream broke off): charge what was visibly
+                # produced.
+                await reservation.settle(reservation.tokens - request.max_tokens + streamed_tokens)
+            await reservation.release()
+        finally:
+            if conversation is not None:
+                conversations.release(conversation)
+            session.finish()
+
+
+def stream_response(
+    session: StreamSession, after_seq: int, *, resumed: bool, protobuf: bool = False
+) -> StreamingResponse:
+    frames = session.subscribe(after_seq)
+    return DisconnectAwareStreamingResponse(
+        protobuf_stream(frames) if protobuf else frames,
+        media_type=PROTOBUF_MEDIA_TYPE if protobuf else "text/event-stream",
+        headers={
+            "X-Stream-ID": session.stream_id,
+            "X-Stream-Resumed": "true" if resumed else "false",
+        },
+    )
+
+
+async def open_stream(
+    request: GenerateRequest, owner: str
+) -> tuple[StreamSession, TokenReservation]:
+    """Safety-check ``request``, admit it and start its producer in a new stream session.
+
+    Shared by the SSE and WebSocket transports; raises HTTPException when the request is
+    rejected. A conversation named by the request stays checked out until the producer
+    finishes.
+    """
+    safety_level = resolve_safety_level(request)
+    pipeline = create_safety_pipeline(safety_level)
+
+    conversation = checkout_conversation(request, owner)
+    try:
+        system_context = render_system_context(request)
+        check_input_safety(request, pipeline, safety_level, conversation, system_context)
+
+        provider = resolve_provider(request.provider)
+
+        system_prompt, cache_system_prompt = resolve_system_prompt(request)
+
+        reservation = await reserve_token_budget(request, owner, conversation)
+        try:
+            ticket = await acquire_upstream_slot(request, Priority.INTERACTIVE)
+        except BaseException:
+            await reservation.release()
+            raise
+    except BaseException:
+        if conversation is not None:
+            conversations.release(conversation)
+        raise
+    session = stream_sessions.create(owner)
+    session.start(
+        produce_stream(
+            session,
+            provider=provider,
+            request=request,
+            pipeline=pipeline,
+            system_prompt=system_prompt,
+            cache_system_prompt=cache_system_prompt,
+            system_context=system_context,
+            ticket=ticket,
+            reservation=reservation,
+            conversation=conversation,
+        )
+    )
+    return session, reservation
+
+
+@router.post("/generate_stream", openapi_extra=GENERATE_REQUEST_BODY)
+async def generate_stream(
+    http_request: Request,
+    # Declared first: FastAPI resolves dependencies in order, so callers are authenticated
+    # and rate limited before their body is parsed.
+    principal: ServicePrincipal = Depends(require_stream_access),  # noqa: B008
+    request: GenerateRequest = Depends(generate_request_body),  # noqa: B008
+) -> StreamingResponse:
+    owner = principal_key(principal)
+    protobuf = accepts_protobuf(http_request.headers.get("accept"))
+    last_event_id = http_request.headers.get("Last-Event-ID")
+    if last_event_id:
+        resumed = stream_sessions.resume(last_event_id, owner)
+        if resumed is not None:
+            session, after_seq = resumed
+            return stream_response(session, after_seq, resumed=True, protobuf=protobuf)
+
+    session, reservation = await open_stream(request, owner)
+    response = stream_response(session, 0, resumed=False, protobuf=protobuf)
+    response.headers.update(reservation.headers())
+    return response
+
+
+def job_response(record: JobRecord) -> JobResponseModel:
+    return JobResponseModel(
+        id=record.id,
+        status=record.status.value,
+        created_at=record.created_at,
+        updated_at=record.updated_at,
+        status_code=record.status_code,
+        result=GenerateResponseModel.model_validate_json(record.result) if record.result else None,
+        error=json.loads(record.error) if record.error else None,
+    )
+
+
+@router.post("/jobs", status_code=202)
+async def create_job(
+    request: GenerateRequest,
+    principal: ServicePrincipal = Depends(require_jobs_access),  # noqa: B008
+) -> JobResponseModel:
+    resolve_provider(request.provider)
+    try:
+        request_deadline = current_deadline()
+        record = await job_manager.submit(
+            request,
+            principal_key(principal),
+            deadline_at=request_deadline.wall_clock() if request_deadline is not None else None,
+        )
+    except JobQueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Job queue is full",
+            headers={"Retry-After": "5"},
+        ) from None
+    return job_response(record)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    wait: float = 0.0,
+    principal: ServicePrincipal = Depends(verify_service_token),  # noqa: B008
+) -> JobResponseModel:
+    owner = principal_key(principal)
+    timeout = min(max(wait, 0.0), float(settings.job_long_poll_max_seconds))
+    if timeout > 0:
+        record = await job_manager.wait(job_id, owner, timeout)
+    else:
+        record = await job_manager.get(job_id, owner)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(record)
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(
+    job_id: str,
+    principal: ServicePrincipal = Depends(verify_service_token),  # noqa: B008
+) -> JobResponseModel:
+    record = await job_manager.cancel(job_id, principal_key(principal))
+    if record is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(record)
+
+
+def conversation_response(conversation: Conversation) -> ConversationResponseModel:
+    return ConversationResponseModel(
+        id=conversation.conversation_id,
+        created_at=conversation.created_at,
+        messages=[
+            ConversationMessageModel(role=message.role, content=message.content)
+            for message in conversation.history()
+        ],
+    )
+
+
+@router.post("/conversations", status_code=201)
+async def create_conversation(
+    principal: ServicePrincipal = Depends(verify_service_token),  # noqa: B008
+) -> ConversationResponseModel:
+    return conversation_response(conversations.create(principal_key(principal)))
+
+
+@router.get("/conversations/{conversation_id}")
+async def get_conversation(
+    conversation_id: str,
+    principal: ServicePrincipal = Depends(verify_service_token),  # noqa: B008
+) -> ConversationResponseModel:
+    conversation = conversations.get(conversation_id, principal_key(principal))
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conversation_response(conversation)
+
+
+@router.delete("/conversations/{conversation_id}", status_code=204)
+async def delete_conversation(
+    conversation_id: str,
+    principal: ServicePrincipal = Depends(verify_service_token),  # noqa: B008
+) -> None:
+    if not conversations.delete(conversation_id, principal_key(principal)):
+        raise HTTPException(status_code=404, detail="Conversation not found")
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+from contextlib import aclosing
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+
+from app import fast_json
+from app.auth import ServicePrincipal, verify_websocket_token
+from app.config import settings
+from app.metrics import metrics
+from app.models.generate import GenerateRequest
+from app.models.websocket import (
+    ClientMessage,
+    StreamCancelMessage,
+    StreamCreditMessage,
+    StreamStartMessage,
+)
+from app.routers.v1 import STREAM_ROUTE, check_rate_limit, open_stream, principal_key
+from app.stream_sessions import HEARTBEAT_FRAME, StreamSession, frame_payload
+
+logger = logging.getLogger("ai-gateway.websocket")
+
+router = APIRouter(prefix="/v1")
+
+
+class _Stream:
+    """One generation multiplexed over a connection, with its flow-control credits."""
+
+    __slots__ = ("id", "key", "credits", "session", "task", "_credited")
+
+    def __init__(self, stream_id: str, credits: int) -> None:
+        self.id = stream_id
+        self.key = fast_json.dumps(stream_id)
+        self.credits = credits
+        self.session: StreamSession | None = None
+        self.task: asyncio.Task[None] | None = None
+        self._credited = asyncio.Event()
+
+    def grant(self, credits: int) -> None:
+        self.credits += credits
+        self._credited.set()
+
+    async def wait_for_credit(self) -> None:
+        while self.credits <= 0:
+            self._credited.clear()
+            await self._credited.wait()
+
+
+class StreamMultiplexer:
+    """Runs the generations a client starts over one authenticated WebSocket.
+
+    Client messages are JSON objects: ``start`` (an ``id`` chosen by the client, a
+    ``/v1/generate_stream`` request body and optional initial ``credits``), ``credit``
+    and ``cancel``. Every SSE data frame of a stream becomes one ``data`` message carrying
+    the same payload, and costs one credit; a stream without credits stops being sent,
+    and the session's backpressure policy applies as for a slow SSE client. Each stream
+    ends with an ``end`` message, or an ``error`` message if it was rejected.
+    """
+
+    def __init__(self, websocket: WebSocket, principal: ServicePrincipal) -> None:
+        self.websocket = websocket
+        self.principal = principal
+        self.owner = principal_key(principal)
+        self.streams: dict[str, _Stream] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def run(self) -> None:
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("text") or message.get("bytes") or b""
+            try:
+                parsed = ClientMessage.model_validate_json(data).root
+            except ValidationError as exc:
+                errors = exc.errors(include_url=False, include_context=False, include_input=False)
+                await self.send_error(None, 422, errors)
+                continue
+
+            if isinstance(parsed, StreamStartMessage):
+                await self.start(parsed)
+            elif isinstance(parsed, StreamCreditMessage):
+                stream = self.streams.get(parsed.id)
+                if stream is not None:
+                    stream.grant(parsed.credits)
+            elif isinstance(parsed, StreamCancelMessage):
+                await self.cancel(parsed.id)
+
+    async def start(self, message: StreamStartMessage) -> None:
+        if message.id in self.streams:
+            await self.send_error(message.id, 409, "Stream id is already in use")
+            return
+        if len(self.streams) >= settings.websocket_max_streams_per_connection:
+            await self.send_error(message.id, 429, "Too many concurrent streams on this connection")
+            return
+
+        credits = message.credits or settings.websocket_initial_credits
+        stream = _Stream(message.id, credits)
+        self.streams[message.id] = stream
+        # Admission may queue; each stream runs in its own task so the receive loop keeps
+        # handling credits and cancels for the others.
+        stream.task = asyncio.create_task(self.serve(stream, message.request))
+
+    async def cancel(self, stream_id: str) -> None:
+        stream = self.streams.pop(stream_id, None)
+        if stream is None:
+            # Already ended; the client's cancel crossed our end message.
+            return
+        self._stop(stream, "client_cancel")
+        await self.send(b'{"type":"end","id":%b,"cancelled":true}' % stream.key)
+
+    async def close(self) -> None:
+        streams = list(self.streams.values())
+        self.streams.clear()
+        for stream in streams:
+            self._stop(stream, "client_disconnect")
+        await asyncio.gather(
+            *(stream.task for stream in streams if stream.task is not None),
+            return_exceptions=True,
+        )
+
+    async def serve(self, stream: _Stream, request: GenerateRequest) -> None:
+        try:
+            try:
+                await check_rate_limit(
+                    principal=self.principal,
+                    path=STREAM_ROUTE,
+                    per_minute_limit=settings.rate_limit_stream_per_minute,
+                )
+                stream.session, _reservation = await open_stream(request, self.owner)
+            except HTTPException as exc:
+                retry_after = (exc.headers or {}).get("Retry-After")
+                await self.send_error(stream.id, exc.status_code, exc.detail, retry_after)
+                return
+            metrics.increment("websocket_streams_total")
+            await self.forward(stream, stream.session)
+        except Exception:
+            logger.exception("Unhandled exception in /v1/ws stream")
+            await self.send_error(stream.id, 500, "Internal server error")
+        finally:
+            if self.streams.get(stream.id) is stream:
+                del self.streams[stream.id]
+
+    async def forward(self, stream: _Stream, session: StreamSession) -> None:
+        prefix = b'{"type":"data","id":%b,"data":' % stream.key
+        async with aclosing(session.subscribe()) as frames:
+            async for frame in frames:
+                if frame is HEARTBEAT_FRAME:
+                    # WebSocket pings keep the connection alive.
+                    continue
+                if stream.credits <= 0:
+                    metrics.increment("websocket_credit_waits_total")
+                    await stream.wait_for_credit()
+                stream.credits -= 1
+                await self.send(prefix + frame_payload(frame) + b"}")
+        await self.send(b'{"type":"end","id":%b}' % stream.key)
+
+    async def send(self, message: bytes) -> None:
+        async with self._send_lock:
+            try:
+                await self.websocket.send({"type": "websocket.send", "text": message.decode()})
+            except (WebSocketDisconnect, RuntimeError):
+                # The client is gone; the receive loop sees the disconnect and stops every
+                # stream on the connection.
+                return
+
+    async def send_error(
+        self,
+        stream_id: str | None,
+        status_code: int,
+        detail: object,
+        retry_after: str | None = None,
+    ) -> None:
+        error: dict[str, object] = {
+            "type": "error",
+            "id": stream_id,
+            "status": status_code,
+            "detail": detail,
+        }
+        if retry_after is not None:
+            error["retry_after"] = retry_after
+        await self.send(fast_json.dumps(error))
+
+    def _stop(self, stream: _Stream, reason: str) -> None:
+        if stream.task is not None:
+            stream.task.cancel()
+        if stream.session is not None:
+            stream.session.cancel(reason)
+
+
+async def reject_handshake(websocket: WebSocket, exc: HTTPException) -> None:
+    if "websocket.http.response" in websocket.scope.get("extensions", {}):
+        await websocket.send_denial_response(
+            JSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+        )
+        return
+    await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(exc.detail))
+
+
+@router.websocket("/ws")
+async def stream_socket(websocket: WebSocket) -> None:
+    try:
+        principal = await verify_websocket_token(websocket)
+    except HTTPException as exc:
+        await reject_handshake(websocket, exc)
+        return
+
+    await websocket.accept()
+    metrics.increment("websocket_connections_total")
+    connection = StreamMultiplexer(websocket, principal)
+    try:
+        await connection.run()
+    finally:
+        await connection.close()
@@ -0,0 +1,406 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+from collections.abc import AsyncGenerator, Coroutine
+from typing import Any
+
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app import fast_json
+from app.config import settings
+from app.metrics import metrics
+
+
+def encode_frame(payload: bytes, event_id: bytes = b"") -> bytes:
+    """Build one SSE frame from an already JSON-encoded ``payload``."""
+    if event_id:
+        return b"id: %b\ndata: %b\n\n" % (event_id, payload)
+    return b"data: %b\n\n" % (payload,)
+
+
+REPLAY_GAP_FRAME = encode_frame(fast_json.dumps({"error": "Stream replay window exceeded"}))
+SLOW_CONSUMER_FRAME = encode_frame(
+    fast_json.dumps({"error": "Client is reading too slowly", "code": "slow_consumer"})
+)
+
+# An SSE comment: clients ignore it, but it keeps idle-timeout proxies from closing the stream.
+HEARTBEAT_FRAME = b": keep-alive\n\n"
+
+_TOKEN_PREFIX = b'data: {"content":'
+_TOKEN_SUFFIX = b',"done":false}\n\n'
+
+
+def token_payload(token: str) -> bytes:
+    """Encode ``{"content": token, "done": false}`` without building a dict per token."""
+    return b'{"content":%b,"done":false}' % (fast_json.dumps(token),)
+
+
+def frame_payload(frame: bytes) -> bytes:
+    """The JSON payload of an SSE frame built by :func:`encode_frame` or ``publish``."""
+    return frame[frame.index(b"data: ") + 6 : -2]
+
+
+def coalesce_token_frames(frames: list[bytes], event_id: bytes) -> bytes:
+    """Merge consecutive token frames into one frame carrying the last event ID.
+
+    Works on the encoded bytes: each frame's content is a JSON string, and two JSON
+    strings concatenate by dropping the closing and opening quotes between them.
+    """
+    parts = []
+    for frame in frames:
+        start = frame.index(_TOKEN_PREFIX) + len(_TOKEN_PREFIX)
+        parts.append(frame[start + 1 : -len(_TOKEN_SUFFIX) - 1])
+    content = b'"' + b"".join(parts) + b'"'
+    return b"id: %b\n%b%b%b" % (event_id, _TOKEN_PREFIX, content, _TOKEN_SUFFIX)
+
+
+class _Reader:
+    """Position of one subscriber, in bytes of published frames it has been sent."""
+
+    __slots__ = ("delivered", "aborted")
+
+    def __init__(self, delivered: int) -> None:
+        self.delivered = delivered
+        self.aborted = False
+
+
+class StreamSession:
+    """Replay buffer for one SSE stream.
+
+    Frames are stored as encoded bytes (and already safety-checked) so a reconnect can be
+    served without touching the provider again. Event IDs take the form
+    ``<stream_id>:<seq>`` so ``Last-Event-ID`` alone identifies both stream and position.
+    """
+
+    def __init__(self, store: "StreamSessionStore", stream_id: str, owner: str) -> None:
+        self.stream_id = stream_id
+        self.owner = owner
+        self.buffered_bytes = 0
+        self.finished = False
+        self.subscribers = 0
+        self.published_bytes = 0
+        self.expires_at: float | None = None
+        self.cancelled = False
+        self.cancel_reason = "client_disconnect"
+        self.task: asyncio.Task[None] | None = None
+        self._store = store
+        self._detach_timer: asyncio.TimerHandle | None = None
+        self._frames: deque[tuple[int, bytes]] = deque()
+        self._id_prefix = f"{stream_id}:".encode()
+        self._next_seq = 1
+        self._changed = asyncio.Event()
+        self._readers: set[_Reader] = set()
+        self._drained: asyncio.Event | None = None
+
+    @property
+    def next_seq(self) -> int:
+        return self._next_seq
+
+    @property
+    def first_buffered_seq(self) -> int:
+        return self._frames[0][0] if self._frames else self._next_seq
+
+    def start(self, producer: Coroutine[Any, Any, None]) -> None:
+        self.task = asyncio.create_task(producer)
+
+    def publish(self, payload: bytes) -> int:
+        seq = self._next_seq
+        self._next_seq += 1
+        # One formatting pass builds the whole frame; this runs once per streamed token.
+        frame = b"id: %b%d\ndata: %b\n\n" % (self._id_prefix, seq, payload)
+        self._frames.append((seq, frame))
+        self.published_bytes += len(frame)
+        self.buffered_bytes += len(frame)
+        self._store.account(len(frame))
+
+        limit = settings.stream_replay_max_bytes_per_stream
+        while self.buffered_bytes > limit and len(self._frames) > 1:
+            self.evict_oldest()
+        self._store.enforce_total_limit()
+
+        self._notify()
+        return seq
+
+    def evict_oldest(self) -> int:
+        if not self._frames:
+            return 0
+        _, frame = self._frames.popleft()
+        self.buffered_bytes -= len(frame)
+        self._store.account(-len(frame))
+        return len(frame)
+
+    def finish(self) -> None:
+        self.finished = True
+        self._store.touch(self)
+        self._notify()
+
+    def discard(self) -> None:
+        while self._frames:
+            self.evict_oldest()
+        self._clear_detach_timer()
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    def cancel(self, reason: str = "client_disconnect") -> None:
+        """Stop the producer because nobody is reading; this closes the upstream stream."""
+        self._clear_detach_timer()
+        if self.finished or self.task is None or self.task.done():
+            return
+        self.cancelled = True
+        self.cancel_reason = reason
+        self.task.cancel()
+
+    def lag(self) -> int:
+        """Bytes published but not yet sent to the slowest live subscriber."""
+        positions = [reader.delivered for reader in self._readers if not reader.aborted]
+        return self.published_bytes - min(positions) if positions else 0
+
+    async def writable(self) -> None:
+        """Under the ``block`` policy, wait until the slowest subscriber catches up.
+
+        The producer calls this before publishing, so a slow client slows the upstream read
+        instead of growing the buffer. After ``stream_backpressure_block_seconds`` the
+        lagging subscribers are aborted and the producer carries on.
+        """
+        limit = settings.stream_max_lag_bytes
+        if settings.stream_backpressure_policy != "block" or limit <= 0 or self.lag() <= limit:
+            return
+        metrics.increment("stream_backpressure_total", policy="block", action="blocked")
+        started = time.monotonic()
+        try:
+            async with asyncio.timeout(settings.stream_backpressure_block_seconds):
+                while self.lag() > limit:
+                    self._drained = asyncio.Event()
+                    await self._drained.wait()
+        except TimeoutError:
+            for reader in self._readers:
+                if self.published_bytes - reader.delivered > limit:
+                    reader.aborted = True
+            self._notify()
+        finally:
+            self._drained = None
+            metrics.observe(
+                "stream_backpressure_wait_ms", round((time.monotonic() - started) * 1000)
+            )
+
+    async def subscribe(self, after_seq: int = 0) -> AsyncGenerator[bytes, None]:
+        """Yield buffered frames after ``after_seq`` and then follow the live stream.
+
+        A subscriber that falls more than ``stream_max_lag_bytes`` behind is handled by
+        ``stream_backpressure_policy``: ``coalesce`` merges its pending token frames into
+        one, ``abort`` ends its stream with an error frame, and ``block`` makes the producer
+        wait in :meth:`writable`. While nothing arrives for ``stream_heartbeat_seconds``, a
+        heartbeat comment is sent; the timer is only armed while the subscriber is idle.
+        """
+        cursor = after_seq
+        reader = _Reader(
+            self.published_bytes - sum(len(frame) for seq, frame in self._frames if seq > cursor)
+        )
+        self._readers.add(reader)
+        self.subscribers += 1
+        self._clear_detach_timer()
+        policy = settings.stream_backpressure_policy
+        limit = settings.stream_max_lag_bytes if policy != "block" else 0
+        heartbeat = settings.stream_heartbeat_seconds
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                index = cursor + 1 - self.first_buffered_seq
+                if index < 0:
+                    yield REPLAY_GAP_FRAME
+                    return
+                if index < len(self._frames):
+                    if reader.aborted or (
+                        limit > 0 and self.published_bytes - reader.delivered > limit
+                    ):
+                        if policy != "coalesce" or reader.aborted:
+                            metrics.increment(
+                                "stream_backpressure_total", policy=policy, action="aborted"
+                            )
+                            yield SLOW_CONSUMER_FRAME
+                            return
+                        seq, frame, size = self._coalesce(index)
+                    else:
+                        seq, frame = self._frames[index]
+                        size = len(frame)
+                    cursor = seq
+                    yield frame
+                    reader.delivered += size
+                    if self._drained is not None:
+                        self._drained.set()
+                    continue
+                if self.finished:
+                    return
+                if heartbeat <= 0:
+                    await self._changed.wait()
+                    continue
+                try:
+                    async with asyncio.timeout_at(loop.time() + heartbeat):
+                        await self._changed.wait()
+                except TimeoutError:
+                    metrics.increment("stream_heartbeats_total")
+                    yield HEARTBEAT_FRAME
+        finally:
+            self._readers.discard(reader)
+            if self._drained is not None:
+                self._drained.set()
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.finished:
+                self._schedule_detach_cancel()
+            self._store.touch(self)
+
+    def _coalesce(self, index: int) -> tuple[int, bytes, int]:
+        """Merge the run of token frames starting at ``index``.
+
+        Returns the last merged sequence number, the merged frame, and the buffered bytes
+        it stands for.
+        """
+        run: list[bytes] = []
+        seq = 0
+        for position in range(index, len(self._frames)):
+            candidate_seq, frame = self._frames[position]
+            if not frame.endswith(_TOKEN_SUFFIX):
+                break
+            seq = candidate_seq
+            run.append(frame)
+        if len(run) < 2:
+            seq, frame = self._frames[index]
+            return seq, frame, len(frame)
+        metrics.increment("stream_backpressure_total", policy="coalesce", action="coalesced")
+        return seq, coalesce_token_frames(run, b"%b%d" % (self._id_prefix, seq)), sum(map(len, run))
+
+    def _schedule_detach_cancel(self) -> None:
+        # The last reader left mid-stream. Keep generating for a short window so a
+        # Last-Event-ID reconnect can pick up the live stream, then stop paying for it.
+        delay = settings.stream_detach_cancel_seconds
+        if delay <= 0:
+            self.cancel()
+        elif self._detach_timer is None:
+            self._detach_timer = asyncio.get_running_loop().call_later(delay, self.cancel)
+
+    def _clear_detach_timer(self) -> None:
+        if self._detach_timer is not None:
+            self._detach_timer.cancel()
+            self._detach_timer = None
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class StreamSessionStore:
+    """Tracks live and recently finished SSE streams for ``Last-Event-ID`` resumption."""
+
+    def __init__(self) -> None:
+        self._sessions: OrderedDict[str, StreamSession] = OrderedDict()
+        self.total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, owner: str) -> StreamSession:
+        self.sweep()
+        session = StreamSession(self, uuid.uuid4().hex, owner)
+        self._sessions[session.stream_id] = session
+        return session
+
+    def resume(self, last_event_id: str, owner: str) -> tuple[StreamSession, int] | None:
+        """Return the session and replay cursor for ``last_event_id`` if it can be resumed."""
+        self.sweep()
+        stream_id, _, seq_text = last_event_id.strip().rpartition(":")
+        try:
+            after_seq = int(seq_text)
+        except ValueError:
+            return None
+
+        session = self._sessions.get(stream_id)
+        if session is None or session.owner != owner:
+            return None
+        if after_seq < 0 or after_seq >= session.next_seq:
+            return None
+        if after_seq + 1 < session.first_buffered_seq:
+            return None
+
+        return session, after_seq
+
+    def account(self, delta: int) -> None:
+        self.total_bytes += delta
+
+    def enforce_total_limit(self) -> None:
+        limit = settings.stream_replay_max_total_bytes
+        if self.total_bytes <= limit:
+            return
+        for session in list(self._sessions.values()):
+            while self.total_bytes > limit and session.evict_oldest():
+                pass
+            if self.total_bytes <= limit:
+                return
+
+    def touch(self, session: StreamSession) -> None:
+        if session.finished and session.subscribers == 0:
+            session.expires_at = time.monotonic() + float(settings.stream_resume_grace_seconds)
+
+    def sweep(self) -> None:
+        now = time.monotonic()
+        expired = [
+            stream_id
+            for stream_id, session in self._sessions.items()
+            if session.subscribers == 0
+            and session.expires_at is not None
+            and session.expires_at <= now
+        ]
+        for stream_id in expired:
+            self._sessions.pop(stream_id).discard()
+
+    def reset(self) -> None:
+        for session in self._sessions.values():
+            session.discard()
+        self._sessions.clear()
+        self.total_bytes = 0
+
+
+class DisconnectAwareStreamingResponse(StreamingResponse):
+    """``StreamingResponse`` that stops as soon as the client disconnects.
+
+    Starlette only listens for ``http.disconnect`` on servers older than ASGI 2.4;
+    newer servers surface a gone client as a failed ``send``, which never happens while
+    the upstream is between tokens. This always races the body against the disconnect
+    message and closes the body iterator, so ``StreamSession.subscribe`` drops its
+    subscriber straight away.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await super().__call__(scope, receive, send)
+            return
+
+        streaming = asyncio.ensure_future(self.stream_response(send))
+        listening = asyncio.ensure_future(self.listen_for_disconnect(receive))
+        try:
+            await asyncio.wait((streaming, listening), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (streaming, listening):
+                task.cancel()
+            await asyncio.gather(streaming, listening, return_exceptions=True)
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+        if streaming.cancelled():
+            # The disconnect arrived first.
+            metrics.increment("stream_client_disconnects_total")
+            return
+        error = streaming.exception()
+        if isinstance(error, OSError):
+            metrics.increment("stream_client_disconnects_total")
+            raise ClientDisconnect() from error
+        if error is not None:
+            raise error
+        if self.background is not None:
+            await self.background()
+
+
+stream_sessions = StreamSessionStore()
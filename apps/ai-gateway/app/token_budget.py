@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import math
+import time
+from collections.abc import Awaitable
+from datetime import UTC, datetime, timedelta
+from typing import TypeVar
+
+from app.config import settings
+from app.metrics import metrics
+from app.rate_limit import GcraRateLimiter, RateLimitBackend, RateLimitBackendError
+
+logger = logging.getLogger("ai-gateway.token_budget")
+
+_MINUTE = 60
+_T = TypeVar("_T")
+
+
+def estimate_tokens(text: str | None) -> int:
+    """Rough token count for admission; reconciled against provider usage afterwards."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / max(settings.token_estimate_chars_per_token, 1.0))
+
+
+class TokenBudgetExceeded(Exception):
+    def __init__(self, message: str, scope: str, retry_after: int, headers: dict[str, str]):
+        self.message = message
+        self.scope = scope
+        self.retry_after = retry_after
+        self.headers = headers
+        super().__init__(message)
+
+
+class TokenReservation:
+    """Tokens held for one request; ``settle`` swaps the estimate for actual usage once."""
+
+    def __init__(
+        self,
+        budget: "TokenBudgetLimiter",
+        owner: str,
+        tenant_id: str,
+        tokens: int,
+        backend: RateLimitBackend | None = None,
+    ) -> None:
+        self.owner = owner
+        self.tenant_id = tenant_id
+        self.tokens = tokens
+        self.settled = False
+        self._budget = budget
+        # The store the tokens were reserved in, and what it reported back.
+        self.backend = backend
+        self.minute_until = 0.0
+        self.day_used: int | None = None
+
+    async def settle(self, actual_tokens: int) -> None:
+        if self.settled:
+            return
+        self.settled = True
+        await self._budget.adjust(self, actual_tokens - self.tokens)
+
+    async def release(self) -> None:
+        """Refund the reservation unless it was already settled against actual usage."""
+        await self.settle(0)
+
+    def headers(self) -> dict[str, str]:
+        return self._budget.headers(self)
+
+
+class TokenBudgetLimiter:
+    """Per-tenant tokens-per-minute and daily token budgets.
+
+    The minute budget is GCRA with a per-token cost: a request may spend up to the full
+    minute's tokens at once and the budget refills continuously. A tenant with a full
+    bucket may go into debt for a single oversized request rather than being locked out.
+    The daily budget is a counter per UTC day.
+
+    Both live in the rate limit backend, so a ``shared_memory`` or ``redis`` backend
+    enforces them across workers and keeps daily usage through restarts. When that
+    backend fails, budgets fall back to this worker the way request limits do.
+    """
+
+    def __init__(self) -> None:
+        self.local = GcraRateLimiter()
+        self._backend: RateLimitBackend = self.local
+        self._fallback_until = 0.0
+
+    @property
+    def backend(self) -> RateLimitBackend:
+        return self._backend
+
+    def configure(self, backend: RateLimitBackend | None) -> None:
+        """Share ``backend`` with the rate limiter, which owns and closes it."""
+        self._backend = backend or self.local
+        self._fallback_until = 0.0
+
+    def minute_limit(self, tenant_id: str) -> int:
+        limit = settings.token_budget_tenant_per_minute.get(
+            tenant_id, settings.token_budget_per_minute
+        )
+        return max(1, limit)
+
+    def day_limit(self, tenant_id: str) -> int:
+        return settings.token_budget_tenant_per_day.get(tenant_id, settings.token_budget_per_day)
+
+    async def reserve(self, owner: str, tenant_id: str, tokens: int) -> TokenReservation:
+        if not settings.token_budget_enabled:
+            reservation = TokenReservation(self, owner, tenant_id, tokens)
+            reservation.settled = True
+            return reservation
+
+        backend = self._backend
+        if backend is not self.local and time.monotonic() < self._fallback_until:
+            backend = self.local
+        try:
+            reservation = await self._reserve(backend, owner, tenant_id, tokens)
+        except (TimeoutError, RateLimitBackendError) as exc:
+            self._fall_back(backend, exc)
+            reservation = await self._reserve(self.local, owner, tenant_id, tokens)
+
+        metrics.increment("token_budget_reserved_tokens_total", tokens)
+        return reservation
+
+    async def adjust(self, reservation: TokenReservation, delta: int) -> None:
+        """Charge (positive) or refund (negative) tokens after a request settles."""
+        backend = reservation.backend
+        if delta == 0 or backend is None:
+            return
+        tenant_id = reservation.tenant_id
+        try:
+            _applied, _retry_after, backlog = await self._call(
+                backend,
+                backend.charge(
+                    _minute_key(reservation.owner),
+                    delta,
+                    self._limit(backend, self.minute_limit(tenant_id)),
+                    _MINUTE,
+                    force=True,
+                ),
+            )
+            reservation.minute_until = time.time() + backlog
+            if reservation.day_used is not None:
+                _applied, reservation.day_used = await self._call(
+                    backend,
+                    backend.count(
+                        _day_key(reservation.owner),
+                        delta,
+                        0,
+                        _next_midnight(),
+                        force=True,
+                    ),
+                )
+        except (TimeoutError, RateLimitBackendError) as exc:
+            # The tokens stay charged as estimated; the budget refills on its own.
+            self._fall_back(backend, exc)
+            return
+        metrics.increment("token_budget_reconciled_tokens_total", delta)
+
+    def headers(self, reservation: TokenReservation) -> dict[str, str]:
+        backend = reservation.backend
+        if not settings.token_budget_enabled or backend is None:
+            return {}
+        return self._headers(
+            reservation.tenant_id,
+            self._limit(backend, self.minute_limit(reservation.tenant_id)),
+            reservation.minute_until,
+            self._limit(backend, self.day_limit(reservation.tenant_id)),
+            reservation.day_used,
+        )
+
+    def sweep(self) -> int:
+        """Drop local minute buckets that refilled and daily counters of past days."""
+        return self.local.sweep()
+
+    def snapshot(self) -> dict[str, object]:
+        snapshot: dict[str, object] = {
+            "backend": self._backend.name,
+            "tenant_keys": len(self.local),
+        }
+        if self._backend is not self.local:
+            snapshot["fallback_active"] = time.monotonic() < self._fallback_until
+        return snapshot
+
+    def reset(self) -> None:
+        self.local.reset()
+        self._fallback_until = 0.0
+
+    async def _reserve(
+        self, backend: RateLimitBackend, owner: str, tenant_id: str, tokens: int
+    ) -> TokenReservation:
+        minute_limit = self._limit(backend, self.minute_limit(tenant_id))
+        day_limit = self._limit(backend, self.day_limit(tenant_id))
+        reservation = TokenReservation(self, owner, tenant_id, tokens, backend)
+
+        allowed, retry_after, backlog = await self._call(
+            backend, backend.charge(_minute_key(owner), tokens, minute_limit, _MINUTE)
+        )
+        reservation.minute_until = time.time() + backlog
+        if day_limit > 0:
+            # A rejected minute charge still reports the day's usage in its headers.
+            amount = tokens if allowed else 0
+            counted, reservation.day_used = await self._call(
+                backend, backend.count(_day_key(owner), amount, day_limit, _next_midnight())
+            )
+            if allowed and not counted:
+                _applied, _retry_after, backlog = await self._call(
+                    backend,
+                    backend.charge(_minute_key(owner), -tokens, minute_limit, _MINUTE, force=True),
+                )
+                reservation.minute_until = time.time() + backlog
+                raise self._reject(
+                    "Daily token budget exceeded",
+                    scope="day",
+                    retry_after=_seconds_until_midnight(),
+                    headers=self.headers(reservation),
+                )
+        if not allowed:
+            raise self._reject(
+                "Tokens-per-minute budget exceeded",
+                scope="minute",
+                retry_after=retry_after,
+                headers=self.headers(reservation),
+            )
+        return reservation
+
+    async def _call(self, backend: RateLimitBackend, operation: Awaitable[_T]) -> _T:
+        if backend is self.local:
+            return await operation
+        return await asyncio.wait_for(
+            operation, timeout=settings.rate_limit_backend_timeout_seconds
+        )
+
+    def _limit(self, backend: RateLimitBackend, limit: int) -> int:
+        if limit > 0 and backend is self.local and self._backend is not self.local:
+            # Each worker only sees its own traffic, so split the budget across the fleet.
+            return max(1, limit // max(1, settings.rate_limit_fallback_workers))
+        return limit
+
+    def _fall_back(self, backend: RateLimitBackend, exc: Exception) -> None:
+        if backend is self.local:
+            raise exc
+        logger.warning(
+            "Token budget backend %s unavailable, budgeting locally: %r", backend.name, exc
+        )
+        metrics.increment("token_budget_backend_fallback_total", backend=backend.name)
+        self._fallback_until = time.monotonic() + settings.rate_limit_backend_retry_seconds
+
+    def _headers(
+        self,
+        tenant_id: str,
+        minute_limit: int,
+        minute_until: float,
+        day_limit: int,
+        day_used: int | None,
+    ) -> dict[str, str]:
+        backlog = max(0.0, minute_until - time.time())
+        remaining = max(0, math.floor(minute_limit * (_MINUTE - backlog) / _MINUTE + 1e-6))
+        headers = {
+            "X-RateLimit-Limit-Tokens": str(minute_limit),
+            "X-RateLimit-Remaining-Tokens": str(remaining),
+        }
+        if day_limit > 0:
+            headers["X-Token-Budget-Limit-Day"] = str(day_limit)
+            headers["X-Token-Budget-Remaining-Day"] = str(max(0, day_limit - (day_used or 0)))
+        return headers
+
+    def _reject(
+        self, message: str, *, scope: str, retry_after: int, headers: dict[str, str]
+    ) -> TokenBudgetExceeded:
+        metrics.increment("token_budget_rejected_total", scope=scope)
+        return TokenBudgetExceeded(
+            message,
+            scope=scope,
+            retry_after=retry_after,
+            headers={**headers, "Retry-After": str(retry_after)},
+        )
+
+
+def _minute_key(owner: str) -> str:
+    return f"tokens:minute:{owner}"
+
+
+def _day_key(owner: str) -> str:
+    return f"tokens:day:{_today()}:{owner}"
+
+
+def _next_midnight() -> float:
+    now = datetime.now(UTC)
+    return datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), UTC).timestamp()
+
+
+def _today() -> str:
+    return datetime.now(UTC).date().isoformat()
+
+
+def _seconds_until_midnight() -> int:
+    return max(1, math.ceil(_next_midnight() - datetime.now(UTC).timestamp()))
+
+
+token_budget = TokenBudgetLimiter()
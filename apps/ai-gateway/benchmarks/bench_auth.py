@@ -0,0 +1,151 @@
+"""Measure HMAC service-auth overhead per request on signed JSON bodies.
+
+Run from ``apps/ai-gateway``: ``python -m benchmarks.bench_auth [--size BYTES]``.
+``rehash`` is the original verification: buffer the body, hash it after the fact,
+rekey HMAC from the secret and recompute the token fingerprint. ``precomputed`` is
+the current verification behind ``BodyDigestMiddleware``: the body is hashed as its
+chunks arrive and the keyed HMAC state is copied from a per-secret cache. ``total``
+covers reading the body the way FastAPI does plus auth; ``after last chunk`` is the
+latency auth adds once the final body chunk has arrived.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.types import Message, Receive, Scope, Send
+
+from app.auth import ServicePrincipal, _register_nonce_once, _verify_hmac_request
+from app.config import settings
+from app.request_body import BodyDigestMiddleware
+
+SECRET = "benchmark-service-token"
+PATH = "/v1/generate"
+
+
+async def rehash_verify(request: Request, secret: str) -> ServicePrincipal:
+    """The verification path before per-secret state and streamed hashing."""
+    signature = request.headers.get("X-Service-Signature", "")
+    timestamp_header = request.headers.get("X-Service-Timestamp", "")
+    nonce = request.headers.get("X-Service-Nonce", "")
+    if request.headers.get("X-Service-Auth-Version", "") != "v1":
+        raise HTTPException(status_code=401, detail="Invalid service auth version")
+    if not signature or not timestamp_header or not nonce:
+        raise HTTPException(status_code=401, detail="Missing service authentication headers")
+    timestamp = int(timestamp_header)
+    if abs(int(time.time()) - timestamp) > int(settings.service_auth_max_age_seconds):
+        raise HTTPException(status_code=401, detail="Service authentication timestamp expired")
+
+    body = await request.body()
+    body_digest = hashlib.sha256(body).hexdigest()
+    canonical = "\n".join(
+        [request.method.upper(), request.url.path, str(timestamp), nonce, body_digest]
+    )
+    expected_signature = hmac.new(
+        secret.encode("utf-8"), canonical.encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+    if not hmac.compare_digest(signature.lower(), expected_signature):
+        raise HTTPException(status_code=401, detail="Invalid service authentication signature")
+    if not await _register_nonce_once(f"{timestamp}:{nonce}"):
+        raise HTTPException(status_code=401, detail="Service authentication nonce replay detected")
+    return ServicePrincipal(
+        token_fingerprint=hashlib.sha256(secret.encode("utf-8")).hexdigest()[:16],
+        tenant_id=request.headers.get("X-Tenant-ID"),
+        auth_mode="hmac",
+    )
+
+
+def signed_scope(body: bytes, index: int) -> Scope:
+    timestamp = str(int(time.time()))
+    nonce = f"bench-{index}"
+    canonical = "\n".join(["POST", PATH, timestamp, nonce, hashlib.sha256(body).hexdigest()])
+    signature = hmac.new(SECRET.encode(), canonical.encode(), hashlib.sha256).hexdigest()
+    headers = {
+        "content-type": "application/json",
+        "content-length": str(len(body)),
+        "x-service-auth-version": "v1",
+        "x-service-timestamp": timestamp,
+        "x-service-nonce": nonce,
+        "x-service-signature": signature,
+    }
+    return {
+        "type": "http",
+        "method": "POST",
+        "path": PATH,
+        "raw_path": PATH.encode(),
+        "query_string": b"",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "headers": [(key.encode(), value.encode()) for key, value in headers.items()],
+    }
+
+
+def chunked_receive(body: bytes, chunk_size: int, last_chunk_at: list[float]) -> Receive:
+    chunks = [body[offset : offset + chunk_size] for offset in range(0, len(body), chunk_size)]
+    messages: list[Message] = [
+        {"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1}
+        for index, chunk in enumerate(chunks)
+    ]
+
+    async def receive() -> Message:
+        message = messages.pop(0)
+        if not messages:
+            last_chunk_at.append(time.perf_counter())
+        return message
+
+    return receive
+
+
+async def noop_send(message: Message) -> None:
+    return None
+
+
+async def run(name: str, body: bytes, chunk_size: int, requests: int, offset: int) -> None:
+    verify = rehash_verify if name == "rehash" else _verify_hmac_request
+    last_chunk_at: list[float] = []
+    after_body: list[float] = []
+
+    async def endpoint(scope: Scope, receive: Receive, send: Send) -> None:
+        request = Request(scope, receive)
+        await request.body()  # FastAPI buffers the body before dependencies run.
+        await verify(request, SECRET)
+        after_body.append(time.perf_counter() - last_chunk_at[-1])
+
+    app = endpoint if name == "rehash" else BodyDigestMiddleware(endpoint)
+    scopes = [signed_scope(body, offset + index) for index in range(requests)]
+    started = time.perf_counter()
+    for scope in scopes:
+        await app(scope, chunked_receive(body, chunk_size, last_chunk_at), noop_send)
+    elapsed = time.perf_counter() - started
+    after_body.sort()
+    print(
+        f"{name:<12} {elapsed / requests * 1e6:>8.2f} us/request total"
+        f"  {after_body[len(after_body) // 2] * 1e6:>7.2f} us p50 after last chunk"
+        f"  {after_body[int(len(after_body) * 0.99)] * 1e6:>7.2f} us p99"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=32 * 1024, help="body size in bytes")
+    parser.add_argument("--chunk", type=int, default=4 * 1024, help="ASGI chunk size")
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args()
+
+    settings.service_token = SECRET
+    settings.service_auth_max_nonces = 10**9
+    body = json.dumps(
+        {"provider": "openai", "model": "gpt-4o-mini", "prompt": "x" * args.size}
+    ).encode()[: args.size]
+    print(f"{len(body):,} byte bodies in {args.chunk:,} byte chunks")
+    for round_index, name in enumerate(["rehash", "precomputed", "rehash", "precomputed"]):
+        await run(name, body, args.chunk, args.requests, round_index * args.requests)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
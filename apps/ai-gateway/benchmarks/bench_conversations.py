@@ -0,0 +1,94 @@
+"""Per-turn request size and safety-scan cost of resending history versus a conversation.
+
+Run from ``apps/ai-gateway``: ``python -m benchmarks.bench_conversations [--turns N]``.
+Each turn adds a ``--prompt``-character instruction and a ``--reply``-character answer.
+``resend`` is today's refinement flow: the core app folds the whole exchange into
+``prompt``, so the request body grows every turn and the strict safety pipeline scans
+all of it again. ``conversation`` sends only the new instruction with a
+``conversation_id``; the gateway scans that, builds the provider history from the
+store and appends the turn. Times are the gateway-side cost per turn, without the
+provider call.
+"""
+
+import argparse
+import json
+import time
+from collections.abc import Callable
+from functools import partial
+
+from app.conversations import Conversation, ConversationStore
+from app.models.generate import GenerateRequest
+from app.routers.v1 import check_input_safety, create_safety_pipeline
+from app.safety import SafetyPipeline
+
+SENTENCE = "Rewrite the fraction warm-up for grade 5 with visual models and a word problem. "
+
+
+def text(size: int, turn: int) -> str:
+    return (f"[{turn}] " + SENTENCE * (size // len(SENTENCE) + 1))[:size]
+
+
+def per_turn(operation: Callable[[], object], repeat: int = 20) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        operation()
+    return (time.perf_counter() - started) / repeat
+
+
+def conversation_turn(
+    request: GenerateRequest, pipeline: SafetyPipeline, conversation: Conversation
+) -> None:
+    check_input_safety(request, pipeline, "strict", conversation)
+    conversation.history()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--prompt", type=int, default=400)
+    parser.add_argument("--reply", type=int, default=2400)
+    args = parser.parse_args()
+
+    pipeline = create_safety_pipeline("strict")
+    store = ConversationStore()
+    conversation = store.create("bench")
+    transcript = ""
+    totals = {"resend": [0, 0.0], "conversation": [0, 0.0]}
+
+    print(f"{'turn':>4} {'resend bytes':>13} {'scan us':>9} {'conv bytes':>11} {'scan us':>9}")
+    for turn in range(1, args.turns + 1):
+        instruction = text(args.prompt, turn)
+        reply = text(args.reply, turn)
+
+        resend = {"provider": "openai", "model": "gpt-4o-mini", "prompt": transcript + instruction}
+        resend_request = GenerateRequest.model_validate(resend)
+        resend_seconds = per_turn(partial(pipeline.check_input, resend_request.prompt))
+
+        body = {
+            "provider": "openai",
+            "model": "gpt-4o-mini",
+            "prompt": instruction,
+            "conversation_id": conversation.conversation_id,
+        }
+        request = GenerateRequest.model_validate(body)
+        conversation_seconds = per_turn(partial(conversation_turn, request, pipeline, conversation))
+        store.append(conversation, instruction, reply, "strict")
+        transcript += f"User: {instruction}\nAssistant: {reply}\n"
+
+        resend_bytes = len(json.dumps(resend))
+        conversation_bytes = len(json.dumps(body))
+        totals["resend"][0] += resend_bytes
+        totals["resend"][1] += resend_seconds
+        totals["conversation"][0] += conversation_bytes
+        totals["conversation"][1] += conversation_seconds
+        print(
+            f"{turn:>4} {resend_bytes:>13,} {resend_seconds * 1e6:>9.1f}"
+            f" {conversation_bytes:>11,} {conversation_seconds * 1e6:>9.1f}"
+        )
+
+    for name, (total_bytes, total_seconds) in totals.items():
+        print(f"{name:<13} total {total_bytes:>9,} B  scan {total_seconds * 1e3:>7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
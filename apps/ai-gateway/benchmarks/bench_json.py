@@ -0,0 +1,136 @@
+"""Per-operation cost of the JSON paths on the streaming and response hot paths.
+
+Run from ``apps/ai-gateway``: ``python -m benchmarks.bench_json [--number N]``.
+``stdlib`` rows are the previous code: ``json.dumps`` into an ``id:``/``data:`` str
+frame, ``json.loads`` on upstream lines, FastAPI's response-model serialization.
+``fast`` rows use ``app.fast_json`` and byte frames; ``fallback`` rows are the same
+code with orjson unavailable.
+"""
+
+import argparse
+import asyncio
+import json
+import timeit
+from collections.abc import Callable
+from typing import Any
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app import fast_json
+from app.models.generate import GenerateResponseModel
+from app.stream_sessions import encode_frame
+
+TOKEN_FRAME = {"content": " fractions", "done": False}
+DONE_FRAME = {
+    "content": "",
+    "done": True,
+    "usage": {"prompt_tokens": 812, "completion_tokens": 1930, "total_tokens": 2742},
+    "finish_reason": "stop",
+    "queue_time_ms": 3,
+}
+OPENAI_LINE = (
+    '{"id":"chatcmpl-9","object":"chat.completion.chunk","created":1718000000,'
+    '"model":"gpt-4o-mini","choices":[{"index":0,"delta":{"content":" fractions"},'
+    '"finish_reason":null}]}'
+)
+ANTHROPIC_LINE = (
+    '{"type":"content_block_delta","index":0,"delta":{"type":"text_delta","text":" fractions"}}'
+)
+HEALTH = {
+    "status": "ok",
+    "version": "1.0.0",
+    "timestamp": "2026-01-01T00:00:00+00:00",
+    "checks": {"providers": "ok"},
+    "providers_configured": ["openai", "anthropic"],
+}
+
+
+def stdlib_frame(data: dict[str, Any], seq: int) -> str:
+    return f"id: 0123456789abcdef:{seq}\ndata: {json.dumps(data)}\n\n"
+
+
+def fast_frame(data: dict[str, Any], seq: int) -> bytes:
+    return encode_frame(fast_json.dumps(data), b"0123456789abcdef:" + str(seq).encode())
+
+
+def measure(label: str, operation: Callable[[], object], number: int) -> None:
+    best = min(timeit.repeat(operation, number=number, repeat=5)) / number
+    print(f"  {label:<34} {best * 1e9:>9,.0f} ns")
+
+
+def response_rows(number: int) -> None:
+    model = GenerateResponseModel(
+        content="A lesson on equivalent fractions. " * 60,
+        model="gpt-4o-mini",
+        provider="openai",
+        usage=DONE_FRAME["usage"],
+        finish_reason="stop",
+        task_type="lesson_plan",
+        queue_time_ms=3,
+    )
+    loop = asyncio.new_event_loop()
+    model_field = create_model_field(name="r", type_=GenerateResponseModel, mode="serialization")
+    dict_field = create_model_field(name="r", type_=dict[str, object], mode="serialization")
+
+    def fastapi_model() -> object:
+        return loop.run_until_complete(
+            serialize_response(
+                field=model_field, response_content=model, is_coroutine=True, dump_json=True
+            )
+        )
+
+    def fastapi_health() -> object:
+        return loop.run_until_complete(
+            serialize_response(
+                field=dict_field, response_content=HEALTH, is_coroutine=True, dump_json=True
+            )
+        )
+
+    async def nothing() -> None:
+        return None
+
+    overhead = min(
+        timeit.repeat(lambda: loop.run_until_complete(nothing()), number=number, repeat=5)
+    )
+    for label, operation in (("/generate body", fastapi_model), ("/health body", fastapi_health)):
+        best = min(timeit.repeat(operation, number=number, repeat=5)) - overhead
+        print(f"  {'stdlib ' + label:<34} {best / number * 1e9:>9,.0f} ns")
+    measure("fast /generate body", lambda: fast_json.dumps(model.model_dump(mode="json")), number)
+    measure("fast /health body", lambda: fast_json.dumps(HEALTH), number)
+    loop.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+    number = args.number
+
+    print(f"orjson available: {fast_json.HAS_ORJSON}")
+    print("SSE frame encode")
+    measure("stdlib token frame", lambda: stdlib_frame(TOKEN_FRAME, 1234), number)
+    measure("fast token frame", lambda: fast_frame(TOKEN_FRAME, 1234), number)
+    measure("stdlib done frame", lambda: stdlib_frame(DONE_FRAME, 1234), number)
+    measure("fast done frame", lambda: fast_frame(DONE_FRAME, 1234), number)
+
+    print("Upstream line decode")
+    measure("stdlib openai line", lambda: json.loads(OPENAI_LINE), number)
+    measure("fast openai line", lambda: fast_json.loads(OPENAI_LINE), number)
+    measure("stdlib anthropic line", lambda: json.loads(ANTHROPIC_LINE), number)
+    measure("fast anthropic line", lambda: fast_json.loads(ANTHROPIC_LINE), number)
+
+    print("Response body encode (excluding event loop overhead)")
+    response_rows(number // 10)
+
+    orjson, fast_json.orjson = fast_json.orjson, None
+    try:
+        print("Fallback without orjson")
+        measure("fallback token frame", lambda: fast_frame(TOKEN_FRAME, 1234), number)
+        measure("fallback openai line", lambda: fast_json.loads(OPENAI_LINE), number)
+    finally:
+        fast_json.orjson = orjson
+
+
+if __name__ == "__main__":
+    main()
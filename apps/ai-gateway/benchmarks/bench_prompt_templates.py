@@ -0,0 +1,116 @@
+"""Template render cost and prefix cache hits for grade/subject/standards variations.
+
+Run from ``apps/ai-gateway``: ``python -m benchmarks.bench_prompt_templates [--requests N]``.
+Requests cycle through every ``task_type`` with grade levels, subjects and standards
+drawn from small pools, the way the core app varies its prompts today.
+
+``system concat`` is the core app building its own ``system_prompt`` from the static
+prompt plus the variation lines: a caller system prompt is never marked cacheable.
+``prompt concat`` keeps ``task_type``'s static system prompt but prepends the
+variation lines to ``prompt``. ``template`` sends the variables in ``context`` and lets
+the registry render them after the static prefix.
+
+Upstream caching is modelled as an exact-match cache of the cacheable system prefix:
+a request hits once the same prefix was sent before. ``cache hit`` is cached prompt
+tokens over all prompt tokens (system, variations and instruction), using the
+gateway's token estimate. ``build us`` is the time to produce the prompts of one
+request, ``scan chars`` the text the input safety check reads per request.
+"""
+
+import argparse
+import itertools
+import time
+
+from app.prompts.system_prompts import SYSTEM_PROMPTS
+from app.prompts.templates import TEMPLATE_SECTIONS, prompt_templates
+from app.token_budget import estimate_tokens
+
+GRADES = ("K", "2", "5", "8", "11")
+SUBJECTS = ("math", "science", "English language arts", "social studies")
+STANDARDS = (
+    "CCSS.MATH.CONTENT.5.NF.A.1, CCSS.MATH.CONTENT.5.NF.A.2",
+    "NGSS MS-PS1-2, NGSS MS-PS1-4",
+    "CCSS.ELA-LITERACY.RI.8.1, CCSS.ELA-LITERACY.RI.8.2",
+)
+INSTRUCTION = "Create material on comparing fractions with unlike denominators."
+
+
+def contexts(count: int) -> list[tuple[str, dict[str, object]]]:
+    combos = itertools.cycle(itertools.product(SYSTEM_PROMPTS, GRADES, SUBJECTS, STANDARDS))
+    requests = []
+    for task_type, grade, subject, standards in itertools.islice(combos, count):
+        context: dict[str, object] = {
+            "grade_level": grade,
+            "subject": subject,
+            "standards": standards,
+            "duration_minutes": 45,
+            "lesson_count": 5,
+            "question_count": 10,
+            "learner_profile": "English language learner, reads two grades below level",
+            "reading_level": f"grade {grade}",
+        }
+        requests.append((task_type, context))
+    return requests
+
+
+def concatenated(task_type: str, context: dict[str, object]) -> str:
+    """The variation lines as the core app concatenates them."""
+    lines = []
+    for section in TEMPLATE_SECTIONS[task_type]:
+        lines.append(section.format(**context))
+    return "\n".join(lines)
+
+
+def run(mode: str, requests: list[tuple[str, dict[str, object]]]) -> None:
+    seen: set[str] = set()
+    prompt_tokens = cached_tokens = scanned = 0
+    started = time.perf_counter()
+    for task_type, context in requests:
+        static = SYSTEM_PROMPTS[task_type]
+        if mode == "system concat":
+            system, cacheable, prompt = static + "\n" + concatenated(task_type, context), "", ""
+        elif mode == "prompt concat":
+            system, cacheable, prompt = "", static, concatenated(task_type, context) + "\n"
+        else:
+            system = prompt_templates.render(task_type, context) or ""
+            cacheable, prompt = static, ""
+        prompt += INSTRUCTION
+
+        tokens = estimate_tokens(cacheable) + estimate_tokens(system) + estimate_tokens(prompt)
+        prompt_tokens += tokens
+        if cacheable in seen:
+            cached_tokens += estimate_tokens(cacheable)
+        elif cacheable:
+            seen.add(cacheable)
+        scanned += len(prompt) + (len(system) if mode == "template" else 0)
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{mode:<14} build {elapsed / len(requests) * 1e6:>6.2f} us"
+        f"  cacheable prefixes {len(seen):>3}  cache hit {cached_tokens / prompt_tokens:>6.1%}"
+        f"  scan chars {scanned / len(requests):>6.0f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+
+    requests = contexts(args.requests)
+    print(f"{args.requests:,} requests over {len(SYSTEM_PROMPTS)} task types")
+    for mode in ("system concat", "prompt concat", "template"):
+        run(mode, requests)
+
+    prompt_templates.reset()
+    for task_type, context in requests:
+        prompt_templates.render(task_type, context)
+    for task_type, stats in prompt_templates.snapshot().items():
+        print(
+            f"  render {task_type:<22} avg {stats['render_us_avg']:>5.2f} us"
+            f"  max {stats['render_us_max']:>6.2f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
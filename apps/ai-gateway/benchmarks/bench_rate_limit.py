@@ -0,0 +1,92 @@
+"""Compare the deque sliding-window limiter with in-process and shared-memory GCRA.
+
+Run from ``apps/ai-gateway``: ``python -m benchmarks.bench_rate_limit [--keys N]``.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections.abc import Callable
+from typing import Protocol
+
+from app.rate_limit import GcraRateLimiter, SlidingWindowRateLimiter
+from app.rate_limit_shm import SharedMemoryRateLimitBackend
+
+
+class Limiter(Protocol):
+    def allow(self, key: str, limit: int, period_seconds: int) -> tuple[bool, int]: ...
+
+
+def run(limiter: Limiter, keys: list[str], calls: int, limit: int) -> float:
+    started = time.perf_counter()
+    for index in range(calls):
+        limiter.allow(keys[index % len(keys)], limit, 60)
+    return calls / (time.perf_counter() - started)
+
+
+def run_threaded(limiter: Limiter, keys: list[str], calls: int, limit: int, threads: int) -> float:
+    per_thread = calls // threads
+
+    def worker(offset: int) -> None:
+        rng = random.Random(offset)
+        for _ in range(per_thread):
+            limiter.allow(keys[rng.randrange(len(keys))], limit, 60)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return per_thread * threads / (time.perf_counter() - started)
+
+
+def retained_bytes(limiter: Limiter, keys: list[str], calls: int, limit: int) -> int:
+    tracemalloc.start()
+    run(limiter, keys, calls, limit)
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+def measure(
+    name: str, factory: Callable[[], Limiter], keys: list[str], calls: int, limit: int
+) -> None:
+    ops = run(factory(), keys, calls, limit)
+    threaded = run_threaded(factory(), keys, calls, limit, threads=8)
+    memory = retained_bytes(factory(), keys, calls, limit)
+    print(
+        f"{name:<16} {ops:>12,.0f} ops/s  {threaded:>12,.0f} ops/s (8 threads)"
+        f"  {memory / 1024 / 1024:>8.1f} MiB retained"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--calls-per-key", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=30)
+    args = parser.parse_args()
+
+    keys = [f"fingerprint-{index}:tenant-{index % 997}:/v1/generate" for index in range(args.keys)]
+    calls = args.keys * args.calls_per_key
+    print(f"{args.keys:,} keys, {calls:,} calls, limit {args.limit}/min")
+    measure("deque window", SlidingWindowRateLimiter, keys, calls, args.limit)
+    measure("gcra (sharded)", GcraRateLimiter, keys, calls, args.limit)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = (os.path.join(directory, f"table-{index}") for index in range(3))
+        measure(
+            "gcra (shm)",
+            lambda: SharedMemoryRateLimitBackend(next(paths), slots=args.keys * 2),
+            keys,
+            calls,
+            args.limit,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Memory and latency of each backpressure policy against a deliberately slow client.
+
+Run from ``apps/ai-gateway``: ``python -m benchmarks.bench_slow_consumer``.
+An upstream produces ``--tokens`` tokens at ``--rate`` tokens/s into a
+``StreamSession`` while a client drains it at ``--bandwidth`` bytes/s. ``none`` is the
+previous behaviour: no lag limit, so the only bound is the replay buffer cap, and a
+client that falls behind it gets a replay gap.
+
+Columns: peak bytes buffered for the stream, peak lag of the client, bytes written to
+the client, when the upstream finished (how long it held the provider connection),
+the delay between the last token being produced and the client receiving it, and
+how the stream ended for the client.
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.config import settings
+from app.stream_sessions import (
+    REPLAY_GAP_FRAME,
+    SLOW_CONSUMER_FRAME,
+    StreamSessionStore,
+    token_payload,
+)
+
+BURST_SECONDS = 0.01
+
+
+async def run(policy: str, tokens: int, rate: float, bandwidth: float) -> None:
+    settings.stream_backpressure_policy = "coalesce" if policy == "none" else policy
+    settings.stream_max_lag_bytes = 0 if policy == "none" else 64 * 1024
+    store = StreamSessionStore()
+    session = store.create("bench")
+    peak_buffered = peak_lag = 0
+    produced_last_at = upstream_done = 0.0
+    started = time.perf_counter()
+
+    async def produce() -> None:
+        nonlocal peak_buffered, peak_lag, produced_last_at, upstream_done
+        per_burst = max(1, int(rate * BURST_SECONDS))
+        for index in range(tokens):
+            if index % per_burst == 0:
+                await asyncio.sleep(BURST_SECONDS)
+            await session.writable()
+            session.publish(token_payload(f" tok{index % 97}"))
+            peak_buffered = max(peak_buffered, session.buffered_bytes)
+            peak_lag = max(peak_lag, session.lag())
+        produced_last_at = time.perf_counter()
+        session.finish()
+        upstream_done = produced_last_at - started
+
+    written = 0
+    debt = 0.0
+    outcome = "complete"
+    received_last_at = 0.0
+    subscription = session.subscribe()
+    session.start(produce())
+    async for frame in subscription:
+        written += len(frame)
+        if frame == REPLAY_GAP_FRAME:
+            outcome = "replay gap"
+        elif frame == SLOW_CONSUMER_FRAME:
+            outcome = "aborted"
+        received_last_at = time.perf_counter()
+        # A bandwidth-limited client: pay for the bytes in 5 ms naps.
+        debt += len(frame) / bandwidth
+        if debt >= 0.005:
+            await asyncio.sleep(debt)
+            debt = 0.0
+    if session.task is not None:
+        await session.task
+
+    latency = max(0.0, received_last_at - produced_last_at) if outcome == "complete" else 0.0
+    print(
+        f"{policy:<9} peak buffer {peak_buffered / 1024:>6.1f} KiB"
+        f"  peak lag {peak_lag / 1024:>6.1f} KiB"
+        f"  written {written / 1024:>6.1f} KiB  upstream done {upstream_done:>5.2f}s"
+        f"  last-token delay {latency * 1000:>6.0f} ms  {outcome}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=6_000)
+    parser.add_argument("--rate", type=float, default=2_000.0, help="upstream tokens/s")
+    parser.add_argument("--bandwidth", type=float, default=64_000.0, help="client bytes/s")
+    args = parser.parse_args()
+
+    client_kib = args.bandwidth / 1024
+    print(f"{args.tokens:,} tokens at {args.rate:,.0f}/s, client at {client_kib:,.0f} KiB/s")
+    for policy in ("none", "coalesce", "block", "abort"):
+        asyncio.run(run(policy, args.tokens, args.rate, args.bandwidth))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Per-token allocations on the provider-to-router streaming path.
+
+Run from ``apps/ai-gateway``: ``python -m benchmarks.bench_stream_alloc [--tokens N]``.
+``before`` is the previous hot path: a pydantic chunk per token, a dict per frame,
+``json.dumps`` and an ``id:``/``data:`` str frame. ``after`` is ``StreamChunk`` with
+``__slots__``, ``token_payload`` and the byte frame ``StreamSession.publish`` builds.
+
+``held`` is the traced memory and live allocation count of N chunks waiting in a
+queue (a slow consumer). ``peak`` is the traced peak while turning N chunks into
+frames that are kept, as the replay buffer does, divided by N. Timing is measured
+separately from tracemalloc.
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+from pydantic import BaseModel
+
+from app.providers.base import StreamChunk, Usage
+from app.stream_sessions import token_payload
+
+STREAM_ID = "0123456789abcdef0123456789abcdef"
+
+
+class PydanticStreamChunk(BaseModel):
+    content: str
+    done: bool
+    usage: Usage | None = None
+
+
+def tokens(count: int) -> list[str]:
+    return [f" tok{index % 97}" for index in range(count)]
+
+
+def before_chunks(words: list[str]) -> list[Any]:
+    return [PydanticStreamChunk(content=word, done=False) for word in words]
+
+
+def after_chunks(words: list[str]) -> list[Any]:
+    return [StreamChunk(content=word, done=False) for word in words]
+
+
+def before_frames(chunks: list[Any]) -> list[Any]:
+    frames = []
+    for seq, chunk in enumerate(chunks, 1):
+        payload = json.dumps({"content": chunk.content, "done": False})
+        frames.append(f"id: {STREAM_ID}:{seq}\ndata: {payload}\n\n")
+    return frames
+
+
+def after_frames(chunks: list[Any]) -> list[Any]:
+    prefix = f"{STREAM_ID}:".encode()
+    frames = []
+    for seq, chunk in enumerate(chunks, 1):
+        frames.append(b"id: %b%d\ndata: %b\n\n" % (prefix, seq, token_payload(chunk.content)))
+    return frames
+
+
+def traced(operation: Callable[[], object]) -> tuple[int, int, int]:
+    """Return live bytes, peak bytes and live allocated blocks after ``operation``."""
+    gc.collect()
+    tracemalloc.start()
+    result = operation()
+    current, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    del result
+    return current, peak, blocks
+
+
+def run(
+    name: str,
+    make_chunks: Callable[[list[str]], list[Any]],
+    make_frames: Callable[[list[Any]], list[Any]],
+    words: list[str],
+) -> None:
+    count = len(words)
+    held, _, held_blocks = traced(lambda: make_chunks(words))
+    chunks = make_chunks(words)
+    _, peak, _ = traced(lambda: make_frames(chunks))
+
+    started = time.perf_counter()
+    make_frames(make_chunks(words))
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<7} held {held / count:>6.1f} B/chunk {held_blocks / count:>4.1f} blocks/chunk"
+        f"  peak {peak / count:>6.1f} B/token"
+        f"  {elapsed / count * 1e9:>7,.0f} ns/token"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=4_000)
+    args = parser.parse_args()
+
+    words = tokens(args.tokens)
+    print(f"{args.tokens:,} tokens")
+    for _ in range(2):
+        run("before", before_chunks, before_frames, words)
+        run("after", after_chunks, after_frames, words)
+
+
+if __name__ == "__main__":
+    main()
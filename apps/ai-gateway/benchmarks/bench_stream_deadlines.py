@@ -0,0 +1,68 @@
+"""Per-token cost of enforcing stream deadlines.
+
+Run from ``apps/ai-gateway``: ``python -m benchmarks.bench_stream_deadlines [--tokens N]``.
+``bare`` iterates a provider-like async generator directly, ``per-read`` wraps every
+read in ``asyncio.timeout_at`` (the straightforward implementation) and ``guard``
+is ``guard_stream`` with all four deadlines enabled.
+"""
+
+import argparse
+import asyncio
+import time
+from collections.abc import AsyncGenerator
+
+from app.providers.base import StreamChunk
+from app.providers.deadlines import StreamDeadlines, guard_stream
+
+DEADLINES = StreamDeadlines(connect=5.0, first_token=30.0, idle=20.0, total=180.0)
+
+
+def provider(count: int) -> AsyncGenerator[StreamChunk, None]:
+    async def stream() -> AsyncGenerator[StreamChunk, None]:
+        for _ in range(count):
+            yield StreamChunk(content=" tok", done=False)
+
+    return stream()
+
+
+async def bare(count: int) -> None:
+    async for _ in provider(count):
+        pass
+
+
+async def per_read(count: int) -> None:
+    loop = asyncio.get_running_loop()
+    chunks = provider(count)
+    while True:
+        try:
+            async with asyncio.timeout_at(loop.time() + 20.0):
+                await anext(chunks)
+        except StopAsyncIteration:
+            return
+
+
+async def guard(count: int) -> None:
+    async for _ in guard_stream(
+        lambda: provider(count), provider="bench", model="bench", deadlines=DEADLINES
+    ):
+        pass
+
+
+async def run(count: int) -> None:
+    for _ in range(2):
+        for name, operation in (("bare", bare), ("per-read", per_read), ("guard", guard)):
+            started = time.perf_counter()
+            await operation(count)
+            elapsed = time.perf_counter() - started
+            print(f"{name:<9} {elapsed / count * 1e9:>7,.0f} ns/token")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=200_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.tokens))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Connections and latency of N concurrent generations over SSE versus one WebSocket.
+
+Run from ``apps/ai-gateway``: ``python -m benchmarks.bench_websocket [--streams N]``.
+The gateway runs under uvicorn on a local port with HMAC service auth enabled and a
+fake provider that emits ``--tokens`` tokens ``--interval`` seconds apart. ``sse`` opens
+one signed ``POST /v1/generate_stream`` per generation, as ``ai_stream_controller``
+does today; ``ws`` signs one ``/v1/ws`` handshake and starts every generation on it.
+
+Columns: peak open TCP connections on the server, signed requests (HMAC checks and
+nonce claims), time to first token (p50/p95) and time to the last stream's end, all
+measured by the client from the moment it starts the generation. Client and server
+share one process and event loop, so client-side parsing is included in the times.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import socket
+import statistics
+import time
+from collections.abc import AsyncGenerator
+
+import httpx
+import uvicorn
+from websockets.asyncio.client import connect
+
+from app.config import settings
+from app.main import app
+from app.providers.base import BaseProvider, GenerateResponse, StreamChunk
+from app.providers.registry import registry
+
+SECRET = "bench-secret"
+REQUEST = {"provider": "bench", "model": "bench-model", "prompt": "Create a lesson plan"}
+
+
+class PacedProvider(BaseProvider):
+    name = "bench"
+    supported_models = ["bench-model"]
+
+    def __init__(self, tokens: int, interval: float) -> None:
+        self.tokens = tokens
+        self.interval = interval
+
+    async def generate(self, *args: object, **kwargs: object) -> GenerateResponse:
+        raise NotImplementedError
+
+    async def stream(self, *args: object, **kwargs: object) -> AsyncGenerator[StreamChunk, None]:
+        for index in range(self.tokens):
+            await asyncio.sleep(self.interval)
+            yield StreamChunk(content=f" tok{index}", done=False)
+        yield StreamChunk(content="", done=True)
+
+
+def signed_headers(method: str, path: str, body: bytes) -> dict[str, str]:
+    timestamp = str(int(time.time()))
+    nonce = f"bench-{time.time_ns()}"
+    canonical = "\n".join([method, path, timestamp, nonce, hashlib.sha256(body).hexdigest()])
+    signature = hmac.new(SECRET.encode(), canonical.encode(), hashlib.sha256).hexdigest()
+    return {
+        "Content-Type": "application/json",
+        "X-Service-Auth-Version": "v1",
+        "X-Service-Timestamp": timestamp,
+        "X-Service-Nonce": nonce,
+        "X-Service-Signature": signature,
+    }
+
+
+async def run_sse(base: str, streams: int) -> tuple[list[float], float, int]:
+    body = json.dumps(REQUEST).encode()
+    first_tokens: list[float] = []
+    limits = httpx.Limits(max_connections=streams, max_keepalive_connections=streams)
+
+    async def one(client: httpx.AsyncClient) -> None:
+        started = time.perf_counter()
+        headers = signed_headers("POST", "/v1/generate_stream", body)
+        async with client.stream(
+            "POST", "/v1/generate_stream", content=body, headers=headers
+        ) as response:
+            first = True
+            async for line in response.aiter_lines():
+                if first and line.startswith("data: "):
+                    first_tokens.append(time.perf_counter() - started)
+                    first = False
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=f"http://{base}", limits=limits, timeout=60) as client:
+        await asyncio.gather(*(one(client) for _ in range(streams)))
+    return first_tokens, time.perf_counter() - started, streams
+
+
+async def run_ws(base: str, streams: int) -> tuple[list[float], float, int]:
+    first_tokens: list[float] = []
+    started_at: dict[str, float] = {}
+    pending: set[str] = set()
+    started = time.perf_counter()
+    headers = signed_headers("GET", "/v1/ws", b"")
+    async with connect(f"ws://{base}/v1/ws", additional_headers=headers) as websocket:
+        for index in range(streams):
+            stream_id = str(index)
+            started_at[stream_id] = time.perf_counter()
+            pending.add(stream_id)
+            await websocket.send(json.dumps({"type": "start", "id": stream_id, "request": REQUEST}))
+        async for raw in websocket:
+            message = json.loads(raw)
+            stream_id = message["id"]
+            if message["type"] == "data" and stream_id in started_at:
+                first_tokens.append(time.perf_counter() - started_at.pop(stream_id))
+            elif message["type"] in ("end", "error"):
+                pending.discard(stream_id)
+                if not pending:
+                    break
+    return first_tokens, time.perf_counter() - started, 1
+
+
+async def measure(name: str, server: uvicorn.Server, base: str, streams: int) -> None:
+    peak = 0
+    done = asyncio.Event()
+
+    async def sample() -> None:
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, len(server.server_state.connections))
+            await asyncio.sleep(0.001)
+
+    sampler = asyncio.create_task(sample())
+    runner = run_sse if name == "sse" else run_ws
+    first_tokens, elapsed, signed = await runner(base, streams)
+    done.set()
+    await sampler
+
+    quantiles = statistics.quantiles(first_tokens, n=20)
+    print(
+        f"{name:<4} peak connections {peak:>4}  signed requests {signed:>4}"
+        f"  first token p50 {statistics.median(first_tokens) * 1000:>6.1f} ms"
+        f"  p95 {quantiles[18] * 1000:>6.1f} ms  all done {elapsed * 1000:>7.1f} ms"
+    )
+
+
+async def main_async(streams: int, tokens: int, interval: float, rounds: int) -> None:
+    logging.getLogger().setLevel(logging.WARNING)
+    settings.service_token = SECRET
+    settings.allow_legacy_bearer_auth = False
+    settings.rate_limit_stream_per_minute = 1_000_000
+    settings.token_budget_enabled = False
+    settings.admission_provider_concurrency = streams * 2
+    settings.admission_model_concurrency = streams * 2
+    settings.adaptive_limits_enabled = False
+    settings.websocket_max_streams_per_connection = streams
+    registry.clear()
+    registry.register("bench", PacedProvider(tokens, interval))
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    config = uvicorn.Config(app, port=port, lifespan="off", log_level="warning")
+    server = uvicorn.Server(config)
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    base = f"127.0.0.1:{port}"
+    print(f"{streams} concurrent streams, {tokens} tokens each, {interval * 1000:.0f} ms apart")
+    try:
+        for _ in range(rounds):
+            await measure("sse", server, base, streams)
+            await measure("ws", server, base, streams)
+    finally:
+        server.should_exit = True
+        await serving
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--streams", type=int, default=40)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.005)
+    parser.add_argument("--rounds", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.streams, args.tokens, args.interval, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
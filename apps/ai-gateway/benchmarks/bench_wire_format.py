@@ -0,0 +1,118 @@
+"""Parse and serialize cost of JSON versus protobuf for 32 KB generate payloads.
+
+Run from ``apps/ai-gateway``: ``python -m benchmarks.bench_wire_format [--size BYTES]``.
+The request and response bodies are about ``--size`` bytes each, almost all of it
+prompt or completion text with quotes, newlines and some non-ASCII characters.
+
+``parse`` rows turn request bytes into a validated ``GenerateRequest``: ``json (before)``
+is FastAPI's ``json.loads`` plus model validation, ``json`` is the new body dependency's
+``model_validate_json``, and ``protobuf`` is ``decode_generate_request``. ``raw`` rows
+only decode the bytes, without building the model. ``serialize`` rows encode a
+``GenerateResponseModel`` the way ``/v1/generate`` does for each format.
+"""
+
+import argparse
+import json
+import time
+from collections.abc import Callable
+
+from app import fast_json
+from app.models.generate import GenerateRequest, GenerateResponseModel
+from app.proto_wire import (
+    GenerateRequestMessage,
+    decode_generate_request,
+    encode_generate_response,
+)
+
+PARAGRAPH = (
+    'Students compare fractions using "benchmark" values such as ½ and 1.\n'
+    "Warm-up: estimate 3/8 + 4/9 — is it more or less than 1? Explain why.\n"
+)
+
+
+def text(size: int) -> str:
+    encoded = (PARAGRAPH * (size // len(PARAGRAPH) + 1)).encode()
+    return encoded[:size].decode(errors="ignore")
+
+
+def per_call(operation: Callable[[], object], seconds: float = 0.5) -> float:
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        for _ in range(50):
+            operation()
+        runs += 50
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return elapsed / runs
+
+
+def report(name: str, operation: Callable[[], object], size: int) -> None:
+    seconds = per_call(operation)
+    print(f"{name:<28} {seconds * 1e6:>8.1f} us  {size:>7,} B")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=32 * 1024)
+    args = parser.parse_args()
+
+    fields = {
+        "provider": "openai",
+        "model": "gpt-4o-mini",
+        # The rest of the body is well under 512 bytes; 32 KB stays under the prompt limit.
+        "prompt": text(args.size - 512),
+        "system_prompt": "You are a K-12 curriculum assistant.",
+        "max_tokens": 4096,
+        "task_type": "lesson_plan",
+        "context": {"tenant_id": 42, "grade": "5", "safety_level": "strict"},
+    }
+    json_body = json.dumps(fields).encode()
+    message = GenerateRequestMessage(**{key: fields[key] for key in fields if key != "context"})
+    message.context["tenant_id"].int_value = 42
+    message.context["grade"].string_value = "5"
+    message.context["safety_level"].string_value = "strict"
+    protobuf_body = message.SerializeToString()
+    assert decode_generate_request(protobuf_body) == GenerateRequest.model_validate_json(json_body)
+
+    response = GenerateResponseModel(
+        content=text(args.size - 512),
+        model="gpt-4o-mini",
+        provider="openai",
+        usage={"prompt_tokens": 8_000, "completion_tokens": 8_000, "total_tokens": 16_000},
+        finish_reason="stop",
+        task_type="lesson_plan",
+        queue_time_ms=3,
+    )
+    json_response = fast_json.dumps(response.model_dump(mode="json"))
+    protobuf_response = encode_generate_response(response)
+
+    print(f"{args.size:,} B prompt and completion, orjson: {fast_json.HAS_ORJSON}")
+    report(
+        "parse json (before)",
+        lambda: GenerateRequest.model_validate(json.loads(json_body)),
+        len(json_body),
+    )
+    report("parse json", lambda: GenerateRequest.model_validate_json(json_body), len(json_body))
+    report("parse protobuf", lambda: decode_generate_request(protobuf_body), len(protobuf_body))
+    report("raw json.loads", lambda: json.loads(json_body), len(json_body))
+    report("raw fast_json.loads", lambda: fast_json.loads(json_body), len(json_body))
+    report(
+        "raw protobuf",
+        lambda: GenerateRequestMessage.FromString(protobuf_body),
+        len(protobuf_body),
+    )
+    report(
+        "serialize json",
+        lambda: fast_json.dumps(response.model_dump(mode="json")),
+        len(json_response),
+    )
+    report(
+        "serialize protobuf",
+        lambda: encode_generate_response(response),
+        len(protobuf_response),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Feed millions of distinct keys through the limiter and report retained memory.
+
+Run from ``apps/ai-gateway``: ``python -m benchmarks.soak_rate_limit [--keys N]``.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from app.config import settings
+from app.rate_limit import GcraRateLimiter
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--keys", type=int, default=3_000_000)
+    parser.add_argument("--max-keys", type=int, default=settings.rate_limit_max_keys)
+    parser.add_argument("--report-every", type=int, default=500_000)
+    args = parser.parse_args()
+
+    settings.rate_limit_max_keys = args.max_keys
+    limiter = GcraRateLimiter()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for index in range(1, args.keys + 1):
+        limiter.allow(f"fingerprint:spoofed-tenant-{index}:/v1/generate", 30, 60)
+        if index % args.report_every == 0:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = limiter.snapshot()
+            print(
+                f"{index:>10,} keys seen  {snapshot['keys']:>8,} tracked"
+                f"  {snapshot['evicted_idle']:>10,} idle / {snapshot['evicted_capacity']:,} live"
+                " evicted"
+                f"  {current / 1024 / 1024:>7.1f} MiB (peak {peak / 1024 / 1024:.1f})"
+                f"  {index / (time.perf_counter() - started):>10,.0f} keys/s"
+            )
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,29 @@
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Sequence
 
 import pytest
 from fastapi.testclient import TestClient
 
+from app.adaptive_limit import adaptive_limits
+from app.admission import admission
 from app.config import settings
+from app.conversations import conversations
 from app.main import app
-from app.providers.base import BaseProvider, GenerateResponse, ProviderError, StreamChunk, Usage
+from app.metrics import metrics
+from app.nonce_store import replay_guard
+from app.prompts.templates import prompt_templates
+from app.providers.base import (
+    BaseProvider,
+    ChatMessage,
+    GenerateResponse,
+    ProviderError,
+    StreamChunk,
+    Usage,
+)
 from app.providers.registry import registry
 from app.rate_limit import rate_limiter
+from app.routers.v1 import batch_provider_slots, batch_tenant_slots
+from app.stream_sessions import stream_sessions
+from app.token_budget import token_budget
 
 
 class FakeProvider(BaseProvider):
@@ -33,6 +49,9 @@ class FakeProvider(BaseProvider):
         temperature: float = 0.7,
         max_tokens: int = 2048,
         system_prompt: str | None = None,
+        cache_system_prompt: bool = False,
+        system_context: str | None = None,
+        history: Sequence[ChatMessage] = (),
     ) -> GenerateResponse:
         self.last_generate_call = {
             "prompt": prompt,
@@ -40,6 +59,9 @@ class FakeProvider(BaseProvider):
             "temperature": temperature,
             "max_tokens": max_tokens,
             "system_prompt": system_prompt,
+            "cache_system_prompt": cache_system_prompt,
+            "system_context": system_context,
+            "history": list(history),
         }
         if self.generate_error is not None:
             raise self.generate_error
@@ -59,6 +81,9 @@ class FakeProvider(BaseProvider):
         temperature: float = 0.7,
         max_tokens: int = 2048,
         system_prompt: str | None = None,
+        cache_system_prompt: bool = False,
+        system_context: str | None = None,
+        history: Sequence[ChatMessage] = (),
     ) -> AsyncGenerator[StreamChunk, None]:
         self.last_stream_call = {
             "prompt": prompt,
@@ -66,6 +91,9 @@ class FakeProvider(BaseProvider):
             "temperature": temperature,
             "max_tokens": max_tokens,
             "system_prompt": system_prompt,
+            "cache_system_prompt": cache_system_prompt,
+            "system_context": system_context,
+            "history": list(history),
         }
         if self.stream_error is not None:
             raise self.stream_error
@@ -79,16 +107,54 @@ class FakeProvider(BaseProvider):
 
 
 @pytest.fixture(autouse=True)
-def reset_registry():
+def reset_registry(tmp_path):
     registry.clear()
+    settings.job_store_path = str(tmp_path / "jobs.sqlite3")
     settings.service_token = ""
     settings.allow_legacy_bearer_auth = True
     settings.rate_limit_generate_per_minute = 30
     settings.rate_limit_stream_per_minute = 15
+    settings.rate_limit_max_keys = 200_000
+    settings.service_auth_max_nonces = 100_000
+    settings.nonce_store_fail_open = False
+    settings.token_budget_enabled = True
+    settings.token_budget_per_minute = 200_000
+    settings.token_budget_per_day = 0
+    settings.token_budget_tenant_per_day = {}
+    settings.stream_resume_grace_seconds = 30
+    settings.stream_detach_cancel_seconds = 5.0
+    settings.stream_connect_timeout_seconds = 5.0
+    settings.stream_first_token_timeout_seconds = 30.0
+    settings.stream_idle_timeout_seconds = 20.0
+    settings.stream_total_timeout_seconds = 180.0
+    settings.stream_retry_attempts = 1
+    settings.stream_backpressure_policy = "coalesce"
+    settings.stream_max_lag_bytes = 64 * 1024
+    settings.stream_backpressure_block_seconds = 10.0
+    settings.stream_heartbeat_seconds = 15.0
+    settings.websocket_max_streams_per_connection = 32
+    settings.websocket_initial_credits = 64
+    settings.conversation_ttl_seconds = 1800
+    settings.conversation_max_count = 10_000
+    settings.conversation_max_bytes_per_conversation = 256 * 1024
+    settings.conversation_max_total_bytes = 64 * 1024 * 1024
+    settings.request_body_max_bytes = 256 * 1024
+    settings.request_body_timeout_seconds = 30.0
     rate_limiter.reset()
+    replay_guard.reset()
+    stream_sessions.reset()
+    conversations.reset()
+    prompt_templates.reset()
+    batch_tenant_slots.reset()
+    batch_provider_slots.reset()
+    admission.reset()
+    adaptive_limits.reset()
+    token_budget.reset()
+    metrics.reset()
     yield
     registry.clear()
     rate_limiter.reset()
+    stream_sessions.reset()
 
 
 @pytest.fixture
@@ -0,0 +1,153 @@
+import time
+from datetime import UTC, datetime, timedelta
+from email.utils import format_datetime
+
+import pytest
+
+from app.adaptive_limit import AdaptiveLimiter, RateLimitSnapshot, parse_rate_limit_headers
+from app.admission import AdmissionController, AdmissionRejected, Priority, adaptive_limits
+from app.config import settings
+from app.metrics import metrics
+
+
+def test_parses_openai_rate_limit_headers() -> None:
+    snapshot = parse_rate_limit_headers(
+        {
+            "x-ratelimit-limit-requests": "500",
+            "x-ratelimit-remaining-requests": "12",
+            "x-ratelimit-limit-tokens": "30000",
+            "x-ratelimit-remaining-tokens": "2900",
+            "x-ratelimit-reset-requests": "1m30s",
+            "x-ratelimit-reset-tokens": "250ms",
+            "retry-after": "2",
+        }
+    )
+
+    assert snapshot.remaining_requests == 12
+    assert snapshot.limit_requests == 500
+    assert snapshot.remaining_tokens == 2900
+    assert snapshot.limit_tokens == 30000
+    assert snapshot.reset_seconds == pytest.approx(90.0)
+    assert snapshot.retry_after == 2.0
+
+
+def test_parses_anthropic_rate_limit_headers() -> None:
+    reset_at = (datetime.now(UTC) + timedelta(seconds=30)).isoformat().replace("+00:00", "Z")
+
+    snapshot = parse_rate_limit_headers(
+        {
+            "anthropic-ratelimit-requests-limit": "50",
+            "anthropic-ratelimit-requests-remaining": "0",
+            "anthropic-ratelimit-requests-reset": reset_at,
+        }
+    )
+
+    assert snapshot.remaining_requests == 0
+    assert snapshot.limit_requests == 50
+    assert snapshot.reset_seconds == pytest.approx(30.0, abs=2.0)
+    assert parse_rate_limit_headers({"retry-after": "soon"}).retry_after is None
+
+
+def test_parses_http_date_retry_after() -> None:
+    retry_at = format_datetime(datetime.now(UTC) + timedelta(seconds=20), usegmt=True)
+
+    snapshot = parse_rate_limit_headers({"retry-after": retry_at})
+
+    assert snapshot.retry_after == pytest.approx(20.0, abs=2.0)
+
+
+def test_stable_latency_grows_limit_additively() -> None:
+    limiter = AdaptiveLimiter()
+    for _ in range(40):
+        limiter.record_response(
+            "openai", "gpt-4o", status_code=200, latency_seconds=0.5, snapshot=RateLimitSnapshot()
+        )
+
+    assert limiter.current_limit("openai", "gpt-4o") > settings.adaptive_limit_initial
+    assert metrics.gauge("adaptive_concurrency_limit", provider="openai", model="gpt-4o") == (
+        limiter.current_limit("openai", "gpt-4o")
+    )
+
+
+def test_rate_limited_response_halves_limit_and_pauses() -> None:
+    limiter = AdaptiveLimiter()
+
+    limiter.record_response(
+        "openai",
+        "gpt-4o",
+        status_code=429,
+        latency_seconds=0.1,
+        snapshot=RateLimitSnapshot(retry_after=3.0),
+    )
+
+    assert limiter.current_limit("openai", "gpt-4o") == settings.adaptive_limit_initial // 2
+    assert 2.0 < limiter.pause_remaining("openai", "gpt-4o") <= 3.0
+
+
+def test_latency_growth_and_timeouts_reduce_limit() -> None:
+    limiter = AdaptiveLimiter()
+    limiter.record_response(
+        "anthropic", "claude", status_code=200, latency_seconds=0.2, snapshot=RateLimitSnapshot()
+    )
+    limiter.record_response(
+        "anthropic", "claude", status_code=200, latency_seconds=2.0, snapshot=RateLimitSnapshot()
+    )
+    after_latency = limiter.current_limit("anthropic", "claude")
+    limiter.record_timeout("anthropic", "claude")
+
+    assert after_latency < settings.adaptive_limit_initial
+    assert limiter.current_limit("anthropic", "claude") < after_latency
+
+
+def test_mixed_stream_and_generate_latencies_do_not_collapse_limit() -> None:
+    limiter = AdaptiveLimiter()
+    # Streams report time to headers, generates the whole completion; both are stable.
+    for _ in range(40):
+        limiter.record_response(
+            "openai",
+            "gpt-4o",
+            status_code=200,
+            latency_seconds=0.3,
+            snapshot=RateLimitSnapshot(),
+            kind="stream",
+        )
+        limiter.record_response(
+            "openai", "gpt-4o", status_code=200, latency_seconds=6.0, snapshot=RateLimitSnapshot()
+        )
+
+    assert limiter.current_limit("openai", "gpt-4o") > settings.adaptive_limit_initial
+
+
+def test_low_remaining_quota_throttles_before_upstream_rejects() -> None:
+    limiter = AdaptiveLimiter()
+
+    limiter.record_response(
+        "openai",
+        "gpt-4o",
+        status_code=200,
+        latency_seconds=0.2,
+        snapshot=RateLimitSnapshot(remaining_requests=0, limit_requests=100, reset_seconds=5.0),
+    )
+
+    assert limiter.current_limit("openai", "gpt-4o") < settings.adaptive_limit_initial
+    assert limiter.pause_remaining("openai", "gpt-4o") > 4.0
+
+
+@pytest.mark.asyncio
+async def test_admission_rejects_when_pause_outlasts_deadline() -> None:
+    adaptive_limits.record_response(
+        "openai",
+        "gpt-4o",
+        status_code=429,
+        latency_seconds=0.1,
+        snapshot=RateLimitSnapshot(retry_after=30.0),
+    )
+    controller = AdmissionController()
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        await controller.acquire(
+            "openai", "gpt-4o", priority=Priority.STANDARD, deadline=time.monotonic() + 1
+        )
+
+    assert excinfo.value.reason == "rate_limited"
+    assert controller.model_limit("openai", "gpt-4o") == settings.adaptive_limit_initial // 2
@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+import pytest
+
+from app.admission import AdmissionController, AdmissionRejected, Priority, resolve_priority
+from app.config import settings
+from app.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def admission_limits():
+    settings.admission_provider_concurrency = 1
+    settings.admission_model_concurrency = 1
+    settings.admission_max_queue_depth = 256
+    yield
+    settings.admission_provider_concurrency = 64
+    settings.admission_model_concurrency = 32
+    settings.admission_provider_limits = {}
+    settings.admission_max_queue_depth = 256
+    settings.admission_task_type_priorities = {}
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_served_in_priority_order() -> None:
+    controller = AdmissionController()
+    holder = await controller.acquire("openai", "gpt-4o", priority=Priority.STANDARD)
+    order: list[str] = []
+
+    async def wait_for_slot(name: str, priority: Priority) -> None:
+        ticket = await controller.acquire("openai", "gpt-4o", priority=priority)
+        order.append(name)
+        ticket.release()
+
+    waiters = [
+        asyncio.create_task(wait_for_slot("batch", Priority.BATCH)),
+        asyncio.create_task(wait_for_slot("standard", Priority.STANDARD)),
+        asyncio.create_task(wait_for_slot("interactive", Priority.INTERACTIVE)),
+    ]
+    await asyncio.sleep(0)
+    holder.release()
+    await asyncio.gather(*waiters)
+
+    assert order == ["interactive", "standard", "batch"]
+
+
+@pytest.mark.asyncio
+async def test_model_limit_does_not_block_other_models() -> None:
+    settings.admission_provider_concurrency = 4
+    controller = AdmissionController()
+    await controller.acquire("openai", "gpt-4o", priority=Priority.STANDARD)
+    blocked = asyncio.create_task(
+        controller.acquire("openai", "gpt-4o", priority=Priority.INTERACTIVE)
+    )
+    await asyncio.sleep(0)
+
+    other = await asyncio.wait_for(
+        controller.acquire("openai", "gpt-4o-mini", priority=Priority.BATCH), timeout=1
+    )
+
+    assert other.queue_time_ms >= 0
+    assert not blocked.done()
+    blocked.cancel()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_preempts_lower_priority_waiters() -> None:
+    settings.admission_max_queue_depth = 1
+    controller = AdmissionController()
+    await controller.acquire("openai", "gpt-4o", priority=Priority.STANDARD)
+    batch = asyncio.create_task(controller.acquire("openai", "gpt-4o", priority=Priority.BATCH))
+    await asyncio.sleep(0)
+
+    interactive = asyncio.create_task(
+        controller.acquire("openai", "gpt-4o", priority=Priority.INTERACTIVE)
+    )
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        await batch
+    assert excinfo.value.reason == "preempted"
+    with pytest.raises(AdmissionRejected) as full:
+        await controller.acquire("openai", "gpt-4o", priority=Priority.BATCH)
+    assert full.value.reason == "queue_full"
+    interactive.cancel()
+
+
+@pytest.mark.asyncio
+async def test_rejects_early_when_estimated_wait_exceeds_deadline() -> None:
+    controller = AdmissionController()
+    await controller.acquire("openai", "gpt-4o", priority=Priority.STANDARD)
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        await controller.acquire(
+            "openai",
+            "gpt-4o",
+            priority=Priority.STANDARD,
+            deadline=time.monotonic() + 0.01,
+        )
+
+    assert excinfo.value.reason == "deadline"
+    assert controller.snapshot()["openai"]["queued"] == 0
+    assert metrics.counter("admission_rejected_total", provider="openai", reason="deadline") == 1
+
+
+@pytest.mark.asyncio
+async def test_reports_queue_time_and_releases_slot_once() -> None:
+    controller = AdmissionController()
+    holder = await controller.acquire("openai", "gpt-4o", priority=Priority.STANDARD)
+    waiter = asyncio.create_task(controller.acquire("openai", "gpt-4o", priority=Priority.STANDARD))
+    await asyncio.sleep(0.02)
+    holder.release()
+    holder.release()
+    ticket = await waiter
+
+    assert ticket.queue_time_ms >= 10
+    assert controller.snapshot()["openai"]["in_use"] == 1
+    ticket.release()
+    assert controller.snapshot()["openai"]["in_use"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue() -> None:
+    controller = AdmissionController()
+    await controller.acquire("openai", "gpt-4o", priority=Priority.STANDARD)
+    waiter = asyncio.create_task(controller.acquire("openai", "gpt-4o", priority=Priority.STANDARD))
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert controller.snapshot()["openai"]["queued"] == 0
+
+
+def test_resolve_priority_prefers_context_flag_then_task_type() -> None:
+    settings.admission_task_type_priorities = {"unit_generation": "batch"}
+
+    assert resolve_priority({"priority": "interactive"}, "unit_generation", Priority.STANDARD) == (
+        Priority.INTERACTIVE
+    )
+    assert resolve_priority(None, "unit_generation", Priority.STANDARD) == Priority.BATCH
+    assert resolve_priority({"priority": "bogus"}, "rewrite", Priority.STANDARD) == (
+        Priority.STANDARD
+    )
@@ -1,15 +1,27 @@
+import json
 from unittest.mock import AsyncMock, MagicMock
 
 import httpx
 import pytest
 
+from app import fast_json
+from app.adaptive_limit import adaptive_limits
+from app.config import settings
 from app.providers.anthropic_provider import AnthropicProvider
-from app.providers.base import ProviderError
+from app.providers.base import ChatMessage, ProviderError
 
 
 class FakeStreamResponse:
-    def __init__(self, *, status_code: int, lines: list[str], body: bytes = b"") -> None:
+    def __init__(
+        self,
+        *,
+        status_code: int,
+        lines: list[str],
+        body: bytes = b"",
+        headers: dict[str, str] | None = None,
+    ) -> None:
         self.status_code = status_code
+        self.headers = headers or {}
         self._lines = lines
         self._body = body
 
@@ -22,9 +34,13 @@ class FakeStreamResponse:
     async def aread(self) -> bytes:
         return self._body
 
-    async def aiter_lines(self):
-        for line in self._lines:
-            yield line
+    async def aiter_bytes(self):
+        # Each data line ends an event; split into small chunks to exercise reassembly.
+        body = "".join(
+            line + ("\n\n" if line.startswith("data:") else "\n") for line in self._lines
+        ).encode()
+        for start in range(0, len(body), 7):
+            yield body[start : start + 7]
 
 
 @pytest.mark.asyncio
@@ -101,6 +117,40 @@ async def test_stream_emits_content_and_final_usage() -> None:
     assert chunks[1].usage.total_tokens == 11
 
 
+@pytest.mark.asyncio
+async def test_stream_skips_decoding_events_it_does_not_use(monkeypatch) -> None:
+    provider = AnthropicProvider(api_key="test-key")
+    stream_response = FakeStreamResponse(
+        status_code=200,
+        lines=[
+            "event: ping",
+            'data: {"type": "ping"}',
+            "event: content_block_start",
+            'data: {"type":"content_block_start","content_block":{"type":"text","text":""}}',
+            "event: content_block_delta",
+            'data: {"type":"content_block_delta","delta":{"text":"Hi"}}',
+            "event: message_stop",
+            'data: {"type":"message_stop"}',
+        ],
+    )
+    provider._client = MagicMock(stream=MagicMock(return_value=stream_response), aclose=AsyncMock())
+    decoded: list[bytes] = []
+    loads = fast_json.loads
+
+    def counting_loads(data):
+        decoded.append(bytes(data))
+        return loads(data)
+
+    monkeypatch.setattr(fast_json, "loads", counting_loads)
+
+    chunks = [
+        chunk async for chunk in provider.stream(prompt="hi", model="claude-haiku-4-5-20251001")
+    ]
+
+    assert [chunk.content for chunk in chunks] == ["Hi", ""]
+    assert len(decoded) == 2
+
+
 @pytest.mark.asyncio
 async def test_stream_raises_for_non_200() -> None:
     provider = AnthropicProvider(api_key="test-key")
@@ -131,3 +181,185 @@ async def test_close_closes_underlying_client() -> None:
     await provider.close()
 
     provider._client.aclose.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_generate_marks_static_system_prompt_cacheable_against_stub_api() -> None:
+    captured: list[httpx.Request] = []
+
+    def stub_api(request: httpx.Request) -> httpx.Response:
+        captured.append(request)
+        return httpx.Response(
+            200,
+            json={
+                "content": [{"text": "lesson"}],
+                "usage": {
+                    "input_tokens": 5,
+                    "cache_read_input_tokens": 900,
+                    "cache_creation_input_tokens": 0,
+                    "output_tokens": 3,
+                },
+                "stop_reason": "end_turn",
+            },
+        )
+
+    provider = AnthropicProvider(api_key="test-key", base_url="http://stub.local/v1")
+    provider._client = httpx.AsyncClient(transport=httpx.MockTransport(stub_api))
+
+    result = await provider.generate(
+        prompt="hi",
+        model="claude-haiku-4-5-20251001",
+        system_prompt="static system prompt",
+        cache_system_prompt=True,
+    )
+    await provider.close()
+
+    assert str(captured[0].url) == "http://stub.local/v1/messages"
+    body = json.loads(captured[0].content)
+    assert body["system"] == [
+        {
+            "type": "text",
+            "text": "static system prompt",
+            "cache_control": {"type": "ephemeral"},
+        }
+    ]
+    assert result.usage.cached_tokens == 900
+    assert result.usage.prompt_tokens == 905
+    assert result.usage.total_tokens == 908
+
+
+@pytest.mark.asyncio
+async def test_generate_sends_plain_system_prompt_when_not_cacheable() -> None:
+    captured: list[httpx.Request] = []
+
+    def stub_api(request: httpx.Request) -> httpx.Response:
+        captured.append(request)
+        return httpx.Response(
+            200,
+            json={
+                "content": [{"text": "lesson"}],
+                "usage": {"input_tokens": 2, "output_tokens": 3},
+            },
+        )
+
+    provider = AnthropicProvider(api_key="test-key", base_url="http://stub.local/v1")
+    provider._client = httpx.AsyncClient(transport=httpx.MockTransport(stub_api))
+
+    result = await provider.generate(
+        prompt="hi", model="claude-haiku-4-5-20251001", system_prompt="caller prompt"
+    )
+    await provider.close()
+
+    assert json.loads(captured[0].content)["system"] == "caller prompt"
+    assert result.usage.cached_tokens == 0
+
+
+@pytest.mark.asyncio
+async def test_generate_sends_system_context_after_cached_system_prompt() -> None:
+    provider = AnthropicProvider(api_key="test-key")
+    response = MagicMock(status_code=200, text="")
+    response.json.return_value = {
+        "content": [{"text": "lesson"}],
+        "usage": {"input_tokens": 2, "output_tokens": 3},
+    }
+    provider._client = MagicMock(post=AsyncMock(return_value=response), aclose=AsyncMock())
+
+    await provider.generate(
+        prompt="hi",
+        model="claude-haiku-4-5-20251001",
+        system_prompt="static system prompt",
+        cache_system_prompt=True,
+        system_context="Grade level: 5.",
+    )
+
+    assert provider._client.post.call_args.kwargs["json"]["system"] == [
+        {
+            "type": "text",
+            "text": "static system prompt",
+            "cache_control": {"type": "ephemeral"},
+        },
+        {"type": "text", "text": "Grade level: 5."},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_generate_marks_end_of_conversation_history_cacheable() -> None:
+    provider = AnthropicProvider(api_key="test-key")
+    response = MagicMock(status_code=200, text="")
+    response.json.return_value = {
+        "content": [{"text": "lesson"}],
+        "usage": {"input_tokens": 2, "output_tokens": 3},
+    }
+    provider._client = MagicMock(post=AsyncMock(return_value=response), aclose=AsyncMock())
+
+    await provider.generate(
+        prompt="Make it easier",
+        model="claude-haiku-4-5-20251001",
+        history=[ChatMessage("user", "Warm-up"), ChatMessage("assistant", "Halve it")],
+    )
+
+    assert provider._client.post.call_args.kwargs["json"]["messages"] == [
+        {"role": "user", "content": "Warm-up"},
+        {
+            "role": "assistant",
+            "content": [
+                {"type": "text", "text": "Halve it", "cache_control": {"type": "ephemeral"}}
+            ],
+        },
+        {"role": "user", "content": "Make it easier"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stream_reports_cache_usage_from_message_start() -> None:
+    provider = AnthropicProvider(api_key="test-key")
+    stream_response = FakeStreamResponse(
+        status_code=200,
+        lines=[
+            (
+                'data: {"type":"message_start","message":{"usage":{"input_tokens":7,'
+                '"cache_read_input_tokens":100,"cache_creation_input_tokens":20}}}'
+            ),
+            'data: {"type":"message_delta","usage":{"output_tokens":4}}',
+            'data: {"type":"message_stop"}',
+        ],
+    )
+    provider._client = MagicMock(stream=MagicMock(return_value=stream_response), aclose=AsyncMock())
+
+    chunks = [
+        chunk
+        async for chunk in provider.stream(
+            prompt="hi",
+            model="claude-haiku-4-5-20251001",
+            system_prompt="static",
+            cache_system_prompt=True,
+        )
+    ]
+
+    usage = chunks[-1].usage
+    assert usage is not None
+    assert usage.cached_tokens == 100
+    assert usage.cache_creation_tokens == 20
+    assert usage.prompt_tokens == 127
+    body = provider._client.stream.call_args.kwargs["json"]
+    assert body["system"][0]["cache_control"] == {"type": "ephemeral"}
+
+
+@pytest.mark.asyncio
+async def test_stream_records_rate_limit_headers_and_retry_after() -> None:
+    provider = AnthropicProvider(api_key="test-key")
+    stream_response = FakeStreamResponse(
+        status_code=529,
+        lines=[],
+        body=b"overloaded",
+        headers={"retry-after": "4"},
+    )
+    provider._client = MagicMock(stream=MagicMock(return_value=stream_response), aclose=AsyncMock())
+
+    with pytest.raises(ProviderError) as excinfo:
+        [chunk async for chunk in provider.stream(prompt="hi", model="claude-haiku-4-5-20251001")]
+
+    assert excinfo.value.retry_after == 4.0
+    assert adaptive_limits.current_limit("anthropic", "claude-haiku-4-5-20251001") == (
+        settings.adaptive_limit_initial // 2
+    )
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.concurrency import KeyedSemaphore
+
+
+@pytest.mark.asyncio
+async def test_hold_limits_each_key_and_drops_idle_keys() -> None:
+    slots = KeyedSemaphore()
+    release = asyncio.Event()
+    entered: list[str] = []
+
+    async def work(key: str) -> None:
+        async with slots.hold(key, 2):
+            entered.append(key)
+            await release.wait()
+
+    tasks = [asyncio.create_task(work(key)) for key in ("tenant-a",) * 3 + ("tenant-b",)]
+    await asyncio.sleep(0)
+
+    assert sorted(entered) == ["tenant-a", "tenant-a", "tenant-b"]
+    assert (slots.in_use("tenant-a"), slots.in_use("tenant-b")) == (3, 1)
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert len(entered) == 4
+    assert len(slots) == 0
+
+
+@pytest.mark.asyncio
+async def test_changed_limit_applies_only_once_idle() -> None:
+    slots = KeyedSemaphore()
+    release = asyncio.Event()
+    running = 0
+    peak = 0
+
+    async def work(limit: int) -> None:
+        nonlocal running, peak
+        async with slots.hold("tenant-a", limit):
+            running += 1
+            peak = max(peak, running)
+            await release.wait()
+            running -= 1
+
+    # The key is busy with a limit of 1, so callers asking for 3 still queue behind it.
+    busy = [asyncio.create_task(work(1)), asyncio.create_task(work(3))]
+    await asyncio.sleep(0)
+    assert peak == 1
+    release.set()
+    await asyncio.gather(*busy)
+
+    release.clear()
+    resized = [asyncio.create_task(work(3)) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert running == 3
+    release.set()
+    await asyncio.gather(*resized)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_its_key() -> None:
+    slots = KeyedSemaphore()
+
+    async def wait_for_slot() -> None:
+        async with slots.hold("tenant-a", 1):
+            pass
+
+    async with slots.hold("tenant-a", 1):
+        waiter = asyncio.create_task(wait_for_slot())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    assert len(slots) == 0
@@ -0,0 +1,175 @@
+import pytest
+
+from app.config import settings
+from app.conversations import ConversationBusyError, ConversationStore
+from app.metrics import metrics
+from app.providers.base import ChatMessage
+from app.providers.registry import registry
+from tests.conftest import FakeProvider
+from tests.test_websocket import StallingProvider
+
+REQUEST = {"provider": "fake", "model": "fake-model"}
+
+
+def start_conversation(client) -> str:
+    response = client.post("/v1/conversations")
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def test_store_evicts_least_recently_used_idle_conversations():
+    settings.conversation_max_total_bytes = 250
+    store = ConversationStore()
+    oldest = store.create("owner")
+    busy = store.create("owner")
+    recent = store.create("owner")
+    for conversation in (oldest, busy, recent):
+        store.append(conversation, "q" * 40, "a" * 40, "strict")
+    assert store.checkout(busy.conversation_id, "owner") is busy
+    store.get(oldest.conversation_id, "owner")
+
+    newest = store.create("owner")
+    store.append(newest, "q" * 40, "a" * 40, "strict")
+
+    # ``recent`` is the least recently used conversation without a turn in progress.
+    assert store.get(recent.conversation_id, "owner") is None
+    assert store.get(oldest.conversation_id, "owner") is oldest
+    assert store.get(busy.conversation_id, "owner") is busy
+    assert store.total_bytes == 240
+    assert metrics.counter("conversations_removed_total", reason="evicted") == 1
+
+
+def test_store_trims_oldest_exchanges_past_the_per_conversation_cap():
+    settings.conversation_max_bytes_per_conversation = 120
+    store = ConversationStore()
+    conversation = store.create("owner")
+
+    for index in range(3):
+        store.append(conversation, f"question {index}" + "." * 20, "answer" + "." * 20, "strict")
+
+    assert [message.content[:10] for message in conversation.history()] == [
+        "question 1",
+        "answer....",
+        "question 2",
+        "answer....",
+    ]
+    assert conversation.size == store.total_bytes == 112
+    assert conversation.history_tokens == 30
+    assert metrics.counter("conversation_turns_trimmed_total") == 1
+
+
+def test_store_expires_idle_conversations_and_limits_turns_to_one():
+    store = ConversationStore()
+    conversation = store.create("owner")
+
+    assert store.get(conversation.conversation_id, "other-owner") is None
+    assert store.checkout(conversation.conversation_id, "owner") is conversation
+    with pytest.raises(ConversationBusyError):
+        store.checkout(conversation.conversation_id, "owner")
+
+    settings.conversation_ttl_seconds = 0
+    store.sweep()
+    assert len(store) == 1  # a running turn keeps its conversation
+
+    store.release(conversation)
+    store.sweep()
+    assert len(store) == 0
+    assert metrics.counter("conversations_removed_total", reason="expired") == 1
+
+
+def test_turns_send_only_the_new_prompt_and_reuse_stored_history(client):
+    provider = FakeProvider(content="Try halving the denominator")
+    registry.register("fake", provider)
+    conversation_id = start_conversation(client)
+
+    for prompt in ("Create a fractions warm-up", "Make it easier"):
+        response = client.post(
+            "/v1/generate",
+            json={**REQUEST, "prompt": prompt, "conversation_id": conversation_id},
+        )
+        assert response.status_code == 200
+
+    assert provider.last_generate_call["prompt"] == "Make it easier"
+    assert provider.last_generate_call["history"] == [
+        ChatMessage("user", "Create a fractions warm-up"),
+        ChatMessage("assistant", "Try halving the denominator"),
+    ]
+    # The second turn scanned only its own prompt; both stored messages were cached.
+    assert metrics.counter("conversation_safety_cached_messages_total") == 2
+
+    messages = client.get(f"/v1/conversations/{conversation_id}").json()["messages"]
+    assert [message["role"] for message in messages] == ["user", "assistant"] * 2
+
+
+def test_stream_turn_is_stored_once_the_stream_completes(client):
+    provider = FakeProvider()
+    registry.register("fake", provider)
+    conversation_id = start_conversation(client)
+    body = {**REQUEST, "prompt": "Create a lesson plan", "conversation_id": conversation_id}
+
+    with client.stream("POST", "/v1/generate_stream", json=body) as response:
+        assert response.status_code == 200
+        response.read()
+    response = client.post("/v1/generate_stream", json={**body, "prompt": "Shorter, please"})
+
+    assert response.status_code == 200
+    assert provider.last_stream_call["history"] == [
+        ChatMessage("user", "Create a lesson plan"),
+        ChatMessage("assistant", "partial"),
+    ]
+
+
+def test_history_is_rescanned_once_at_a_stricter_safety_level(client):
+    registry.register("fake", FakeProvider())
+    conversation_id = start_conversation(client)
+    moderate = {"safety_level": "moderate"}
+
+    response = client.post(
+        "/v1/generate",
+        json={
+            **REQUEST,
+            "prompt": "Plan a lesson on what to do about a bully",
+            "conversation_id": conversation_id,
+            "context": moderate,
+        },
+    )
+    assert response.status_code == 200
+
+    strict = client.post(
+        "/v1/generate",
+        json={**REQUEST, "prompt": "Add an exit ticket", "conversation_id": conversation_id},
+    )
+    assert strict.status_code == 422
+    assert strict.json()["detail"]["detail"] == "Conversation history did not pass safety review"
+
+    # The rejected turn was not stored, and the conversation is free for the next one.
+    again = client.post(
+        "/v1/generate",
+        json={
+            **REQUEST,
+            "prompt": "Add an exit ticket",
+            "conversation_id": conversation_id,
+            "context": moderate,
+        },
+    )
+    assert again.status_code == 200
+
+
+def test_unknown_busy_and_deleted_conversations(client):
+    registry.register("fake", StallingProvider())
+    conversation_id = start_conversation(client)
+    body = {**REQUEST, "prompt": "Create a lesson plan", "conversation_id": conversation_id}
+
+    missing = client.post("/v1/generate", json={**body, "conversation_id": "missing"})
+    assert missing.status_code == 404
+
+    with client.websocket_connect("/v1/ws") as websocket:
+        websocket.send_json({"type": "start", "id": "a", "request": body})
+        assert websocket.receive_json()["type"] == "data"
+        websocket.send_json({"type": "start", "id": "b", "request": body})
+        busy = websocket.receive_json()
+    assert (busy["id"], busy["status"]) == ("b", 409)
+
+    assert client.delete(f"/v1/conversations/{conversation_id}").status_code == 204
+    assert client.get(f"/v1/conversations/{conversation_id}").status_code == 404
+    assert client.post("/v1/generate", json=body).status_code == 404
@@ -0,0 +1,161 @@
+import time
+
+import pytest
+
+from app.admission import Priority, admission
+from app.config import settings
+from app.deadlines import (
+    DeadlineMiddleware,
+    RequestDeadline,
+    bind_deadline,
+    parse_deadline,
+    remaining_budget,
+    unbind_deadline,
+)
+from app.main import app
+from app.metrics import metrics
+from app.providers.deadlines import StreamDeadlines
+from app.providers.registry import registry
+from tests.conftest import FakeProvider
+
+PAYLOAD = {"provider": "fake", "model": "fake-model", "prompt": "Create a lesson plan"}
+
+
+def scope_with(*headers: tuple[bytes, bytes]) -> dict[str, object]:
+    return {"type": "http", "headers": list(headers)}
+
+
+def test_parse_deadline_accepts_relative_and_absolute_headers() -> None:
+    now = time.monotonic()
+
+    relative = parse_deadline(scope_with((b"x-request-timeout-ms", b"1500")))
+    absolute = parse_deadline(scope_with((b"x-request-deadline", str(time.time() + 3).encode())))
+
+    assert relative is not None and 1.4 < relative - now < 1.6
+    assert absolute is not None and 2.9 < absolute - now < 3.1
+    assert parse_deadline(scope_with()) is None
+
+
+def test_parse_deadline_uses_the_earlier_of_both_headers() -> None:
+    deadline = parse_deadline(
+        scope_with(
+            (b"x-request-deadline", str(time.time() + 60).encode()),
+            (b"x-request-timeout-ms", b"500"),
+        )
+    )
+
+    assert deadline is not None and deadline - time.monotonic() < 1
+
+
+@pytest.mark.parametrize("value", [b"soon", b"-5", b"nan", b"inf"])
+def test_parse_deadline_rejects_malformed_values(value: bytes) -> None:
+    with pytest.raises(ValueError, match="X-Request-Timeout-Ms"):
+        parse_deadline(scope_with((b"x-request-timeout-ms", value)))
+
+
+def test_remaining_budget_caps_upstream_timeouts_only_under_a_deadline() -> None:
+    assert remaining_budget(120.0) == 120.0
+
+    token = bind_deadline(RequestDeadline(time.monotonic() + 2, "/v1/generate"))
+    try:
+        budget = remaining_budget(120.0)
+        deadlines = StreamDeadlines.from_settings()
+    finally:
+        unbind_deadline(token)
+
+    assert budget is not None and budget <= 2
+    assert deadlines.total is not None and deadlines.total <= 2
+    assert deadlines.first_token is not None and deadlines.first_token <= 2
+    assert deadlines.idle == settings.stream_idle_timeout_seconds
+
+
+def test_expired_request_is_shed_on_arrival(client):
+    registry.register("fake", FakeProvider())
+
+    response = client.post(
+        "/v1/generate",
+        json=PAYLOAD,
+        headers={"X-Request-Deadline": str(time.time() - 1)},
+    )
+
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Request deadline exceeded"}
+    assert (
+        metrics.counter("request_deadline_missed_total", route="/v1/generate", stage="arrival") == 1
+    )
+
+
+def test_deadline_misses_are_labelled_by_route_template(client):
+    expired = {"X-Request-Deadline": str(time.time() - 1)}
+
+    for job_id in ("job-a", "job-b"):
+        assert client.get(f"/v1/jobs/{job_id}", headers=expired).status_code == 504
+    assert client.get("/not-a-route", headers=expired).status_code == 504
+
+    routes = [
+        counter["labels"]["route"]
+        for counter in metrics.snapshot()["counters"]
+        if counter["name"] == "request_deadline_missed_total"
+    ]
+    assert sorted(routes) == ["/v1/jobs/{job_id}", "other"]
+    assert (
+        metrics.counter("request_deadline_missed_total", route="/v1/jobs/{job_id}", stage="arrival")
+        == 2
+    )
+
+
+def test_deadline_middleware_is_outermost():
+    # The last middleware added wraps every other one, including the request logger.
+    assert app.user_middleware[0].cls is DeadlineMiddleware
+
+
+def test_malformed_deadline_header_is_rejected(client):
+    response = client.post(
+        "/v1/generate", json=PAYLOAD, headers={"X-Request-Timeout-Ms": "whenever"}
+    )
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid X-Request-Timeout-Ms header"}
+
+
+def test_queued_request_gives_up_at_the_caller_deadline(client):
+    settings.admission_provider_concurrency = 1
+    registry.register("fake", FakeProvider())
+
+    async def hold_slot():
+        return await admission.acquire("fake", "fake-model", priority=Priority.INTERACTIVE)
+
+    try:
+        ticket = client.portal.call(hold_slot)
+        started = time.monotonic()
+        response = client.post(
+            "/v1/generate", json=PAYLOAD, headers={"X-Request-Timeout-Ms": "100"}
+        )
+        elapsed = time.monotonic() - started
+        ticket.release()
+    finally:
+        settings.admission_provider_concurrency = 64
+
+    assert response.status_code == 504
+    # Bounded by the caller's 100 ms, not ADMISSION_MAX_WAIT_SECONDS.
+    assert elapsed < 5
+    assert (
+        metrics.counter("request_deadline_missed_total", route="/v1/generate", stage="admission")
+        == 1
+    )
+
+
+def test_generation_within_deadline_uses_remaining_budget(client):
+    budgets: list[float | None] = []
+
+    class BudgetRecordingProvider(FakeProvider):
+        async def generate(self, *args, **kwargs):
+            budgets.append(remaining_budget(120.0))
+            return await super().generate(*args, **kwargs)
+
+    registry.register("fake", BudgetRecordingProvider())
+
+    response = client.post("/v1/generate", json=PAYLOAD, headers={"X-Request-Timeout-Ms": "5000"})
+
+    assert response.status_code == 200
+    assert budgets[0] is not None and budgets[0] <= 5
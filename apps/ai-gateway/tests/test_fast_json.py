@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from app import fast_json
+from app.fast_json import FastJSONResponse
+from app.stream_sessions import encode_frame, token_payload
+
+PAYLOADS = [
+    {"content": "Fractions ½ and café", "done": False},
+    {"content": "", "done": True, "usage": {"total_tokens": 2}, "finish_reason": "stop"},
+    [{"name": "openai", "models": ["gpt-4o"]}],
+]
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_fallback_encoder_matches_orjson_output(payload, monkeypatch) -> None:
+    fast = fast_json.dumps(payload)
+    monkeypatch.setattr(fast_json, "orjson", None)
+
+    assert fast_json.dumps(payload) == fast
+    assert fast_json.loads(memoryview(fast)) == payload
+    assert json.loads(fast) == payload
+
+
+def test_response_renders_compact_utf8_json() -> None:
+    response = FastJSONResponse({"status": "ok", "note": "café"}, headers={"X-Test": "1"})
+
+    assert response.body == '{"status":"ok","note":"café"}'.encode()
+    assert response.headers["content-type"] == "application/json"
+    assert response.headers["X-Test"] == "1"
+
+
+def test_sse_frames_are_encoded_bytes() -> None:
+    payload = fast_json.dumps({"content": "hi"})
+
+    assert encode_frame(payload) == b'data: {"content":"hi"}\n\n'
+    assert encode_frame(payload, b"abc:3") == b'id: abc:3\ndata: {"content":"hi"}\n\n'
+
+
+@pytest.mark.parametrize("token", ["plain", ' "quoted" ', "line\nbreak", "café ½", ""])
+def test_token_payload_matches_dict_encoding(token: str) -> None:
+    assert json.loads(token_payload(token)) == {"content": token, "done": False}
@@ -0,0 +1,257 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.config import settings
+from app.deadlines import remaining_budget
+from app.jobs import JobManager, JobQueueFullError, JobRecord, JobStatus, JobStore
+from app.metrics import metrics
+from app.models.generate import GenerateRequest, GenerateResponseModel
+
+
+def make_request(prompt: str = "Create a unit") -> GenerateRequest:
+    return GenerateRequest(provider="fake", model="fake-model", prompt=prompt)
+
+
+async def succeed(request: GenerateRequest, owner: str) -> GenerateResponseModel:
+    return GenerateResponseModel(
+        content=f"done: {request.prompt}",
+        model=request.model,
+        provider=request.provider,
+        usage={"total_tokens": 2},
+    )
+
+
+@pytest.mark.asyncio
+async def test_job_runs_and_result_is_retrievable() -> None:
+    manager = JobManager()
+    await manager.start(succeed)
+    try:
+        record = await manager.submit(make_request(), "owner")
+        finished = await manager.wait(record.id, "owner", timeout=2)
+    finally:
+        await manager.stop()
+
+    assert finished is not None
+    assert finished.status == JobStatus.SUCCEEDED
+    assert finished.status_code == 200
+    assert finished.result is not None
+    assert (
+        GenerateResponseModel.model_validate_json(finished.result).content == "done: Create a unit"
+    )
+
+
+@pytest.mark.asyncio
+async def test_job_failure_records_http_error() -> None:
+    async def reject(request: GenerateRequest, owner: str) -> GenerateResponseModel:
+        raise HTTPException(status_code=422, detail={"error": "content_safety"})
+
+    manager = JobManager()
+    await manager.start(reject)
+    try:
+        record = await manager.submit(make_request(), "owner")
+        finished = await manager.wait(record.id, "owner", timeout=2)
+    finally:
+        await manager.stop()
+
+    assert finished is not None
+    assert finished.status == JobStatus.FAILED
+    assert finished.status_code == 422
+    assert finished.error == '{"error": "content_safety"}'
+
+
+@pytest.mark.asyncio
+async def test_jobs_are_scoped_to_owner() -> None:
+    manager = JobManager()
+    await manager.start(succeed)
+    try:
+        record = await manager.submit(make_request(), "owner")
+
+        assert await manager.get(record.id, "someone-else") is None
+        assert await manager.cancel(record.id, "someone-else") is None
+    finally:
+        await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_cancel_stops_running_job() -> None:
+    started = asyncio.Event()
+
+    async def hang(request: GenerateRequest, owner: str) -> GenerateResponseModel:
+        started.set()
+        await asyncio.sleep(60)
+        raise AssertionError("unreachable")
+
+    manager = JobManager()
+    await manager.start(hang)
+    try:
+        record = await manager.submit(make_request(), "owner")
+        await asyncio.wait_for(started.wait(), timeout=2)
+
+        cancelled = await manager.cancel(record.id, "owner")
+        await asyncio.sleep(0)
+        stored = await manager.get(record.id, "owner")
+    finally:
+        await manager.stop()
+
+    assert cancelled is not None
+    assert cancelled.status == JobStatus.CANCELLED
+    assert stored is not None
+    assert stored.status == JobStatus.CANCELLED
+
+
+@pytest.mark.asyncio
+async def test_submit_rejects_when_queue_is_full() -> None:
+    settings.job_workers = 1
+    settings.job_queue_max_depth = 1
+    blocker = asyncio.Event()
+
+    async def block(request: GenerateRequest, owner: str) -> GenerateResponseModel:
+        await blocker.wait()
+        return await succeed(request)
+
+    manager = JobManager()
+    await manager.start(block)
+    try:
+        await manager.submit(make_request("first"), "owner")
+        await asyncio.sleep(0)
+        await manager.submit(make_request("second"), "owner")
+
+        with pytest.raises(JobQueueFullError):
+            await manager.submit(make_request("third"), "owner")
+    finally:
+        blocker.set()
+        await manager.stop()
+        settings.job_workers = 4
+        settings.job_queue_max_depth = 100
+
+
+@pytest.mark.asyncio
+async def test_pending_jobs_and_results_survive_restart() -> None:
+    async def hang(request: GenerateRequest, owner: str) -> GenerateResponseModel:
+        await asyncio.sleep(60)
+        raise AssertionError("unreachable")
+
+    first = JobManager()
+    await first.start(hang)
+    record = await first.submit(make_request(), "owner")
+    await asyncio.sleep(0)
+    await first.stop()
+
+    second = JobManager()
+    await second.start(succeed)
+    try:
+        finished = await second.wait(record.id, "owner", timeout=2)
+    finally:
+        await second.stop()
+
+    third = JobManager()
+    await third.start(succeed)
+    try:
+        persisted = await third.get(record.id, "owner")
+    finally:
+        await third.stop()
+
+    assert finished is not None
+    assert finished.status == JobStatus.SUCCEEDED
+    assert persisted is not None
+    assert persisted.result == finished.result
+
+
+def stored_job(status: JobStatus, worker_id: str | None, lease_until: float | None) -> JobRecord:
+    now = time.time()
+    return JobRecord(
+        id=f"{status}-{worker_id}",
+        owner="owner",
+        status=status,
+        request=make_request().model_dump_json(),
+        created_at=now,
+        updated_at=now,
+        worker_id=worker_id,
+        lease_until=lease_until,
+    )
+
+
+def test_only_one_worker_claims_a_queued_job() -> None:
+    store = JobStore(settings.job_store_path)
+    other = JobStore(settings.job_store_path)
+    try:
+        store.save(stored_job(JobStatus.QUEUED, "worker-a", time.time() + 30))
+
+        claimed = store.claim("queued-worker-a", "worker-b", time.time() + 30)
+        again = other.claim("queued-worker-a", "worker-c", time.time() + 30)
+    finally:
+        store.close()
+        other.close()
+
+    assert claimed is not None
+    assert (claimed.status, claimed.worker_id) == (JobStatus.RUNNING, "worker-b")
+    assert again is None
+
+
+@pytest.mark.asyncio
+async def test_start_reclaims_only_jobs_whose_worker_lease_lapsed() -> None:
+    store = JobStore(settings.job_store_path)
+    store.save(stored_job(JobStatus.RUNNING, "live-worker", time.time() + 60))
+    store.save(stored_job(JobStatus.RUNNING, "dead-worker", time.time() - 1))
+    store.save(stored_job(JobStatus.QUEUED, "dead-queue", time.time() - 1))
+    store.close()
+
+    manager = JobManager()
+    await manager.start(succeed)
+    try:
+        stale = await manager.wait("running-dead-worker", "owner", timeout=2)
+        stale_queued = await manager.wait("queued-dead-queue", "owner", timeout=2)
+        live = await manager.get("running-live-worker", "owner")
+    finally:
+        await manager.stop()
+
+    assert stale is not None and stale.status == JobStatus.SUCCEEDED
+    assert stale_queued is not None and stale_queued.status == JobStatus.SUCCEEDED
+    assert live is not None
+    assert (live.status, live.worker_id) == (JobStatus.RUNNING, "live-worker")
+
+
+@pytest.mark.asyncio
+async def test_finished_jobs_expire_after_ttl() -> None:
+    settings.job_result_ttl_seconds = 0
+    manager = JobManager()
+    await manager.start(succeed)
+    try:
+        record = await manager.submit(make_request(), "owner")
+        await manager.wait(record.id, "owner", timeout=2)
+
+        assert await manager.get(record.id, "owner") is None
+    finally:
+        await manager.stop()
+        settings.job_result_ttl_seconds = 3600
+
+
+@pytest.mark.asyncio
+async def test_job_past_its_deadline_is_skipped_and_runs_with_remaining_budget() -> None:
+    budgets: list[float | None] = []
+
+    async def record_budget(request: GenerateRequest, owner: str) -> GenerateResponseModel:
+        budgets.append(remaining_budget(120.0))
+        return await succeed(request, owner)
+
+    manager = JobManager()
+    await manager.start(record_budget)
+    try:
+        expired = await manager.submit(make_request(), "owner", deadline_at=time.time() - 1)
+        live = await manager.submit(make_request(), "owner", deadline_at=time.time() + 10)
+        skipped = await manager.wait(expired.id, "owner", timeout=2)
+        finished = await manager.wait(live.id, "owner", timeout=2)
+    finally:
+        await manager.stop()
+
+    assert skipped is not None
+    assert skipped.status == JobStatus.FAILED
+    assert skipped.status_code == 504
+    assert finished is not None
+    assert finished.status == JobStatus.SUCCEEDED
+    assert len(budgets) == 1
+    assert budgets[0] is not None and budgets[0] <= 10
+    assert metrics.counter("request_deadline_missed_total", route="/v1/jobs", stage="queue") == 1
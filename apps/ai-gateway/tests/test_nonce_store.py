@@ -0,0 +1,109 @@
+import asyncio
+import os
+import time
+from typing import Any
+
+import pytest
+
+from app.config import settings
+from app.nonce_store import (
+    NonceCapacityError,
+    NonceStoreUnavailable,
+    RedisNonceStore,
+    ReplayGuard,
+    TimeWheelNonceStore,
+)
+
+
+class FakeRedis:
+    """In-process stand-in for ``SET key value NX PX ttl``."""
+
+    def __init__(self, *, fail: bool = False, delay: float = 0.0) -> None:
+        self.expiry: dict[str, float] = {}
+        self.fail = fail
+        self.delay = delay
+
+    async def set(self, key: str, value: bytes, *, nx: bool, px: int) -> bool | None:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("Connection refused")
+        now = time.monotonic()
+        if nx and self.expiry.get(key, 0.0) > now:
+            return None
+        self.expiry[key] = now + px / 1000
+        return True
+
+    async def aclose(self) -> None:
+        return None
+
+
+def test_time_wheel_rejects_replays_until_expiry() -> None:
+    store = TimeWheelNonceStore()
+
+    assert store.claim_now("100:abc", 120, now=100.0) is True
+    assert store.claim_now("100:abc", 120, now=150.0) is False
+    assert store.claim_now("100:def", 120, now=150.5) is True
+    assert store.claim_now("100:abc", 120, now=220.0) is True
+    assert len(store) == 2
+
+
+def test_time_wheel_expires_whole_buckets_and_enforces_capacity() -> None:
+    settings.service_auth_max_nonces = 3
+    store = TimeWheelNonceStore()
+    for index in range(3):
+        store.claim_now(f"nonce-{index}", 10, now=100.5 + index * 0.1)
+
+    with pytest.raises(NonceCapacityError):
+        store.claim_now("nonce-3", 10, now=105.0)
+    assert store.snapshot() == {"nonces": 3, "buckets": 1}
+    assert store.claim_now("nonce-3", 10, now=111.0) is True
+    assert store.snapshot() == {"nonces": 1, "buckets": 1}
+
+
+@pytest.fixture
+def redis_client() -> Any:
+    url = os.environ.get("REDIS_URL")
+    if not url:
+        return FakeRedis()
+    redis_asyncio = pytest.importorskip("redis.asyncio")
+    return redis_asyncio.from_url(url)
+
+
+@pytest.mark.asyncio
+async def test_redis_store_claims_each_nonce_once(redis_client: Any) -> None:
+    store = RedisNonceStore(redis_client, prefix=f"test:{time.time_ns()}:")
+
+    results = await asyncio.gather(*(store.claim("100:abc", 120) for _ in range(5)))
+    other = await store.claim("100:def", 120)
+    await store.close()
+
+    assert sorted(results) == [False, False, False, False, True]
+    assert other is True
+
+
+@pytest.mark.asyncio
+async def test_guard_fails_closed_when_shared_store_is_unreachable() -> None:
+    guard = ReplayGuard()
+    guard.configure(RedisNonceStore(FakeRedis(fail=True)))
+
+    with pytest.raises(NonceStoreUnavailable):
+        await guard.claim("100:abc", 120)
+
+
+@pytest.mark.asyncio
+async def test_guard_can_fall_back_to_local_store_when_shared_store_is_slow() -> None:
+    settings.nonce_store_fail_open = True
+    settings.nonce_store_timeout_seconds = 0.01
+    guard = ReplayGuard()
+    guard.configure(RedisNonceStore(FakeRedis(delay=0.2)))
+    try:
+        first = await guard.claim("100:abc", 120)
+        replay = await guard.claim("100:abc", 120)
+    finally:
+        settings.nonce_store_fail_open = False
+        settings.nonce_store_timeout_seconds = 0.05
+
+    assert (first, replay) == (True, False)
+    assert guard.snapshot()["backend"] == "redis"
+    assert guard.snapshot()["nonces"] == 1
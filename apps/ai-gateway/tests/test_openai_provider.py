@@ -1,15 +1,27 @@
+import json
 from unittest.mock import AsyncMock, MagicMock
 
 import httpx
 import pytest
 
-from app.providers.base import ProviderError
+from app.adaptive_limit import adaptive_limits
+from app.config import settings
+from app.providers.base import ChatMessage, ProviderError
+from app.providers.deadlines import ConnectDeadlineError
 from app.providers.openai_provider import OpenAIProvider
 
 
 class FakeStreamResponse:
-    def __init__(self, *, status_code: int, lines: list[str], body: bytes = b"") -> None:
+    def __init__(
+        self,
+        *,
+        status_code: int,
+        lines: list[str],
+        body: bytes = b"",
+        headers: dict[str, str] | None = None,
+    ) -> None:
         self.status_code = status_code
+        self.headers = headers or {}
         self._lines = lines
         self._body = body
 
@@ -22,9 +34,13 @@ class FakeStreamResponse:
     async def aread(self) -> bytes:
         return self._body
 
-    async def aiter_lines(self):
-        for line in self._lines:
-            yield line
+    async def aiter_bytes(self):
+        # Each data line ends an event; split into small chunks to exercise reassembly.
+        body = "".join(
+            line + ("\n\n" if line.startswith("data:") else "\n") for line in self._lines
+        ).encode()
+        for start in range(0, len(body), 7):
+            yield body[start : start + 7]
 
 
 @pytest.mark.asyncio
@@ -98,6 +114,32 @@ async def test_stream_emits_chunks_until_finish() -> None:
     assert chunks[1].usage.total_tokens == 3
 
 
+@pytest.mark.asyncio
+async def test_stream_requests_and_reports_usage_after_finish() -> None:
+    provider = OpenAIProvider(api_key="test-key")
+    stream_response = FakeStreamResponse(
+        status_code=200,
+        lines=[
+            'data: {"choices":[{"delta":{"content":"Hello"},"finish_reason":null}]}',
+            'data: {"choices":[{"delta":{},"finish_reason":"stop"}],"usage":null}',
+            (
+                'data: {"choices":[],"usage":{"prompt_tokens":9,"completion_tokens":1,'
+                '"total_tokens":10}}'
+            ),
+            "data: [DONE]",
+        ],
+    )
+    stream = MagicMock(return_value=stream_response)
+    provider._client = MagicMock(stream=stream, aclose=AsyncMock())
+
+    chunks = [chunk async for chunk in provider.stream(prompt="hi", model="gpt-4o")]
+
+    assert stream.call_args.kwargs["json"]["stream_options"] == {"include_usage": True}
+    assert [(chunk.content, chunk.done) for chunk in chunks] == [("Hello", False), ("", True)]
+    assert chunks[-1].usage is not None
+    assert chunks[-1].usage.total_tokens == 10
+
+
 @pytest.mark.asyncio
 async def test_stream_handles_done_sentinel() -> None:
     provider = OpenAIProvider(api_key="test-key")
@@ -132,6 +174,23 @@ async def test_stream_wraps_timeout() -> None:
         [chunk async for chunk in provider.stream(prompt="hi", model="gpt-4o")]
 
 
+@pytest.mark.asyncio
+async def test_stream_maps_connect_timeout_and_uses_configured_deadline() -> None:
+    settings.stream_connect_timeout_seconds = 2.5
+    provider = OpenAIProvider(api_key="test-key")
+    provider._client = MagicMock(
+        stream=MagicMock(side_effect=httpx.ConnectTimeout("timeout")),
+        aclose=AsyncMock(),
+    )
+
+    with pytest.raises(ConnectDeadlineError, match="connection timed out"):
+        [chunk async for chunk in provider.stream(prompt="hi", model="gpt-4o")]
+
+    timeout = provider._client.stream.call_args.kwargs["timeout"]
+    assert timeout.connect == 2.5
+    assert timeout.read is None
+
+
 @pytest.mark.asyncio
 async def test_close_closes_underlying_client() -> None:
     provider = OpenAIProvider(api_key="test-key")
@@ -140,3 +199,105 @@ async def test_close_closes_underlying_client() -> None:
     await provider.close()
 
     provider._client.aclose.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_generate_keeps_static_system_prompt_first_with_cache_key_against_stub_api() -> None:
+    captured: list[httpx.Request] = []
+
+    def stub_api(request: httpx.Request) -> httpx.Response:
+        captured.append(request)
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "hello"}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": 1200,
+                    "completion_tokens": 2,
+                    "total_tokens": 1202,
+                    "prompt_tokens_details": {"cached_tokens": 1024},
+                },
+            },
+        )
+
+    provider = OpenAIProvider(api_key="test-key", base_url="http://stub.local/v1")
+    provider._client = httpx.AsyncClient(transport=httpx.MockTransport(stub_api))
+
+    first = await provider.generate(
+        prompt="one", model="gpt-4o", system_prompt="static", cache_system_prompt=True
+    )
+    await provider.generate(
+        prompt="two", model="gpt-4o", system_prompt="static", cache_system_prompt=True
+    )
+    await provider.close()
+
+    assert str(captured[0].url) == "http://stub.local/v1/chat/completions"
+    bodies = [json.loads(request.content) for request in captured]
+    assert bodies[0]["messages"][0] == {"role": "system", "content": "static"}
+    assert bodies[0]["prompt_cache_key"] == bodies[1]["prompt_cache_key"]
+    assert first.usage.cached_tokens == 1024
+
+
+@pytest.mark.asyncio
+async def test_generate_omits_cache_key_for_caller_system_prompt() -> None:
+    provider = OpenAIProvider(api_key="test-key")
+    response = MagicMock(status_code=200, text="")
+    response.json.return_value = {
+        "choices": [{"message": {"content": "hello"}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 2, "total_tokens": 3},
+    }
+    provider._client = MagicMock(post=AsyncMock(return_value=response), aclose=AsyncMock())
+
+    result = await provider.generate(prompt="hi", model="gpt-4o", system_prompt="caller")
+
+    assert "prompt_cache_key" not in provider._client.post.call_args.kwargs["json"]
+    assert result.usage.cached_tokens == 0
+
+
+@pytest.mark.asyncio
+async def test_generate_sends_system_context_and_history_before_prompt() -> None:
+    provider = OpenAIProvider(api_key="test-key")
+    response = MagicMock(status_code=200, text="")
+    response.json.return_value = {
+        "choices": [{"message": {"content": "hello"}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 2, "total_tokens": 3},
+    }
+    provider._client = MagicMock(post=AsyncMock(return_value=response), aclose=AsyncMock())
+
+    await provider.generate(
+        prompt="Make it easier",
+        model="gpt-4o",
+        system_prompt="static",
+        system_context="Grade level: 5.",
+        history=[ChatMessage("user", "Warm-up"), ChatMessage("assistant", "Halve it")],
+    )
+
+    assert provider._client.post.call_args.kwargs["json"]["messages"] == [
+        {"role": "system", "content": "static"},
+        {"role": "system", "content": "Grade level: 5."},
+        {"role": "user", "content": "Warm-up"},
+        {"role": "assistant", "content": "Halve it"},
+        {"role": "user", "content": "Make it easier"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_response_feeds_adaptive_limiter() -> None:
+    def stub_api(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            429,
+            text="rate limited",
+            headers={"retry-after": "7", "x-ratelimit-remaining-requests": "0"},
+        )
+
+    provider = OpenAIProvider(api_key="test-key", base_url="http://stub.local/v1")
+    provider._client = httpx.AsyncClient(transport=httpx.MockTransport(stub_api))
+
+    with pytest.raises(ProviderError) as excinfo:
+        await provider.generate(prompt="hi", model="gpt-4o")
+    await provider.close()
+
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.retry_after == 7.0
+    assert adaptive_limits.current_limit("openai", "gpt-4o") < settings.adaptive_limit_initial
+    assert adaptive_limits.pause_remaining("openai", "gpt-4o") > 6.0
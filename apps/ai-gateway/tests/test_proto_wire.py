@@ -0,0 +1,204 @@
+import asyncio
+import shutil
+import struct
+import subprocess
+from pathlib import Path
+
+import pytest
+from google.protobuf import descriptor_pb2
+from pydantic import ValidationError
+
+from app.config import settings
+from app.proto_wire import (
+    PROTOBUF_MEDIA_TYPE,
+    GenerateRequestMessage,
+    GenerateResponseMessage,
+    StreamEventMessage,
+    accepts_protobuf,
+    decode_generate_request,
+    encode_stream_event,
+    file_descriptor,
+)
+from app.providers.base import StreamChunk
+from app.providers.registry import registry
+from tests.conftest import FakeProvider
+from tests.test_v1_router import hmac_headers
+
+PROTO_PATH = Path(__file__).resolve().parents[1] / "proto"
+PROTOBUF_HEADERS = {"Content-Type": PROTOBUF_MEDIA_TYPE, "Accept": PROTOBUF_MEDIA_TYPE}
+
+
+def request_message(**fields):
+    return GenerateRequestMessage(
+        provider="fake", model="fake-model", prompt="Create a lesson plan", **fields
+    )
+
+
+def read_frames(body: bytes) -> list[bytes]:
+    frames = []
+    offset = 0
+    while offset < len(body):
+        (length,) = struct.unpack_from(">I", body, offset)
+        frames.append(body[offset + 4 : offset + 4 + length])
+        offset += 4 + length
+    return frames
+
+
+@pytest.mark.skipif(shutil.which("protoc") is None, reason="protoc is not installed")
+def test_runtime_descriptor_matches_the_published_schema(tmp_path):
+    output = tmp_path / "schema.pb"
+    subprocess.run(
+        [
+            "protoc",
+            f"--proto_path={PROTO_PATH}",
+            f"--descriptor_set_out={output}",
+            "ai_gateway.proto",
+        ],
+        check=True,
+    )
+    compiled = descriptor_pb2.FileDescriptorSet.FromString(output.read_bytes()).file[0]
+    pending = list(compiled.message_type)
+    while pending:
+        message = pending.pop()
+        for field in message.field:
+            field.ClearField("json_name")
+        pending.extend(message.nested_type)
+
+    assert compiled == file_descriptor()
+
+
+def test_decode_generate_request_applies_model_defaults_and_context():
+    message = request_message(max_tokens=64)
+    message.context["grade"].int_value = 5
+    message.context["subject"].string_value = "math"
+    message.context["unset"].SetInParent()
+
+    request = decode_generate_request(message.SerializeToString())
+
+    assert request.max_tokens == 64
+    assert request.temperature == 0.7
+    assert request.system_prompt is None
+    assert request.context == {"grade": 5, "subject": "math", "unset": None}
+    assert request.conversation_id is None
+    assert (
+        decode_generate_request(
+            request_message(conversation_id="abc").SerializeToString()
+        ).conversation_id
+        == "abc"
+    )
+
+
+def test_decode_generate_request_rejects_bad_bytes_and_values():
+    with pytest.raises(ValueError, match="Invalid protobuf"):
+        decode_generate_request(b"\xff\xff\xff")
+    with pytest.raises(ValidationError):
+        decode_generate_request(request_message(temperature=5.0).SerializeToString())
+
+
+def test_accept_negotiation():
+    assert accepts_protobuf(PROTOBUF_MEDIA_TYPE)
+    assert accepts_protobuf(f"application/json;q=0.9, {PROTOBUF_MEDIA_TYPE}")
+    assert not accepts_protobuf(f"{PROTOBUF_MEDIA_TYPE};q=0, application/json")
+    assert not accepts_protobuf("application/json")
+    assert not accepts_protobuf(None)
+
+
+def test_encode_stream_event_keeps_event_id_and_payload():
+    frame = b'id: abc:2\ndata: {"content":"","done":true,"finish_reason":"stop"}\n\n'
+
+    (event,) = read_frames(encode_stream_event(frame))
+
+    decoded = StreamEventMessage.FromString(event)
+    assert decoded.event_id == "abc:2"
+    assert decoded.done is True
+    assert decoded.finish_reason == "stop"
+
+
+def test_generate_speaks_protobuf_when_negotiated(client):
+    settings.service_token = "secret-token"
+    settings.allow_legacy_bearer_auth = False
+    registry.register("fake", FakeProvider(content="Fractions"))
+    body = request_message().SerializeToString()
+    headers = hmac_headers("/v1/generate", body, "secret-token")
+
+    response = client.post("/v1/generate", content=body, headers={**headers, **PROTOBUF_HEADERS})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == PROTOBUF_MEDIA_TYPE
+    decoded = GenerateResponseMessage.FromString(response.content)
+    assert decoded.content == "Fractions"
+    assert decoded.usage["total_tokens"] == 2
+    assert decoded.HasField("queue_time_ms")
+
+
+def test_generate_mixes_request_and_response_formats(client):
+    registry.register("fake", FakeProvider(content="Fractions"))
+    body = request_message().SerializeToString()
+
+    response = client.post(
+        "/v1/generate", content=body, headers={"Content-Type": PROTOBUF_MEDIA_TYPE}
+    )
+    assert response.json()["content"] == "Fractions"
+
+    response = client.post(
+        "/v1/generate",
+        json={"provider": "fake", "model": "fake-model", "prompt": "Create a lesson plan"},
+        headers={"Accept": PROTOBUF_MEDIA_TYPE},
+    )
+    assert GenerateResponseMessage.FromString(response.content).content == "Fractions"
+
+
+def test_generate_rejects_invalid_protobuf_bodies(client):
+    registry.register("fake", FakeProvider())
+
+    garbage = client.post("/v1/generate", content=b"\xff\xff\xff", headers=PROTOBUF_HEADERS)
+    invalid = client.post(
+        "/v1/generate",
+        content=request_message(max_tokens=0).SerializeToString(),
+        headers=PROTOBUF_HEADERS,
+    )
+
+    assert garbage.status_code == 400
+    assert invalid.status_code == 422
+    assert invalid.json()["detail"][0]["loc"] == ["body", "max_tokens"]
+
+
+@pytest.mark.parametrize("path", ["/v1/generate", "/v1/generate_stream"])
+def test_unauthenticated_bodies_are_rejected_before_parsing(client, path):
+    registry.register("fake", FakeProvider())
+    settings.service_token = "secret-token"
+
+    malformed_json = client.post(
+        path, content=b'{"prompt": ', headers={"Content-Type": "application/json"}
+    )
+    malformed_protobuf = client.post(path, content=b"\xff\xff\xff", headers=PROTOBUF_HEADERS)
+
+    assert malformed_json.status_code == 401
+    assert "prompt" not in malformed_json.text
+    assert malformed_protobuf.status_code == 401
+
+
+def test_generate_stream_sends_length_prefixed_events(client):
+    settings.stream_heartbeat_seconds = 0.05
+
+    class ThinkingProvider(FakeProvider):
+        async def stream(self, *args, **kwargs):
+            yield StreamChunk(content="partial", done=False)
+            await asyncio.sleep(0.12)
+            yield StreamChunk(content="", done=True)
+
+    registry.register("fake", ThinkingProvider())
+
+    response = client.post(
+        "/v1/generate_stream",
+        content=request_message().SerializeToString(),
+        headers=PROTOBUF_HEADERS,
+    )
+
+    assert response.headers["content-type"] == PROTOBUF_MEDIA_TYPE
+    frames = read_frames(response.content)
+    events = [StreamEventMessage.FromString(frame) for frame in frames if frame]
+    assert b"" in frames
+    assert [(event.content, event.done) for event in events] == [("partial", False), ("", True)]
+    stream_id = response.headers["X-Stream-ID"]
+    assert [event.event_id for event in events] == [f"{stream_id}:1", f"{stream_id}:2"]
@@ -0,0 +1,116 @@
+import tracemalloc
+
+import pytest
+
+from app import rate_limit
+from app.config import settings
+from app.rate_limit import GcraRateLimiter, SlidingWindowRateLimiter
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "time", fake)
+    return fake
+
+
+@pytest.mark.parametrize("limiter_class", [GcraRateLimiter, SlidingWindowRateLimiter])
+def test_admits_burst_up_to_limit_then_rejects(
+    clock: FakeClock, limiter_class: type[GcraRateLimiter]
+) -> None:
+    limiter = limiter_class()
+
+    results = [limiter.allow("tenant", limit=3, period_seconds=60) for _ in range(4)]
+
+    assert results[:3] == [(True, 0)] * 3
+    allowed, retry_after = results[3]
+    assert allowed is False
+    assert 1 <= retry_after <= 60
+
+
+def test_gcra_refills_one_request_per_emission_interval(clock: FakeClock) -> None:
+    limiter = GcraRateLimiter()
+    for _ in range(3):
+        assert limiter.allow("tenant", limit=3, period_seconds=60)[0]
+
+    assert limiter.allow("tenant", limit=3, period_seconds=60) == (False, 20)
+    clock.now += 19.5
+    assert limiter.allow("tenant", limit=3, period_seconds=60) == (False, 1)
+    clock.now += 0.5
+    assert limiter.allow("tenant", limit=3, period_seconds=60) == (True, 0)
+    assert limiter.allow("tenant", limit=3, period_seconds=60)[0] is False
+
+
+def test_gcra_keeps_constant_state_per_key(clock: FakeClock) -> None:
+    limiter = GcraRateLimiter(shards=4)
+    for index in range(1_000):
+        for _ in range(5):
+            limiter.allow(f"key-{index}", limit=100, period_seconds=60)
+
+    assert len(limiter) == 1_000
+    assert limiter.allow("other", limit=1, period_seconds=60) == (True, 0)
+    assert limiter.allow("key-1", limit=100, period_seconds=60) == (True, 0)
+
+    limiter.reset()
+    assert len(limiter) == 0
+
+
+def test_gcra_evicts_least_recently_used_key_at_capacity(clock: FakeClock) -> None:
+    settings.rate_limit_max_keys = 2
+    limiter = GcraRateLimiter(shards=1)
+    limiter.allow("idle", limit=10, period_seconds=60)
+    clock.now += 60
+    limiter.allow("busy", limit=1, period_seconds=60)
+
+    limiter.allow("new", limit=10, period_seconds=60)
+    limiter.allow("newer", limit=10, period_seconds=60)
+
+    assert len(limiter) == 2
+    assert limiter.snapshot() == {
+        "keys": 2,
+        "max_keys": 2,
+        "evicted_idle": 1,
+        "evicted_capacity": 1,
+    }
+
+
+def test_gcra_sweep_drops_only_refilled_keys(clock: FakeClock) -> None:
+    limiter = GcraRateLimiter(shards=4)
+    limiter.allow("quiet", limit=60, period_seconds=60)
+    for _ in range(30):
+        limiter.allow("noisy", limit=60, period_seconds=60)
+
+    clock.now += 5
+    assert limiter.sweep() == 1
+    assert len(limiter) == 1
+    assert limiter.allow("noisy", limit=60, period_seconds=60) == (True, 0)
+    assert limiter.snapshot()["evicted_idle"] == 1
+
+
+def test_gcra_memory_stays_flat_across_distinct_keys(clock: FakeClock) -> None:
+    settings.rate_limit_max_keys = 2_000
+    limiter = GcraRateLimiter(shards=8)
+
+    def fill(start: int, count: int) -> int:
+        for index in range(start, start + count):
+            limiter.allow(f"fingerprint:tenant-{index}:/v1/generate", 30, 60)
+        return tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.start()
+    try:
+        fill(0, 10_000)
+        warm = tracemalloc.get_traced_memory()[0]
+        after = fill(10_000, 100_000)
+    finally:
+        tracemalloc.stop()
+
+    assert len(limiter) <= settings.rate_limit_max_keys
+    assert after - warm < 64 * 1024
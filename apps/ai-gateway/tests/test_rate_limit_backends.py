@@ -0,0 +1,239 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from app.config import settings
+from app.rate_limit import RateLimitBackend, RateLimitBackendError, RateLimiter
+from app.rate_limit_redis import (
+    CHARGE_SCRIPT_SHA,
+    COUNT_SCRIPT_SHA,
+    GCRA_SCRIPT_SHA,
+    SCRIPTS,
+    RedisRateLimitBackend,
+)
+from app.rate_limit_shm import SharedMemoryRateLimitBackend
+
+
+class NoScriptError(Exception):
+    pass
+
+
+class FakeRedis:
+    """In-process stand-in for the Redis commands the rate limit script relies on."""
+
+    def __init__(
+        self, *, delay: float = 0.0, fail: bool = False, flush_scripts_after: int | None = None
+    ) -> None:
+        self.values: dict[str, float] = {}
+        self.scripts: set[str] = set()
+        self.delay = delay
+        self.fail = fail
+        # Simulates SCRIPT FLUSH (or a failover) after this many calls of the next batch.
+        self.flush_scripts_after = flush_scripts_after
+        self.executed_batches: list[int] = []
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+    async def script_load(self, script: str) -> str:
+        sha = next(sha for sha, known in SCRIPTS.items() if known == script)
+        self.scripts.add(sha)
+        return sha
+
+    async def aclose(self) -> None:
+        return None
+
+    def run_gcra(self, key: str, interval: float, period: float) -> list[int]:
+        now = time.time() * 1000
+        tat = max(self.values.get(key, now), now)
+        wait = tat + interval - period - now
+        if wait > 0:
+            return [0, math.ceil(wait)]
+        self.values[key] = tat + interval
+        return [1, 0]
+
+    def run_charge(self, key: str, cost: float, period: float, force: str) -> list[int]:
+        now = math.floor(time.time() * 1000)
+        tat = max(self.values.get(key, now), now)
+        if force != "1":
+            wait = tat + cost - period - now
+            if wait > 0 and tat > now:
+                return [0, math.ceil(wait), math.ceil(tat - now)]
+        tat = max(now, tat + cost)
+        self.values[key] = tat
+        return [1, 0, math.ceil(tat - now)]
+
+    def run_count(self, key: str, amount: int, limit: int, force: str) -> list[int]:
+        total = int(self.values.get(key, 0))
+        updated = max(0, total + amount)
+        if force != "1" and limit > 0 and amount > 0 and updated > limit:
+            return [0, total]
+        self.values[key] = updated
+        return [1, updated]
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis) -> None:
+        self._redis = redis
+        self._calls: list[tuple[Any, ...]] = []
+
+    def evalsha(self, sha: str, numkeys: int, *args: Any) -> None:
+        self._calls.append((sha, *args))
+
+    async def execute(self, raise_on_error: bool = True) -> list[Any]:
+        if self._redis.delay:
+            await asyncio.sleep(self._redis.delay)
+        if self._redis.fail:
+            raise ConnectionError("Connection refused")
+        self._redis.executed_batches.append(len(self._calls))
+        results: list[Any] = []
+        for sha, key, *args in self._calls:
+            if len(results) == self._redis.flush_scripts_after:
+                self._redis.scripts.clear()
+                self._redis.flush_scripts_after = None
+            if sha not in self._redis.scripts:
+                results.append(NoScriptError("No matching script. Please use EVAL."))
+            elif sha == CHARGE_SCRIPT_SHA:
+                cost, period, force = args
+                results.append(self._redis.run_charge(key, float(cost), float(period), str(force)))
+            elif sha == COUNT_SCRIPT_SHA:
+                amount, limit, _expires_at, force = args
+                results.append(self._redis.run_count(key, int(amount), int(limit), str(force)))
+            else:
+                interval, period = args
+                results.append(self._redis.run_gcra(key, float(interval), float(period)))
+        return results
+
+
+@pytest.fixture
+def redis_client() -> Any:
+    url = os.environ.get("REDIS_URL")
+    if not url:
+        return FakeRedis()
+    redis_asyncio = pytest.importorskip("redis.asyncio")
+    return redis_asyncio.from_url(url)
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_enforces_limit_in_one_pipeline(redis_client: Any) -> None:
+    backend = RedisRateLimitBackend(redis_client, prefix=f"test:{time.time_ns()}:")
+
+    results = await asyncio.gather(*(backend.check("tenant", 5, 60) for _ in range(8)))
+    await backend.close()
+
+    assert [allowed for allowed, _ in results].count(True) == 5
+    assert all(retry_after >= 1 for allowed, retry_after in results if not allowed)
+    # One pipeline for the burst, plus one replay after the script was loaded.
+    assert backend.round_trips <= 2
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_loads_script_on_noscript_and_batches_callers() -> None:
+    client = FakeRedis()
+    backend = RedisRateLimitBackend(client)
+
+    first = await asyncio.gather(*(backend.check(f"key-{index}", 1, 60) for index in range(20)))
+    second = await asyncio.gather(*(backend.check(f"key-{index}", 1, 60) for index in range(20)))
+
+    assert all(allowed for allowed, _ in first)
+    assert second == [(False, 60)] * 20
+    assert client.executed_batches == [20, 20, 20]
+    assert GCRA_SCRIPT_SHA in client.scripts
+
+    # The script disappears part way through a batch: only the NOSCRIPT calls are replayed,
+    # so the keys that were already charged are not charged again.
+    client.flush_scripts_after = 3
+    mixed = await asyncio.gather(*(backend.check(f"fresh-{index}", 1, 60) for index in range(8)))
+
+    assert mixed == [(True, 0)] * 8
+    assert client.executed_batches[-2:] == [8, 5]
+
+
+@pytest.mark.asyncio
+async def test_limiter_falls_back_locally_when_backend_is_unreachable() -> None:
+    settings.rate_limit_fallback_workers = 2
+    limiter = RateLimiter()
+    limiter.configure(RedisRateLimitBackend(FakeRedis(fail=True)))
+    try:
+        results = [await limiter.allow("tenant", 6, 60) for _ in range(4)]
+    finally:
+        settings.rate_limit_fallback_workers = 1
+
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    snapshot = limiter.snapshot()
+    assert snapshot["backend"] == "redis"
+    assert snapshot["fallback_active"] is True
+
+
+@pytest.mark.asyncio
+async def test_limiter_falls_back_when_backend_is_slow() -> None:
+    settings.rate_limit_backend_timeout_seconds = 0.01
+    client = FakeRedis(delay=0.2)
+    limiter = RateLimiter()
+    limiter.configure(RedisRateLimitBackend(client))
+    try:
+        started = time.monotonic()
+        first = await limiter.allow("tenant", 5, 60)
+        second = await limiter.allow("tenant", 5, 60)
+        elapsed = time.monotonic() - started
+    finally:
+        settings.rate_limit_backend_timeout_seconds = 0.05
+        await limiter.close()
+
+    assert first == (True, 0)
+    assert second == (True, 0)
+    # The second check skips the backend while the fallback window is open.
+    assert elapsed < 0.15
+
+
+@pytest.mark.asyncio
+async def test_backend_errors_surface_as_backend_errors() -> None:
+    backend = RedisRateLimitBackend(FakeRedis(fail=True))
+
+    with pytest.raises(RateLimitBackendError):
+        await backend.check("tenant", 1, 60)
+
+
+def _consume(path: str, attempts: int, results: "multiprocessing.Queue[int]") -> None:
+    backend = SharedMemoryRateLimitBackend(path, slots=1024)
+    results.put(sum(backend.allow("tenant", 10, 60)[0] for _ in range(attempts)))
+
+
+def test_shared_memory_backend_shares_limit_across_processes(tmp_path: Path) -> None:
+    path = str(tmp_path / "rate-limit")
+    context = multiprocessing.get_context("spawn")
+    results: multiprocessing.Queue[int] = context.Queue()
+    workers = [context.Process(target=_consume, args=(path, 8, results)) for _ in range(3)]
+
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+
+    assert sum(results.get(timeout=5) for _ in workers) == 10
+
+
+@pytest.mark.asyncio
+async def test_shared_memory_backend_is_bounded_and_adopts_existing_table(
+    tmp_path: Path,
+) -> None:
+    path = str(tmp_path / "rate-limit")
+    backend: RateLimitBackend = SharedMemoryRateLimitBackend(path, slots=8)
+    for index in range(20):
+        assert await backend.check(f"tenant-{index}", 1, 60) == (True, 0)
+
+    reopened = SharedMemoryRateLimitBackend(path, slots=4096)
+    snapshot = backend.snapshot()
+    await backend.close()
+
+    assert snapshot == {"slots": 8, "evicted_capacity": 12}
+    assert reopened.snapshot()["slots"] == 8
+    assert os.path.getsize(path) < 4096
+    assert reopened.allow("tenant-19", 1, 60)[0] is False
+    await reopened.close()
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import json
+import time
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.types import Message, Receive, Scope, Send
+
+from app.config import settings
+from app.metrics import metrics
+from app.providers.registry import registry
+from app.request_body import BODY_DIGEST_STATE_KEY, BodyDigestMiddleware, BodyLimitMiddleware
+from tests.conftest import FakeProvider
+
+
+def http_scope(headers: list[tuple[bytes, bytes]]) -> Scope:
+    return {"type": "http", "method": "POST", "path": "/v1/generate", "headers": headers}
+
+
+def chunked_receive(chunks: list[bytes]) -> Receive:
+    messages: list[Message] = [
+        {"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1}
+        for index, chunk in enumerate(chunks)
+    ]
+
+    async def receive() -> Message:
+        return messages.pop(0)
+
+    return receive
+
+
+async def noop_send(message: Message) -> None:
+    return None
+
+
+@pytest.mark.asyncio
+async def test_body_digest_is_computed_while_the_app_reads_the_body() -> None:
+    seen: dict[str, object] = {}
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        request = Request(scope, receive)
+        seen["body"] = await request.body()
+        seen["digest"] = getattr(request.state, BODY_DIGEST_STATE_KEY)
+
+    chunks = [b'{"prompt": "', b"x" * 4096, b'"}']
+    await BodyDigestMiddleware(app)(
+        http_scope([(b"x-service-signature", b"abc")]), chunked_receive(chunks), noop_send
+    )
+
+    assert seen["body"] == b"".join(chunks)
+    assert seen["digest"] == hashlib.sha256(b"".join(chunks)).hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_unsigned_requests_are_not_hashed() -> None:
+    seen: dict[str, object] = {}
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        request = Request(scope, receive)
+        await request.body()
+        seen["digest"] = getattr(request.state, BODY_DIGEST_STATE_KEY, None)
+
+    await BodyDigestMiddleware(app)(http_scope([]), chunked_receive([b"{}"]), noop_send)
+
+    assert seen["digest"] is None
+
+
+def test_declared_oversized_body_is_rejected_before_auth(client):
+    settings.service_token = "secret-token"
+    settings.request_body_max_bytes = 1024
+    registry.register("fake", FakeProvider())
+    body = json.dumps({"provider": "fake", "model": "fake-model", "prompt": "x" * 2048})
+
+    response = client.post(
+        "/v1/generate",
+        content=body,
+        headers={"Content-Type": "application/json", "X-Service-Signature": "0" * 64},
+    )
+
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Request body too large"}
+    assert metrics.counter("request_body_rejected_total", reason="too_large") == 1
+
+
+def test_streamed_oversized_body_is_rejected_while_reading(client):
+    settings.request_body_max_bytes = 1024
+    provider = FakeProvider()
+    registry.register("fake", provider)
+    body = json.dumps({"provider": "fake", "model": "fake-model", "prompt": "x" * 4096}).encode()
+
+    # A generator body is sent chunked, without Content-Length.
+    response = client.post(
+        "/v1/generate",
+        content=(body[index : index + 512] for index in range(0, len(body), 512)),
+        headers={"Content-Type": "application/json"},
+    )
+
+    assert response.status_code == 413
+    assert response.headers["Connection"] == "close"
+    assert provider.last_generate_call is None
+
+
+def test_route_limit_overrides_default(client):
+    settings.request_body_max_bytes = 1024
+    registry.register("fake", FakeProvider(content='{"title":"Fractions"}'))
+    item = {"provider": "fake", "model": "fake-model", "prompt": "x" * 600}
+
+    single = client.post("/v1/generate", json={**item, "prompt": "x" * 2048})
+    batch = client.post("/v1/generate_batch", json={"items": [item, item, item]})
+
+    assert single.status_code == 413
+    assert batch.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_slow_body_times_out_with_408() -> None:
+    settings.request_body_timeout_seconds = 0.05
+    statuses: list[int] = []
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await Request(scope, receive).body()
+        except HTTPException as exc:
+            statuses.append(exc.status_code)
+
+    async def slow_receive() -> Message:
+        await asyncio.sleep(0.02)
+        return {"type": "http.request", "body": b"x", "more_body": True}
+
+    started = time.monotonic()
+    await BodyLimitMiddleware(app)(http_scope([]), slow_receive, noop_send)
+
+    assert statuses == [408]
+    assert time.monotonic() - started < 0.5
+    assert metrics.counter("request_body_rejected_total", reason="timeout") == 1
+
+
+@pytest.mark.asyncio
+async def test_deadline_does_not_apply_after_body_completes() -> None:
+    settings.request_body_timeout_seconds = 0.05
+    messages: list[Message] = []
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        messages.append(await receive())
+        messages.append(await receive())
+
+    async def receive() -> Message:
+        if not messages:
+            return {"type": "http.request", "body": b"{}", "more_body": False}
+        await asyncio.sleep(0.1)
+        return {"type": "http.disconnect"}
+
+    await BodyLimitMiddleware(app)(http_scope([]), receive, noop_send)
+
+    assert [message["type"] for message in messages] == ["http.request", "http.disconnect"]
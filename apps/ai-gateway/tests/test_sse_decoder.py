@@ -0,0 +1,49 @@
+import pytest
+
+from app.providers.sse import SSEDecoder, iter_sse_events
+
+
+def decode(chunks: list[bytes]) -> list[tuple[str, bytes, str | None]]:
+    decoder = SSEDecoder()
+    events = [event for chunk in chunks for event in decoder.feed(chunk)]
+    decoder.flush()
+    return [(event.event, event.data, event.id) for event in events]
+
+
+def test_decodes_event_names_and_multi_line_data() -> None:
+    stream = b'event: message_start\ndata: {"a":\ndata: 1}\n\ndata: plain\n\n'
+
+    assert decode([stream]) == [
+        ("message_start", b'{"a":\n1}', None),
+        ("message", b"plain", None),
+    ]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 64])
+def test_reassembles_lines_split_across_chunks(size: int) -> None:
+    stream = b"event: ping\r\ndata: {}\r\n\r\n: keep-alive\rdata:no-space\r\rid: 7\ndata: x\n\n"
+    chunks = [stream[index : index + size] for index in range(0, len(stream), size)]
+
+    assert decode(chunks) == [
+        ("ping", b"{}", None),
+        ("message", b"no-space", None),
+        ("message", b"x", "7"),
+    ]
+
+
+def test_events_without_data_are_not_dispatched_and_names_reset() -> None:
+    assert decode([b"event: ping\n\ndata: after\n\n"]) == [("message", b"after", None)]
+
+
+@pytest.mark.parametrize("tail", [b"data: [DONE]", b"data: [DONE]\n", b"data: [DONE]\r"])
+def test_flush_discards_unterminated_trailing_event(tail: bytes) -> None:
+    assert decode([b"data: 1\n\n" + tail]) == [("message", b"1", None)]
+
+
+@pytest.mark.asyncio
+async def test_iter_sse_events_reads_async_byte_stream() -> None:
+    async def chunks():
+        yield b"data: 1\n"
+        yield b"\ndata: 2\n\ndata: truncated"
+
+    assert [event.data async for event in iter_sse_events(chunks())] == [b"1", b"2"]
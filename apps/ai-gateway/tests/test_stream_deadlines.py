@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.metrics import metrics
+from app.providers.base import StreamChunk
+from app.providers.deadlines import (
+    ConnectDeadlineError,
+    FirstTokenDeadlineError,
+    IdleDeadlineError,
+    StreamDeadlines,
+    TotalDeadlineError,
+    guard_stream,
+)
+
+FAST = StreamDeadlines(connect=None, first_token=0.05, idle=0.05, total=None)
+
+
+class ScriptedStream:
+    """Opens provider streams that follow one script per attempt.
+
+    Each script is a list of ``"token"`` strings, ``"stall"`` (sleep far past any
+    deadline) or an exception to raise.
+    """
+
+    def __init__(self, *scripts: list[object]) -> None:
+        self.scripts = list(scripts)
+        self.opened = 0
+        self.closed = 0
+
+    def __call__(self):
+        script = self.scripts[self.opened]
+        self.opened += 1
+        return self._run(script)
+
+    async def _run(self, script: list[object]):
+        try:
+            for step in script:
+                if isinstance(step, Exception):
+                    raise step
+                if step == "stall":
+                    await asyncio.sleep(10)
+                else:
+                    yield StreamChunk(content=str(step), done=False)
+            yield StreamChunk(content="", done=True)
+        finally:
+            self.closed += 1
+
+
+async def collect(stream: ScriptedStream, deadlines: StreamDeadlines = FAST) -> list[str]:
+    guarded = guard_stream(stream, provider="fake", model="fake-model", deadlines=deadlines)
+    return [chunk.content async for chunk in guarded if not chunk.done]
+
+
+@pytest.mark.asyncio
+async def test_stall_before_first_token_is_retried_transparently() -> None:
+    stream = ScriptedStream(["stall"], ["a", "b"])
+
+    assert await collect(stream) == ["a", "b"]
+    assert stream.opened == 2
+    assert stream.closed == 2
+    assert metrics.counter("stream_retries_total", provider="fake", reason="first_token_timeout")
+
+
+@pytest.mark.asyncio
+async def test_first_token_deadline_is_raised_once_retries_run_out() -> None:
+    stream = ScriptedStream(["stall"], ["stall"])
+
+    with pytest.raises(FirstTokenDeadlineError) as excinfo:
+        await collect(stream)
+
+    assert excinfo.value.code == "first_token_timeout"
+    assert excinfo.value.status_code == 504
+    assert stream.closed == 2
+    assert (
+        metrics.counter(
+            "stream_deadline_exceeded_total", provider="fake", code="first_token_timeout"
+        )
+        == 2
+    )
+
+
+@pytest.mark.asyncio
+async def test_connect_timeout_from_provider_is_retried() -> None:
+    stream = ScriptedStream([ConnectDeadlineError("connect", "fake")], ["a"])
+
+    assert await collect(stream) == ["a"]
+    assert stream.opened == 2
+
+
+@pytest.mark.asyncio
+async def test_idle_stall_after_first_token_is_not_retried() -> None:
+    stream = ScriptedStream(["a", "stall"], ["never"])
+    received: list[str] = []
+
+    with pytest.raises(IdleDeadlineError):
+        async for chunk in guard_stream(
+            stream, provider="fake", model="fake-model", deadlines=FAST
+        ):
+            received.append(chunk.content)
+
+    assert received == ["a"]
+    assert stream.opened == 1
+    assert stream.closed == 1
+
+
+@pytest.mark.asyncio
+async def test_total_deadline_bounds_a_slowly_trickling_stream() -> None:
+    class Trickle(ScriptedStream):
+        async def _run(self, script):
+            while True:
+                await asyncio.sleep(0.01)
+                yield StreamChunk(content="a", done=False)
+
+    deadlines = StreamDeadlines(connect=None, first_token=1.0, idle=1.0, total=0.1)
+
+    with pytest.raises(TotalDeadlineError):
+        await collect(Trickle([]), deadlines)
+
+
+def test_deadlines_read_settings_and_disable_with_zero() -> None:
+    settings.stream_first_token_timeout_seconds = 0
+
+    deadlines = StreamDeadlines.from_settings()
+
+    assert deadlines.first_token is None
+    assert deadlines.idle == settings.stream_idle_timeout_seconds
+    assert deadlines.httpx_timeout().read is None
+
+
+@pytest.mark.asyncio
+async def test_time_spent_by_the_consumer_does_not_count_as_idle() -> None:
+    stream = ScriptedStream(["a", "b", "c"])
+    received: list[str] = []
+
+    async for chunk in guard_stream(stream, provider="fake", model="fake-model", deadlines=FAST):
+        received.append(chunk.content)
+        await asyncio.sleep(0.08)
+
+    assert received == ["a", "b", "c", ""]
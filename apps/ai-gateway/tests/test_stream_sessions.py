@@ -0,0 +1,316 @@
+import asyncio
+import json
+
+import pytest
+
+from app.config import settings
+from app.metrics import metrics
+from app.stream_sessions import (
+    HEARTBEAT_FRAME,
+    REPLAY_GAP_FRAME,
+    SLOW_CONSUMER_FRAME,
+    StreamSessionStore,
+    coalesce_token_frames,
+    encode_frame,
+    token_payload,
+)
+
+
+async def collect(session, after_seq: int = 0) -> list[bytes]:
+    return [frame async for frame in session.subscribe(after_seq)]
+
+
+@pytest.mark.asyncio
+async def test_subscribe_replays_buffered_frames_after_cursor() -> None:
+    store = StreamSessionStore()
+    session = store.create("owner")
+    session.publish(b'{"content":"a"}')
+    session.publish(b'{"content":"b"}')
+    session.finish()
+
+    frames = await collect(session, after_seq=1)
+
+    assert frames == [f'id: {session.stream_id}:2\ndata: {{"content":"b"}}\n\n'.encode()]
+
+
+@pytest.mark.asyncio
+async def test_subscribe_follows_live_frames() -> None:
+    store = StreamSessionStore()
+    session = store.create("owner")
+
+    async def produce() -> None:
+        for token in ("a", "b", "c"):
+            await asyncio.sleep(0)
+            session.publish(f'"{token}"'.encode())
+        session.finish()
+
+    session.start(produce())
+    frames = await collect(session)
+
+    assert [frame.decode().split("\n")[0] for frame in frames] == [
+        f"id: {session.stream_id}:1",
+        f"id: {session.stream_id}:2",
+        f"id: {session.stream_id}:3",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_per_stream_cap_evicts_oldest_frames_and_reports_gap() -> None:
+    settings.stream_replay_max_bytes_per_stream = 200
+    try:
+        store = StreamSessionStore()
+        session = store.create("owner")
+        for index in range(10):
+            session.publish(f'{{"content":"{index:020d}"}}'.encode())
+        session.finish()
+
+        assert session.buffered_bytes <= 200
+        assert store.total_bytes == session.buffered_bytes
+        assert session.first_buffered_seq > 1
+        assert store.resume(f"{session.stream_id}:0", "owner") is None
+        assert await collect(session) == [REPLAY_GAP_FRAME]
+    finally:
+        settings.stream_replay_max_bytes_per_stream = 256 * 1024
+
+
+@pytest.mark.asyncio
+async def test_global_cap_evicts_from_oldest_streams_first() -> None:
+    settings.stream_replay_max_total_bytes = 300
+    try:
+        store = StreamSessionStore()
+        older = store.create("owner")
+        newer = store.create("owner")
+        for _ in range(3):
+            older.publish(b'{"content":"older"}')
+        for _ in range(3):
+            newer.publish(b'{"content":"newer"}')
+
+        assert store.total_bytes <= 300
+        assert older.first_buffered_seq > 1
+        assert newer.first_buffered_seq == 1
+    finally:
+        settings.stream_replay_max_total_bytes = 64 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_resume_rejects_other_owners_and_expired_streams() -> None:
+    store = StreamSessionStore()
+    session = store.create("owner")
+    session.publish(b'{"content":"a"}')
+    session.finish()
+
+    assert store.resume(f"{session.stream_id}:1", "someone-else") is None
+    assert store.resume(f"{session.stream_id}:5", "owner") is None
+    assert store.resume("not-an-event-id", "owner") is None
+    assert store.resume(f"{session.stream_id}:0", "owner") == (session, 0)
+
+    session.expires_at = 0.0
+    store.sweep()
+
+    assert len(store) == 0
+    assert store.total_bytes == 0
+
+
+async def read_first_frame(session) -> bytes:
+    subscription = session.subscribe()
+    try:
+        return await anext(subscription)
+    finally:
+        await subscription.aclose()
+
+
+@pytest.mark.asyncio
+async def test_producer_is_cancelled_once_the_last_subscriber_leaves() -> None:
+    settings.stream_detach_cancel_seconds = 0.01
+    store = StreamSessionStore()
+    session = store.create("owner")
+    stopped = asyncio.Event()
+
+    async def produce() -> None:
+        try:
+            session.publish(b'{"content":"a"}')
+            await asyncio.Event().wait()
+        finally:
+            stopped.set()
+            session.finish()
+
+    session.start(produce())
+    await read_first_frame(session)
+
+    assert not stopped.is_set()
+    await asyncio.wait_for(stopped.wait(), timeout=1)
+    assert session.cancelled
+    assert session.task is not None and session.task.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_reconnect_within_detach_window_keeps_the_producer_running() -> None:
+    settings.stream_detach_cancel_seconds = 0.05
+    store = StreamSessionStore()
+    session = store.create("owner")
+    release = asyncio.Event()
+
+    async def produce() -> None:
+        session.publish(b'{"content":"a"}')
+        await release.wait()
+        session.publish(b'{"content":"b"}')
+        session.finish()
+
+    session.start(produce())
+    await read_first_frame(session)
+    resumed = asyncio.create_task(collect(session, after_seq=1))
+    await asyncio.sleep(0.1)
+    release.set()
+
+    assert len(await resumed) == 1
+    assert not session.cancelled
+
+
+def token_contents(frames: list[bytes]) -> list[str]:
+    contents = []
+    for frame in frames:
+        data = frame.decode().split("data: ", 1)[1]
+        contents.append(json.loads(data)["content"])
+    return contents
+
+
+def test_coalesced_frame_concatenates_escaped_tokens() -> None:
+    tokens = ['say "hi"', "\\n", " café ", "☃"]
+    frames = [encode_frame(token_payload(token), b"s:%d" % seq) for seq, token in enumerate(tokens)]
+
+    merged = coalesce_token_frames(frames, b"s:3")
+
+    assert merged.startswith(b"id: s:3\n")
+    assert token_contents([merged]) == ["".join(tokens)]
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_gets_pending_tokens_coalesced() -> None:
+    settings.stream_backpressure_policy = "coalesce"
+    settings.stream_max_lag_bytes = 500
+    store = StreamSessionStore()
+    session = store.create("owner")
+    session.publish(token_payload("t0 "))
+    subscription = session.subscribe()
+    await anext(subscription)
+
+    # The client stalls while the upstream keeps producing.
+    for index in range(1, 50):
+        session.publish(token_payload(f"t{index} "))
+    session.finish()
+    rest = [frame async for frame in subscription]
+
+    assert len(rest) < 49
+    assert "".join(token_contents(rest)) == "".join(f"t{index} " for index in range(1, 50))
+    assert rest[-1].startswith(f"id: {session.stream_id}:50\n".encode())
+    assert metrics.counter("stream_backpressure_total", policy="coalesce", action="coalesced")
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_is_aborted_under_abort_policy() -> None:
+    settings.stream_backpressure_policy = "abort"
+    settings.stream_max_lag_bytes = 500
+    store = StreamSessionStore()
+    session = store.create("owner")
+    session.publish(token_payload("t0"))
+    subscription = session.subscribe()
+    await anext(subscription)
+
+    for index in range(1, 50):
+        session.publish(token_payload(f"t{index}"))
+    session.finish()
+    rest = [frame async for frame in subscription]
+
+    assert rest == [SLOW_CONSUMER_FRAME]
+    assert session.subscribers == 0
+
+
+@pytest.mark.asyncio
+async def test_block_policy_paces_the_producer_to_the_subscriber() -> None:
+    settings.stream_backpressure_policy = "block"
+    settings.stream_max_lag_bytes = 500
+    store = StreamSessionStore()
+    session = store.create("owner")
+    peak_lag = 0
+
+    async def produce() -> None:
+        nonlocal peak_lag
+        for index in range(100):
+            await session.writable()
+            session.publish(token_payload(f"t{index}"))
+            peak_lag = max(peak_lag, session.lag())
+        session.finish()
+
+    subscription = session.subscribe()
+    session.start(produce())
+    frames = []
+    async for frame in subscription:
+        frames.append(frame)
+        await asyncio.sleep(0)
+
+    assert token_contents(frames) == [f"t{index}" for index in range(100)]
+    assert peak_lag <= 500 + len(frames[-1])
+
+
+@pytest.mark.asyncio
+async def test_block_policy_aborts_a_stuck_subscriber_after_the_block_timeout() -> None:
+    settings.stream_backpressure_policy = "block"
+    settings.stream_max_lag_bytes = 200
+    settings.stream_backpressure_block_seconds = 0.05
+    store = StreamSessionStore()
+    session = store.create("owner")
+    session.publish(token_payload("t0"))
+    subscription = session.subscribe()
+    await anext(subscription)
+
+    for index in range(1, 20):
+        await session.writable()
+        session.publish(token_payload(f"t{index}"))
+    session.finish()
+
+    assert [frame async for frame in subscription] == [SLOW_CONSUMER_FRAME]
+
+
+@pytest.mark.asyncio
+async def test_heartbeats_are_sent_only_while_the_producer_stalls() -> None:
+    settings.stream_heartbeat_seconds = 0.1
+    store = StreamSessionStore()
+    session = store.create("owner")
+
+    async def produce() -> None:
+        # A burst of tokens, a long "thinking" pause, then another burst.
+        for index in range(20):
+            session.publish(token_payload(f"a{index}"))
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.35)
+        for index in range(20):
+            session.publish(token_payload(f"b{index}"))
+            await asyncio.sleep(0.005)
+        session.finish()
+
+    loop = asyncio.get_running_loop()
+    session.start(produce())
+    received = [(loop.time(), frame) async for frame in session.subscribe()]
+
+    heartbeats = [at for at, frame in received if frame == HEARTBEAT_FRAME]
+    kinds = "".join("h" if frame == HEARTBEAT_FRAME else "d" for _, frame in received)
+    assert kinds == "d" * 20 + "h" * len(heartbeats) + "d" * 20
+    assert len(heartbeats) == 3
+    gaps = [later - earlier for earlier, later in zip(heartbeats, heartbeats[1:], strict=False)]
+    assert all(0.09 <= gap <= 0.2 for gap in gaps)
+
+
+@pytest.mark.asyncio
+async def test_heartbeats_can_be_disabled() -> None:
+    settings.stream_heartbeat_seconds = 0
+    store = StreamSessionStore()
+    session = store.create("owner")
+
+    async def produce() -> None:
+        await asyncio.sleep(0.05)
+        session.publish(token_payload("a"))
+        session.finish()
+
+    session.start(produce())
+
+    assert HEARTBEAT_FRAME not in await collect(session)
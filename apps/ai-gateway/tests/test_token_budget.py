@@ -0,0 +1,186 @@
+from pathlib import Path
+
+import pytest
+
+from app import token_budget as token_budget_module
+from app.config import settings
+from app.metrics import metrics
+from app.rate_limit import RateLimitBackend, RateLimitBackendError
+from app.rate_limit_redis import RedisRateLimitBackend
+from app.rate_limit_shm import SharedMemoryRateLimitBackend
+from app.token_budget import TokenBudgetExceeded, TokenBudgetLimiter, estimate_tokens
+from tests.test_rate_limit_backends import FakeRedis
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(token_budget_module.time, "time", fake)
+    return fake
+
+
+def test_estimate_tokens_uses_characters_per_token() -> None:
+    assert estimate_tokens(None) == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("abcde") == 2
+
+
+@pytest.mark.asyncio
+async def test_minute_budget_rejects_until_tokens_refill(clock: FakeClock) -> None:
+    settings.token_budget_per_minute = 1_000
+    budget = TokenBudgetLimiter()
+    await budget.reserve("svc:tenant-a", "tenant-a", 600)
+    await budget.reserve("svc:tenant-a", "tenant-a", 400)
+
+    with pytest.raises(TokenBudgetExceeded) as excinfo:
+        await budget.reserve("svc:tenant-a", "tenant-a", 300)
+
+    assert excinfo.value.scope == "minute"
+    assert excinfo.value.retry_after == 18
+    assert excinfo.value.headers["X-RateLimit-Remaining-Tokens"] == "0"
+    clock.now += 18
+    await budget.reserve("svc:tenant-a", "tenant-a", 300)
+    await budget.reserve("svc:tenant-b", "tenant-b", 1_000)
+
+
+@pytest.mark.asyncio
+async def test_settling_refunds_unused_reservation(clock: FakeClock) -> None:
+    settings.token_budget_per_minute = 1_000
+    budget = TokenBudgetLimiter()
+
+    reservation = await budget.reserve("svc:tenant-a", "tenant-a", 900)
+    assert reservation.headers()["X-RateLimit-Remaining-Tokens"] == "100"
+    await reservation.settle(150)
+    await reservation.release()
+
+    assert reservation.headers()["X-RateLimit-Remaining-Tokens"] == "850"
+    await budget.reserve("svc:tenant-a", "tenant-a", 800)
+
+
+@pytest.mark.asyncio
+async def test_oversized_request_runs_on_full_bucket_and_goes_into_debt(clock: FakeClock) -> None:
+    settings.token_budget_per_minute = 1_000
+    budget = TokenBudgetLimiter()
+
+    await budget.reserve("svc:tenant-a", "tenant-a", 1_500)
+
+    with pytest.raises(TokenBudgetExceeded) as excinfo:
+        await budget.reserve("svc:tenant-a", "tenant-a", 1)
+    assert excinfo.value.retry_after == 31
+
+
+@pytest.mark.asyncio
+async def test_daily_budget_and_tenant_overrides(clock: FakeClock) -> None:
+    settings.token_budget_per_day = 10_000
+    settings.token_budget_tenant_per_day = {"district-9": 500}
+    budget = TokenBudgetLimiter()
+
+    reservation = await budget.reserve("svc:district-9", "district-9", 400)
+    assert reservation.headers()["X-Token-Budget-Remaining-Day"] == "100"
+    with pytest.raises(TokenBudgetExceeded) as excinfo:
+        await budget.reserve("svc:district-9", "district-9", 200)
+    await reservation.settle(250)
+    await budget.reserve("svc:district-9", "district-9", 200)
+
+    assert excinfo.value.scope == "day"
+    assert excinfo.value.headers["X-Token-Budget-Limit-Day"] == "500"
+    assert 1 <= excinfo.value.retry_after <= 86_400
+    # The rejected request did not keep its minute tokens.
+    assert excinfo.value.headers["X-RateLimit-Remaining-Tokens"] == "199600"
+
+
+@pytest.mark.asyncio
+async def test_sweep_drops_refilled_tenants_and_disabled_budget_is_inert(clock: FakeClock) -> None:
+    budget = TokenBudgetLimiter()
+    await budget.reserve("svc:tenant-a", "tenant-a", 100)
+    clock.now += 60
+
+    assert budget.sweep() == 1
+    assert budget.snapshot() == {"backend": "memory", "tenant_keys": 0}
+
+    settings.token_budget_enabled = False
+    reservation = await budget.reserve("svc:tenant-a", "tenant-a", 10**9)
+    await reservation.settle(10)
+    assert reservation.headers() == {}
+    assert budget.snapshot() == {"backend": "memory", "tenant_keys": 0}
+
+
+@pytest.fixture(params=["shared_memory", "redis"])
+def shared_backends(request: pytest.FixtureRequest, tmp_path: Path) -> list[RateLimitBackend]:
+    """Two workers' connections to one shared store."""
+    if request.param == "redis":
+        client = FakeRedis()
+        return [RedisRateLimitBackend(client), RedisRateLimitBackend(client)]
+    path = str(tmp_path / "rate-limit")
+    return [
+        SharedMemoryRateLimitBackend(path, slots=1024),
+        SharedMemoryRateLimitBackend(path, slots=1024),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_shared_backend_enforces_budgets_across_workers_and_restarts(
+    clock: FakeClock, shared_backends: list[RateLimitBackend]
+) -> None:
+    settings.token_budget_per_minute = 1_000
+    settings.token_budget_per_day = 1_500
+    first, second = TokenBudgetLimiter(), TokenBudgetLimiter()
+    first.configure(shared_backends[0])
+    second.configure(shared_backends[1])
+
+    reservation = await first.reserve("svc:tenant-a", "tenant-a", 900)
+    with pytest.raises(TokenBudgetExceeded) as minute:
+        await second.reserve("svc:tenant-a", "tenant-a", 300)
+    await reservation.settle(600)
+    refunded = await second.reserve("svc:tenant-a", "tenant-a", 300)
+
+    # A restarted worker still sees the day's usage: 600 + 300 of 1,500.
+    clock.now += 60
+    restarted = TokenBudgetLimiter()
+    restarted.configure(shared_backends[1])
+    with pytest.raises(TokenBudgetExceeded) as day:
+        await restarted.reserve("svc:tenant-a", "tenant-a", 700)
+    for backend in shared_backends:
+        await backend.close()
+
+    assert minute.value.scope == "minute"
+    assert refunded.headers()["X-Token-Budget-Remaining-Day"] == "600"
+    assert day.value.scope == "day"
+    assert day.value.headers["X-Token-Budget-Remaining-Day"] == "600"
+
+
+class UnreachableBackend(RateLimitBackend):
+    name = "unreachable"
+
+    async def check(self, key: str, limit: int, period_seconds: int) -> tuple[bool, int]:
+        raise RateLimitBackendError("Connection refused")
+
+    async def charge(self, *args: object, **kwargs: object) -> tuple[bool, int, float]:
+        raise RateLimitBackendError("Connection refused")
+
+
+@pytest.mark.asyncio
+async def test_budget_falls_back_to_a_worker_share_when_backend_fails(clock: FakeClock) -> None:
+    settings.token_budget_per_minute = 1_000
+    settings.rate_limit_fallback_workers = 4
+    budget = TokenBudgetLimiter()
+    budget.configure(UnreachableBackend())
+    try:
+        reservation = await budget.reserve("svc:tenant-a", "tenant-a", 200)
+        with pytest.raises(TokenBudgetExceeded):
+            await budget.reserve("svc:tenant-a", "tenant-a", 100)
+        headers = reservation.headers()
+    finally:
+        settings.rate_limit_fallback_workers = 1
+
+    assert headers["X-RateLimit-Limit-Tokens"] == "250"
+    assert metrics.counter("token_budget_backend_fallback_total", backend="unreachable") == 1
+    assert budget.snapshot()["fallback_active"] is True
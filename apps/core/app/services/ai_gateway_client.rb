@@ -42,6 +42,8 @@ class AiGatewayClient
     response = conn.post("/v1/generate") do |req|
       req.headers["Content-Type"] = "application/json"
       req.headers["Accept"] = "application/json"
+      # Lets the gateway drop the request once we have stopped waiting for it.
+      req.headers["X-Request-Timeout-Ms"] = (REQUEST_TIMEOUT_SECONDS * 1000).to_s
       apply_service_auth_headers!(
         request: req,
         method: "POST",
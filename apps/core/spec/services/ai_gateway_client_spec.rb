@@ -72,6 +72,16 @@ RSpec.describe AiGatewayClient do
       expect(request.headers["Authorization"]).to eq("Bearer service-token")
     end
 
+    it "sends the client timeout as the request deadline" do
+      request = build_request
+      response = instance_double(Faraday::Response, success?: true, status: 200, body: { "content" => "ok" })
+      allow(conn).to receive(:post).with("/v1/generate").and_yield(request).and_return(response)
+
+      described_class.generate(provider: "openai", model: "gpt-4o-mini", messages: messages)
+
+      expect(request.headers["X-Request-Timeout-Ms"]).to eq("120000")
+    end
+
     it "omits nil fields from the payload" do
       request = build_request
       response = instance_double(Faraday::Response, success?: true, status: 200, body: { "content" => "ok" })